@@ -2,6 +2,7 @@ from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.utils import timezone
 
+from dcim.models import CablePath
 from .models import Circuit, CircuitTermination
 
 
@@ -15,3 +16,13 @@ def update_circuit(instance, **kwargs):
     for circuit in circuits:
         circuit.last_updated = time
         circuit.save()
+
+
+@receiver((post_save, post_delete), sender=CircuitTermination)
+def update_cable_paths(instance, **kwargs):
+    """
+    When a CircuitTermination has been modified, update the stored cable paths which pass through or end at either end
+    of its Circuit.
+    """
+    peer_terminations = CircuitTermination.objects.filter(circuit_id=instance.circuit_id).exclude(pk=instance.pk)
+    CablePath.rebuild([instance, *peer_terminations])
@@ -29,6 +29,10 @@ class ConnectedEndpointSerializer(ValidatedModelSerializer):
     connected_endpoint_type = serializers.SerializerMethodField(read_only=True)
     connected_endpoint = serializers.SerializerMethodField(read_only=True)
     connection_status = ChoiceField(choices=CONNECTION_STATUS_CHOICES, read_only=True)
+    field_sources = {
+        'connected_endpoint_type': ['connected_endpoint'],
+        'connected_endpoint': ['connected_endpoint'],
+    }
 
     def get_connected_endpoint_type(self, obj):
         if hasattr(obj, 'connected_endpoint') and obj.connected_endpoint is not None:
@@ -122,6 +126,11 @@ class RackSerializer(TaggitSerializer, CustomFieldModelSerializer):
     tags = TagListSerializerField(required=False)
     device_count = serializers.IntegerField(read_only=True)
     powerfeed_count = serializers.IntegerField(read_only=True)
+    utilization = serializers.IntegerField(source='get_utilization', read_only=True)
+    power_utilization = serializers.IntegerField(source='get_power_utilization', read_only=True)
+    field_sources = {
+        'display_name': ['name', 'facility_id'],
+    }
 
     class Meta:
         model = Rack
@@ -129,6 +138,7 @@ class RackSerializer(TaggitSerializer, CustomFieldModelSerializer):
             'id', 'name', 'facility_id', 'display_name', 'site', 'group', 'tenant', 'status', 'role', 'serial',
             'asset_tag', 'type', 'width', 'u_height', 'desc_units', 'outer_width', 'outer_depth', 'outer_unit',
             'comments', 'tags', 'custom_fields', 'created', 'last_updated', 'device_count', 'powerfeed_count',
+            'utilization', 'power_utilization',
         ]
         # Omit the UniqueTogetherValidator that would be automatically added to validate (group, facility_id). This
         # prevents facility_id from being interpreted as a required field.
@@ -318,6 +328,11 @@ class DeviceSerializer(TaggitSerializer, CustomFieldModelSerializer):
     cluster = NestedClusterSerializer(required=False, allow_null=True)
     virtual_chassis = NestedVirtualChassisSerializer(required=False, allow_null=True)
     tags = TagListSerializerField(required=False)
+    field_sources = {
+        'display_name': ['name', 'virtual_chassis', 'vc_position', 'device_type'],
+        'parent_device': ['parent_bay'],
+        'primary_ip': ['primary_ip4', 'primary_ip6'],
+    }
 
     class Meta:
         model = Device
@@ -425,6 +440,10 @@ class PowerPortSerializer(TaggitSerializer, ConnectedEndpointSerializer):
     device = NestedDeviceSerializer()
     cable = NestedCableSerializer(read_only=True)
     tags = TagListSerializerField(required=False)
+    field_sources = {
+        'connected_endpoint_type': ['_connected_poweroutlet', '_connected_powerfeed'],
+        'connected_endpoint': ['_connected_poweroutlet', '_connected_powerfeed'],
+    }
 
     class Meta:
         model = PowerPort
@@ -450,6 +469,12 @@ class InterfaceSerializer(TaggitSerializer, ConnectedEndpointSerializer):
     )
     cable = NestedCableSerializer(read_only=True)
     tags = TagListSerializerField(required=False)
+    field_sources = {
+        'connected_endpoint_type': ['_connected_interface', '_connected_circuittermination'],
+        'connected_endpoint': ['_connected_interface', '_connected_circuittermination'],
+        'count_ipaddresses': ['ip_addresses'],
+        'form_factor': ['type'],
+    }
 
     class Meta:
         model = Interface
@@ -558,6 +583,10 @@ class CableSerializer(ValidatedModelSerializer):
     termination_b = serializers.SerializerMethodField(read_only=True)
     status = ChoiceField(choices=CONNECTION_STATUS_CHOICES, required=False)
     length_unit = ChoiceField(choices=CABLE_LENGTH_UNIT_CHOICES, required=False, allow_null=True)
+    field_sources = {
+        'termination_a': ['termination_a'],
+        'termination_b': ['termination_b'],
+    }
 
     class Meta:
         model = Cable
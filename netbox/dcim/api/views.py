@@ -168,7 +168,7 @@ class RackViewSet(CustomFieldModelViewSet):
     ).annotate(
         device_count=get_subquery(Device, 'rack'),
         powerfeed_count=get_subquery(PowerFeed, 'rack')
-    )
+    ).annotate_utilization()
     serializer_class = serializers.RackSerializer
     filterset_class = filters.RackFilter
 
@@ -545,9 +545,7 @@ class InterfaceConnectionViewSet(ListModelMixin, GenericViewSet):
 #
 
 class CableViewSet(ModelViewSet):
-    queryset = Cable.objects.prefetch_related(
-        'termination_a', 'termination_b'
-    )
+    queryset = Cable.objects.all()
     serializer_class = serializers.CableSerializer
     filterset_class = filters.CableFilter
 
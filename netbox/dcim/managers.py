@@ -14,6 +14,77 @@ CHANNEL_RE = r"COALESCE(CAST(SUBSTRING({} FROM '^.*:(\d{{1,9}})(\.\d{{1,9}})?$')
 VC_RE = r"COALESCE(CAST(SUBSTRING({} FROM '^.*\.(\d{{1,9}})$') AS integer), 0)"
 
 
+# The units within a Rack occupied by Devices
+RACK_OCCUPIED_UNITS_SQL = """
+SELECT GENERATE_SERIES(d.position, d.position + dt.u_height - 1) AS u
+FROM dcim_device d INNER JOIN dcim_devicetype dt ON dt.id = d.device_type_id
+WHERE d.rack_id = dcim_rack.id AND d.position >= 1
+"""
+
+# The units within a Rack reserved by RackReservations
+RACK_RESERVED_UNITS_SQL = """
+SELECT UNNEST(r.units) AS u FROM dcim_rackreservation r WHERE r.rack_id = dcim_rack.id
+"""
+
+# The number of distinct units within a Rack among the given units (e.g. a unit occupied by half-depth Devices on both
+# faces, or reserved more than once, is counted once)
+RACK_UNIT_COUNT_SQL = """
+SELECT COUNT(DISTINCT units.u) FROM ({units}) units WHERE units.u BETWEEN 1 AND dcim_rack.u_height
+"""
+
+# Mirrors Rack.get_utilization(): the percentage of units which are occupied and/or reserved
+RACK_UTILIZATION_SQL = """
+CAST(FLOOR(({count}) * 100.0 / dcim_rack.u_height) AS integer)
+""".format(
+    count=RACK_UNIT_COUNT_SQL.format(units='{} UNION {}'.format(RACK_OCCUPIED_UNITS_SQL, RACK_RESERVED_UNITS_SQL))
+)
+
+# The total allocated draw of all PowerPorts connected to PowerOutlets fed by a PowerFeed within the Rack
+RACK_ALLOCATED_POWER_SQL = """
+SELECT COALESCE(SUM(pp.allocated_draw), 0) FROM dcim_powerfeed pf
+INNER JOIN dcim_poweroutlet po ON po.power_port_id = pf.connected_endpoint_id
+INNER JOIN dcim_powerport pp ON pp._connected_poweroutlet_id = po.id
+WHERE pf.rack_id = dcim_rack.id
+"""
+
+# The total available power of all PowerFeeds within the Rack
+RACK_AVAILABLE_POWER_SQL = """
+SELECT COALESCE(SUM(pf.available_power), 0) FROM dcim_powerfeed pf WHERE pf.rack_id = dcim_rack.id
+"""
+
+# Mirrors Rack.get_power_utilization()
+RACK_POWER_UTILIZATION_SQL = """
+COALESCE(CAST(FLOOR(({allocated}) * 100.0 / NULLIF(({available}), 0)) AS integer), 0)
+""".format(
+    allocated=RACK_ALLOCATED_POWER_SQL,
+    available=RACK_AVAILABLE_POWER_SQL
+)
+
+
+class RackQuerySet(QuerySet):
+
+    def annotate_utilization(self):
+        """
+        Annotate the space and power statistics of each Rack in a single query, rather than evaluating
+        get_utilization() and get_power_utilization() for each Rack individually:
+
+            occupied_unit_count: The number of units occupied by Devices
+            reserved_unit_count: The number of units reserved by RackReservations
+            utilization: The percentage of units which are occupied and/or reserved
+            allocated_power: The total allocated draw of all PowerPorts fed by the Rack's PowerFeeds
+            available_power: The total available power of the Rack's PowerFeeds
+            power_utilization: The percentage of available power which has been allocated
+        """
+        return self.annotate(
+            occupied_unit_count=RawSQL(RACK_UNIT_COUNT_SQL.format(units=RACK_OCCUPIED_UNITS_SQL), []),
+            reserved_unit_count=RawSQL(RACK_UNIT_COUNT_SQL.format(units=RACK_RESERVED_UNITS_SQL), []),
+            utilization=RawSQL(RACK_UTILIZATION_SQL, []),
+            allocated_power=RawSQL(RACK_ALLOCATED_POWER_SQL, []),
+            available_power=RawSQL(RACK_AVAILABLE_POWER_SQL, []),
+            power_utilization=RawSQL(RACK_POWER_UTILIZATION_SQL, [])
+        )
+
+
 class InterfaceQuerySet(QuerySet):
 
     def connectable(self):
@@ -0,0 +1,37 @@
+import django.contrib.postgres.fields
+import django.contrib.postgres.fields.jsonb
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('dcim', '0075_cable_devices'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CablePath',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False)),
+                ('origin_id', models.PositiveIntegerField()),
+                ('destination_id', models.PositiveIntegerField(blank=True, null=True)),
+                ('segments', django.contrib.postgres.fields.jsonb.JSONField()),
+                ('nodes', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=30), size=None)),
+                ('is_connected', models.BooleanField()),
+                ('destination_type', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='contenttypes.ContentType')),
+                ('origin_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='contenttypes.ContentType')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='cablepath',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['nodes'], name='dcim_cablep_nodes_933aa6_gin'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='cablepath',
+            unique_together={('origin_type', 'origin_id')},
+        ),
+    ]
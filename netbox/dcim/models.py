@@ -1,4 +1,4 @@
-from collections import OrderedDict
+from collections import defaultdict
 from itertools import count, groupby
 
 from django.conf import settings
@@ -6,6 +6,7 @@ from django.contrib.auth.models import User
 from django.contrib.contenttypes.fields import GenericForeignKey, GenericRelation
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.postgres.fields import ArrayField, JSONField
+from django.contrib.postgres.indexes import GinIndex
 from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
@@ -23,7 +24,7 @@ from utilities.utils import serialize_object, to_meters
 from .constants import *
 from .exceptions import LoopDetected
 from .fields import ASNField, MACAddressField
-from .managers import InterfaceManager
+from .managers import InterfaceManager, RackQuerySet
 
 
 class ComponentTemplateModel(models.Model):
@@ -97,11 +98,16 @@ class CableTermination(models.Model):
         content_type_field='termination_b_type',
         object_id_field='termination_b_id'
     )
+    _path = GenericRelation(
+        to='dcim.CablePath',
+        content_type_field='origin_type',
+        object_id_field='origin_id'
+    )
 
     class Meta:
         abstract = True
 
-    def trace(self, position=1, follow_circuits=False, cable_history=None):
+    def trace(self, follow_circuits=False):
         """
         Return a list representing a complete cable path, with each individual segment represented as a three-tuple:
             [
@@ -109,6 +115,17 @@ class CableTermination(models.Model):
                 (termination C, cable, termination D),
                 (termination E, cable, termination F)
             ]
+        The path is read from the stored CablePath for this termination.
+        """
+        cable_path = self.get_cable_path()
+        if cable_path is None:
+            return [(self, None, None)]
+        return cable_path.get_segments(follow_circuits, origin=self)
+
+    def _trace(self, position=1, follow_circuits=False, cable_history=None):
+        """
+        Trace the cable path from this termination one cable at a time. This is used to (re)build the stored CablePath;
+        see trace().
         """
         def get_peer_port(termination, position=1, follow_circuits=False):
             from circuits.models import CircuitTermination
@@ -119,10 +136,10 @@ class CableTermination(models.Model):
 
             # Map a rear port/position to its corresponding front port
             elif isinstance(termination, RearPort):
+                # The path ends at the RearPort if the position does not exist (e.g. a cable joins RearPorts with differing
+                # numbers of positions). Paths are traced when cables and ports are saved, so this must not raise.
                 if position not in range(1, termination.positions + 1):
-                    raise Exception("Invalid position for {} ({} positions): {})".format(
-                        termination, termination.positions, position
-                    ))
+                    return None, None
                 try:
                     peer_port = FrontPort.objects.get(
                         rear_port=termination,
@@ -153,7 +170,12 @@ class CableTermination(models.Model):
             raise LoopDetected()
         cable_history.append(self.cable)
 
-        far_end = self.cable.termination_b if self.cable.termination_a == self else self.cable.termination_a
+        # Compare IDs rather than retrieving termination A
+        is_termination_a = (
+            self.cable.termination_a_type_id == ContentType.objects.get_for_model(self).pk and
+            self.cable.termination_a_id == self.pk
+        )
+        far_end = self.cable.termination_b if is_termination_a else self.cable.termination_a
         path = [(self, self.cable, far_end)]
 
         peer_port, position = get_peer_port(far_end, position, follow_circuits)
@@ -161,7 +183,7 @@ class CableTermination(models.Model):
             return path
 
         try:
-            next_segment = peer_port.trace(position, follow_circuits, cable_history)
+            next_segment = peer_port._trace(position, follow_circuits, cable_history)
         except LoopDetected:
             return path
 
@@ -170,6 +192,71 @@ class CableTermination(models.Model):
 
         return path + next_segment
 
+    def get_cable_path(self):
+        """
+        Return the stored CablePath originating from this termination, tracing and storing it first if it does not yet
+        exist. Returns None if the termination is not connected to a Cable.
+        """
+        if self.cable_id is None:
+            return None
+        cable_path = self._path.first()
+        if cable_path is None:
+            cable_path = self.update_cable_path()
+        return cable_path
+
+    def trace_cable_path(self):
+        """
+        Trace the complete path (following circuits) from this termination and return it as an unsaved CablePath, or
+        None if the termination is not connected to a Cable.
+        """
+        if self.cable_id is None:
+            return None
+
+        path = self._trace(follow_circuits=True)
+        segments = []
+        nodes = set()
+        for near_end, cable, far_end in path:
+            near_type = ContentType.objects.get_for_model(near_end)
+            far_type = ContentType.objects.get_for_model(far_end) if far_end is not None else None
+            segments.append([
+                near_type.pk,
+                near_end.pk,
+                cable.pk if cable is not None else None,
+                far_type.pk if far_type is not None else None,
+                far_end.pk if far_end is not None else None,
+            ])
+            nodes.add(CablePath.get_node(near_end))
+            if far_end is not None:
+                nodes.add(CablePath.get_node(far_end))
+
+        # The destination and status reflect the path up to (but not through) any circuit
+        path = path[:CablePath.get_circuit_boundary(segments)]
+        destination = path[-1][2]
+        is_connected = all(
+            cable is not None and cable.status == CONNECTION_STATUS_CONNECTED for _, cable, _ in path[1:]
+        )
+
+        return CablePath(
+            origin_type=ContentType.objects.get_for_model(self),
+            origin_id=self.pk,
+            destination_type=ContentType.objects.get_for_model(destination) if destination else None,
+            destination_id=destination.pk if destination else None,
+            segments=segments,
+            nodes=sorted(nodes),
+            is_connected=is_connected
+        )
+
+    def update_cable_path(self):
+        """
+        Retrace and store the CablePath originating from this termination. Any stored path is deleted if the
+        termination is not connected to a Cable.
+        """
+        self._path.all().delete()
+        cable_path = self.trace_cable_path()
+        if cable_path is not None:
+            cable_path.save()
+        return cable_path
+
     def get_cable_peer(self):
         if self.cable is None:
             return None
@@ -543,7 +630,7 @@ class Rack(ChangeLoggedModel, CustomFieldModel):
         to='extras.ImageAttachment'
     )
 
-    objects = NaturalOrderingManager()
+    objects = NaturalOrderingManager.from_queryset(RackQuerySet)()
     tags = TaggableManager(through=TaggedItem)
 
     csv_headers = [
@@ -645,6 +732,16 @@ class Rack(ChangeLoggedModel, CustomFieldModel):
     def get_status_class(self):
         return STATUS_CLASSES[self.status]
 
+    def get_occupancy(self, exclude=None):
+        """
+        Return a RackOccupancy describing the occupied and reserved units within the rack.
+
+        :param exclude: List of Device PKs to exclude (optional)
+        """
+        from .utils import RackOccupancy
+
+        return RackOccupancy.for_racks([self], exclude=exclude).get(self.pk) or RackOccupancy(self)
+
     def get_rack_units(self, face=RACK_FACE_FRONT, exclude=None, remove_redundant=False):
         """
         Return a list of rack units as dictionaries. Example: {'device': None, 'face': 0, 'id': 48, 'name': 'U48'}
@@ -654,27 +751,8 @@ class Rack(ChangeLoggedModel, CustomFieldModel):
         :param exclude: PK of a Device to exclude (optional); helpful when relocating a Device within a Rack
         :param remove_redundant: If True, rack units occupied by a device already listed will be omitted
         """
-
-        elevation = OrderedDict()
-        for u in self.units:
-            elevation[u] = {'id': u, 'name': 'U{}'.format(u), 'face': face, 'device': None}
-
-        # Add devices to rack units list
-        if self.pk:
-            for device in Device.objects.prefetch_related('device_type__manufacturer', 'device_role')\
-                    .annotate(devicebay_count=Count('device_bays'))\
-                    .exclude(pk=exclude)\
-                    .filter(rack=self, position__gt=0)\
-                    .filter(Q(face=face) | Q(device_type__is_full_depth=True)):
-                if remove_redundant:
-                    elevation[device.position]['device'] = device
-                    for u in range(device.position + 1, device.position + device.device_type.u_height):
-                        elevation.pop(u, None)
-                else:
-                    for u in range(device.position, device.position + device.device_type.u_height):
-                        elevation[u]['device'] = device
-
-        return [u for u in elevation.values()]
+        occupancy = self.get_occupancy(exclude=[exclude] if exclude is not None else None)
+        return occupancy.get_elevation(face, remove_redundant=remove_redundant)
 
     def get_front_elevation(self):
         return self.get_rack_units(face=RACK_FACE_FRONT, remove_redundant=True)
@@ -692,30 +770,7 @@ class Rack(ChangeLoggedModel, CustomFieldModel):
         :param rack_face: The face of the rack (front or rear) required; 'None' if device is full depth
         :param exclude: List of devices IDs to exclude (useful when moving a device within a rack)
         """
-
-        # Gather all devices which consume U space within the rack
-        devices = self.devices.prefetch_related('device_type').filter(position__gte=1).exclude(pk__in=exclude)
-
-        # Initialize the rack unit skeleton
-        units = list(range(1, self.u_height + 1))
-
-        # Remove units consumed by installed devices
-        for d in devices:
-            if rack_face is None or d.face == rack_face or d.device_type.is_full_depth:
-                for u in range(d.position, d.position + d.device_type.u_height):
-                    try:
-                        units.remove(u)
-                    except ValueError:
-                        # Found overlapping devices in the rack!
-                        pass
-
-        # Remove units without enough space above them to accommodate a device of the specified height
-        available_units = []
-        for u in units:
-            if set(range(u, u + u_height)).issubset(units):
-                available_units.append(u)
-
-        return list(reversed(available_units))
+        return self.get_occupancy(exclude=exclude).get_available_units(u_height, rack_face)
 
     def get_reserved_units(self):
         """
@@ -733,39 +788,23 @@ class Rack(ChangeLoggedModel, CustomFieldModel):
     def get_utilization(self):
         """
         Determine the utilization rate of the rack and return it as a percentage. Occupied and reserved units both count
-        as utilized.
+        as utilized. If the Rack was retrieved using RackQuerySet.annotate_utilization(), the annotated value is
+        returned.
         """
-        # Determine unoccupied units
-        available_units = self.get_available_units()
-
-        # Remove reserved units
-        for u in self.get_reserved_units():
-            if u in available_units:
-                available_units.remove(u)
-
-        occupied_unit_count = self.u_height - len(available_units)
-        percentage = int(float(occupied_unit_count) / self.u_height * 100)
-
-        return percentage
+        if getattr(self, 'utilization', None) is not None:
+            return self.utilization
+        return self.get_occupancy().get_utilization()
 
     def get_power_utilization(self):
         """
-        Determine the utilization rate of power in the rack and return it as a percentage.
+        Determine the utilization rate of power in the rack and return it as a percentage. If the Rack was retrieved
+        using RackQuerySet.annotate_utilization(), the annotated value is returned.
         """
-        power_stats = PowerFeed.objects.filter(
-            rack=self
-        ).annotate(
-            allocated_draw_total=Sum('connected_endpoint__poweroutlets__connected_endpoint__allocated_draw'),
-        ).values(
-            'allocated_draw_total',
-            'available_power'
-        )
-
-        if power_stats:
-            allocated_draw_total = sum(x['allocated_draw_total'] for x in power_stats)
-            available_power_total = sum(x['available_power'] for x in power_stats)
-            return int(allocated_draw_total / available_power_total * 100) or 0
-        return 0
+        if getattr(self, 'power_utilization', None) is not None:
+            return self.power_utilization
+        return Rack.objects.filter(pk=self.pk).annotate_utilization().values_list(
+            'power_utilization', flat=True
+        ).first() or 0
 
 
 class RackReservation(ChangeLoggedModel):
@@ -1146,8 +1185,13 @@ class PowerOutletTemplate(ComponentTemplateModel):
                 "Parent power port ({}) must belong to the same device type".format(self.power_port)
             )
 
-    def instantiate(self, device):
-        if self.power_port:
+    def instantiate(self, device, power_ports=None):
+        """
+        Optionally provide a dictionary mapping (device ID, name) to PowerPorts which have already been retrieved.
+        """
+        if self.power_port and power_ports is not None:
+            power_port = power_ports.get((device.pk, self.power_port.name))
+        elif self.power_port:
             power_port = PowerPort.objects.get(device=device, name=self.power_port.name)
         else:
             power_port = None
@@ -1267,8 +1311,13 @@ class FrontPortTemplate(ComponentTemplateModel):
                 )
             )
 
-    def instantiate(self, device):
-        if self.rear_port:
+    def instantiate(self, device, rear_ports=None):
+        """
+        Optionally provide a dictionary mapping (device ID, name) to RearPorts which have already been retrieved.
+        """
+        if self.rear_port and rear_ports is not None:
+            rear_port = rear_ports.get((device.pk, self.rear_port.name))
+        elif self.rear_port:
             rear_port = RearPort.objects.get(device=device, name=self.rear_port.name)
         else:
             rear_port = None
@@ -1721,30 +1770,7 @@ class Device(ChangeLoggedModel, ConfigContextModel, CustomFieldModel):
 
         # If this is a new Device, instantiate all of the related components per the DeviceType definition
         if is_new:
-            ConsolePort.objects.bulk_create(
-                [x.instantiate(self) for x in self.device_type.consoleport_templates.all()]
-            )
-            ConsoleServerPort.objects.bulk_create(
-                [x.instantiate(self) for x in self.device_type.consoleserverport_templates.all()]
-            )
-            PowerPort.objects.bulk_create(
-                [x.instantiate(self) for x in self.device_type.powerport_templates.all()]
-            )
-            PowerOutlet.objects.bulk_create(
-                [x.instantiate(self) for x in self.device_type.poweroutlet_templates.all()]
-            )
-            Interface.objects.bulk_create(
-                [x.instantiate(self) for x in self.device_type.interface_templates.all()]
-            )
-            RearPort.objects.bulk_create(
-                [x.instantiate(self) for x in self.device_type.rearport_templates.all()]
-            )
-            FrontPort.objects.bulk_create(
-                [x.instantiate(self) for x in self.device_type.frontport_templates.all()]
-            )
-            DeviceBay.objects.bulk_create(
-                [x.instantiate(self) for x in self.device_type.device_bay_templates.all()]
-            )
+            Device.instantiate_components([self])
 
         # Update Site and Rack assignment for any child Devices
         devices = Device.objects.filter(parent_bay__device=self)
@@ -1753,6 +1779,41 @@ class Device(ChangeLoggedModel, ConfigContextModel, CustomFieldModel):
             device.rack = self.rack
             device.save()
 
+    @classmethod
+    def instantiate_components(cls, devices):
+        """
+        Instantiate all of the related components of the given new Devices per their DeviceType definitions. This
+        requires one query per type of component, regardless of the number of Devices.
+        """
+        device_types = {device.device_type_id for device in devices}
+
+        def create_components(template_model, component_model, related=None, **kwargs):
+            templates = defaultdict(list)
+            queryset = template_model.objects.filter(device_type__in=device_types)
+            if related:
+                queryset = queryset.select_related(related)
+            for template in queryset:
+                templates[template.device_type_id].append(template)
+            return component_model.objects.bulk_create([
+                template.instantiate(device, **kwargs) for device in devices
+                for template in templates[device.device_type_id]
+            ])
+
+        create_components(ConsolePortTemplate, ConsolePort)
+        create_components(ConsoleServerPortTemplate, ConsoleServerPort)
+        power_ports = create_components(PowerPortTemplate, PowerPort)
+        create_components(
+            PowerOutletTemplate, PowerOutlet, related='power_port',
+            power_ports={(port.device_id, port.name): port for port in power_ports}
+        )
+        create_components(InterfaceTemplate, Interface)
+        rear_ports = create_components(RearPortTemplate, RearPort)
+        create_components(
+            FrontPortTemplate, FrontPort, related='rear_port',
+            rear_ports={(port.device_id, port.name): port for port in rear_ports}
+        )
+        create_components(DeviceBayTemplate, DeviceBay)
+
     def to_csv(self):
         return (
             self.name or '',
@@ -2333,6 +2394,16 @@ class Interface(CableTermination, ComponentModel):
 
         return super().save(*args, **kwargs)
 
+    @classmethod
+    def update_vlan_assignments(cls, interfaces):
+        """
+        Enforce the VLAN assignment rules applied by save() for a queryset of Interfaces which have been updated in bulk.
+        """
+        interfaces.filter(mode__isnull=True).exclude(untagged_vlan__isnull=True).update(untagged_vlan=None)
+        cls.tagged_vlans.through.objects.filter(
+            interface__in=interfaces.exclude(mode=IFACE_MODE_TAGGED)
+        ).delete()
+
     def to_objectchange(self, action):
         # Annotate the parent Device/VM
         try:
@@ -2946,26 +3017,172 @@ class Cable(ChangeLoggedModel):
 
     def get_path_endpoints(self):
         """
-        Traverse both ends of a cable path and return its connected endpoints. Note that one or both endpoints may be
-        None.
+        Retrieve the stored paths from both ends of the cable and return its connected endpoints. Note that one or both
+        endpoints may be None.
         """
-        a_path = self.termination_b.trace()
-        b_path = self.termination_a.trace()
+        a_path = self.termination_b.get_cable_path()
+        b_path = self.termination_a.get_cable_path()
+        if a_path is None or b_path is None:
+            return None, None, CONNECTION_STATUS_PLANNED
 
         # Determine overall path status (connected or planned)
-        if self.status == CONNECTION_STATUS_PLANNED:
+        if self.status == CONNECTION_STATUS_PLANNED or not (a_path.is_connected and b_path.is_connected):
             path_status = CONNECTION_STATUS_PLANNED
         else:
             path_status = CONNECTION_STATUS_CONNECTED
-            for segment in a_path[1:] + b_path[1:]:
-                if segment[1] is None or segment[1].status == CONNECTION_STATUS_PLANNED:
-                    path_status = CONNECTION_STATUS_PLANNED
-                    break
 
-        a_endpoint = a_path[-1][2]
-        b_endpoint = b_path[-1][2]
+        return a_path.destination, b_path.destination, path_status
+
+
+class CablePath(models.Model):
+    """
+    The complete path traced from a cable termination (following circuits), stored so that it can be retrieved with a
+    single query instead of being traced one cable at a time. Each segment is recorded as a list of [near end type,
+    near end ID, cable ID, far end type, far end ID]. The destination and connection status describe the path without
+    following circuits. Stored paths are updated by dcim.signals as cables, ports and circuit terminations change.
+    """
+    origin_type = models.ForeignKey(
+        to=ContentType,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    origin_id = models.PositiveIntegerField()
+    origin = GenericForeignKey(
+        ct_field='origin_type',
+        fk_field='origin_id'
+    )
+    destination_type = models.ForeignKey(
+        to=ContentType,
+        on_delete=models.CASCADE,
+        related_name='+',
+        blank=True,
+        null=True
+    )
+    destination_id = models.PositiveIntegerField(
+        blank=True,
+        null=True
+    )
+    destination = GenericForeignKey(
+        ct_field='destination_type',
+        fk_field='destination_id'
+    )
+    segments = JSONField()
+    # Every termination within the path (as "<content type ID>:<ID>"), used to find the paths affected by a change
+    nodes = ArrayField(
+        base_field=models.CharField(max_length=30)
+    )
+    is_connected = models.BooleanField()
+
+    class Meta:
+        unique_together = ['origin_type', 'origin_id']
+        indexes = [
+            GinIndex(fields=['nodes']),
+        ]
+
+    def __str__(self):
+        return 'Path from {}'.format(self.origin)
+
+    @staticmethod
+    def get_node(termination):
+        return '{}:{}'.format(ContentType.objects.get_for_model(termination).pk, termination.pk)
+
+    @staticmethod
+    def get_circuit_boundary(segments):
+        """
+        Return the number of segments which precede the first circuit crossing (i.e. the length of the path when
+        circuits are not followed).
+        """
+        circuittermination_type = ContentType.objects.get_by_natural_key('circuits', 'circuittermination')
+        for i, (_, _, _, far_type, _) in enumerate(segments):
+            if far_type == circuittermination_type.pk:
+                return i + 1
+        return len(segments)
+
+    @classmethod
+    def rebuild(cls, terminations):
+        """
+        Retrace the paths originating from the given CableTerminations (each specified as either an instance or a
+        (content type ID, ID) tuple), along with every stored path which passes through or ends at any of them. Returns
+        a dictionary mapping each existing origin's (content type ID, ID) to an (origin, CablePath) tuple, where the
+        CablePath is None if the origin is no longer connected.
+        """
+        keys = set()
+        for termination in terminations:
+            if isinstance(termination, tuple):
+                keys.add(termination)
+            else:
+                keys.add((ContentType.objects.get_for_model(termination).pk, termination.pk))
+        if not keys:
+            return {}
+
+        origins = defaultdict(set)
+        for origin_type, origin_id in keys:
+            origins[origin_type].add(origin_id)
+        affected_paths = cls.objects.filter(
+            nodes__overlap=['{}:{}'.format(*key) for key in keys]
+        ).values_list('origin_type', 'origin_id')
+        for origin_type, origin_id in affected_paths:
+            origins[origin_type].add(origin_id)
+
+        # Trace each path, then replace the stored paths in bulk
+        paths = {}
+        for origin_type, origin_ids in origins.items():
+            model = ContentType.objects.get_for_id(origin_type).model_class()
+            origin_queryset = model.objects.filter(pk__in=origin_ids).select_related('cable').prefetch_related(
+                'cable__termination_a', 'cable__termination_b'
+            )
+            for origin in origin_queryset:
+                paths[(origin_type, origin.pk)] = (origin, origin.trace_cable_path())
+        stale_paths = Q()
+        for origin_type, origin_ids in origins.items():
+            stale_paths |= Q(origin_type=origin_type, origin_id__in=origin_ids)
+        cls.objects.filter(stale_paths).delete()
+        cls.objects.bulk_create(
+            [cable_path for _, cable_path in paths.values() if cable_path is not None],
+            batch_size=100
+        )
+
+        return paths
+
+    def get_segments(self, follow_circuits=False, origin=None):
+        """
+        Return the path as a list of (near end, cable, far end) tuples (see CableTermination.trace()). All objects in
+        the path are retrieved with one query per type. If given, origin is used in place of the first near end.
+        """
+        segments = self.segments
+        if not follow_circuits:
+            segments = segments[:self.get_circuit_boundary(segments)]
+
+        pks = defaultdict(set)
+        cable_pks = set()
+        for near_type, near_id, cable_id, far_type, far_id in segments:
+            pks[near_type].add(near_id)
+            if cable_id is not None:
+                cable_pks.add(cable_id)
+            if far_type is not None:
+                pks[far_type].add(far_id)
+
+        objects = {}
+        for content_type_id, object_ids in pks.items():
+            model = ContentType.objects.get_for_id(content_type_id).model_class()
+            queryset = model.objects.filter(pk__in=object_ids)
+            related = [name for name in ('device', 'circuit') if hasattr(model, name)]
+            if related:
+                queryset = queryset.select_related(*related)
+            objects[content_type_id] = {obj.pk: obj for obj in queryset}
+        cables = Cable.objects.in_bulk(cable_pks)
+
+        path = []
+        for near_type, near_id, cable_id, far_type, far_id in segments:
+            path.append((
+                objects[near_type].get(near_id),
+                cables.get(cable_id),
+                objects[far_type].get(far_id) if far_type is not None else None,
+            ))
+        if origin is not None and path:
+            path[0] = (origin, path[0][1], path[0][2])
 
-        return a_endpoint, b_endpoint, path_status
+        return path
 
 
 #
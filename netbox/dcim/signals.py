@@ -1,7 +1,9 @@
-from django.db.models.signals import post_save, pre_delete
+from django.contrib.contenttypes.models import ContentType
+from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch import receiver
 
-from .models import Cable, Device, VirtualChassis
+from .models import Cable, CablePath, Device, FrontPort, RearPort, VirtualChassis
+from .utils import get_deferred_cable_changes
 
 
 @receiver(post_save, sender=VirtualChassis)
@@ -29,6 +31,18 @@ def clear_virtualchassis_members(instance, **kwargs):
         device.save()
 
 
+def set_termination_cable(termination, cable):
+    """
+    Cache a Cable (or None) on a termination. While cable path computation is deferred, this is done with a single
+    UPDATE which bypasses the termination's save() and signals.
+    """
+    termination.cable = cable
+    if get_deferred_cable_changes() is not None:
+        type(termination).objects.filter(pk=termination.pk).update(cable=cable)
+    else:
+        termination.save(update_fields=['cable'])
+
+
 @receiver(post_save, sender=Cable)
 def update_connected_endpoints(instance, **kwargs):
     """
@@ -36,12 +50,19 @@ def update_connected_endpoints(instance, **kwargs):
     """
 
     # Cache the Cable on its two termination points
-    if instance.termination_a.cable != instance:
-        instance.termination_a.cable = instance
-        instance.termination_a.save()
-    if instance.termination_b.cable != instance:
-        instance.termination_b.cable = instance
-        instance.termination_b.save()
+    if instance.termination_a.cable_id != instance.pk:
+        set_termination_cable(instance.termination_a, instance)
+    if instance.termination_b.cable_id != instance.pk:
+        set_termination_cable(instance.termination_b, instance)
+
+    # If path computation has been deferred, just record the Cable
+    deferred = get_deferred_cable_changes()
+    if deferred is not None:
+        deferred.cables.add(instance.pk)
+        return
+
+    # Update the stored paths which begin, pass through or end at either termination
+    CablePath.rebuild([instance.termination_a, instance.termination_b])
 
     # Check if this Cable has formed a complete path. If so, update both endpoints.
     endpoint_a, endpoint_b, path_status = instance.get_path_endpoints()
@@ -63,11 +84,25 @@ def nullify_connected_endpoints(instance, **kwargs):
 
     # Disassociate the Cable from its termination points
     if instance.termination_a is not None:
-        instance.termination_a.cable = None
-        instance.termination_a.save()
+        set_termination_cable(instance.termination_a, None)
     if instance.termination_b is not None:
-        instance.termination_b.cable = None
-        instance.termination_b.save()
+        set_termination_cable(instance.termination_b, None)
+
+    # If path computation has been deferred, record the affected terminations and endpoints
+    deferred = get_deferred_cable_changes()
+    if deferred is not None:
+        deferred.cables.discard(instance.pk)
+        deferred.terminations.add((instance.termination_a_type_id, instance.termination_a_id))
+        deferred.terminations.add((instance.termination_b_type_id, instance.termination_b_id))
+        if hasattr(endpoint_a, 'connected_endpoint') and hasattr(endpoint_b, 'connected_endpoint'):
+            deferred.torn_down.append((
+                (ContentType.objects.get_for_model(endpoint_a).pk, endpoint_a.pk),
+                (ContentType.objects.get_for_model(endpoint_b).pk, endpoint_b.pk),
+            ))
+        return
+
+    # Update the stored paths which traversed this Cable
+    CablePath.rebuild([t for t in (instance.termination_a, instance.termination_b) if t is not None])
 
     # If this Cable was part of a complete path, tear it down
     if hasattr(endpoint_a, 'connected_endpoint') and hasattr(endpoint_b, 'connected_endpoint'):
@@ -77,3 +112,25 @@ def nullify_connected_endpoints(instance, **kwargs):
         endpoint_b.connected_endpoint = None
         endpoint_b.connection_status = None
         endpoint_b.save()
+
+
+@receiver((post_save, post_delete), sender=FrontPort)
+@receiver((post_save, post_delete), sender=RearPort)
+def update_pass_through_paths(instance, **kwargs):
+    """
+    When a FrontPort or RearPort is created, modified or deleted, update the stored paths which pass through or end at
+    it (or at the RearPort it maps to).
+    """
+    # Attaching or detaching a Cable is handled by the Cable's signals
+    if kwargs.get('update_fields') == {'cable'}:
+        return
+
+    terminations = [(ContentType.objects.get_for_model(instance).pk, instance.pk)]
+    if isinstance(instance, FrontPort):
+        terminations.append((ContentType.objects.get_for_model(RearPort).pk, instance.rear_port_id))
+
+    deferred = get_deferred_cable_changes()
+    if deferred is not None:
+        deferred.terminations.update(terminations)
+        return
+    CablePath.rebuild(terminations)
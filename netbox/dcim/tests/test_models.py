@@ -1,6 +1,9 @@
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
 from django.test import TestCase
 
 from dcim.models import *
+from dcim.utils import RackOccupancy, defer_cable_paths
 
 
 class RackTestCase(TestCase):
@@ -150,6 +153,130 @@ class RackTestCase(TestCase):
         )
         self.assertTrue(pdu)
 
+    def test_rack_occupancy(self):
+
+        full_depth = DeviceType.objects.create(
+            manufacturer=self.manufacturer,
+            model='FrameForwarder 4096',
+            slug='ff4096',
+            u_height=2
+        )
+        half_depth = DeviceType.objects.create(
+            manufacturer=self.manufacturer,
+            model='FrameForwarder 1024',
+            slug='ff1024',
+            u_height=1,
+            is_full_depth=False
+        )
+        device1 = Device.objects.create(
+            name='TestSwitch1',
+            device_type=full_depth,
+            device_role=self.role['Switch'],
+            site=self.site1,
+            rack=self.rack,
+            position=1,
+            face=RACK_FACE_FRONT
+        )
+        Device.objects.create(
+            name='TestSwitch2',
+            device_type=half_depth,
+            device_role=self.role['Switch'],
+            site=self.site1,
+            rack=self.rack,
+            position=41,
+            face=RACK_FACE_REAR
+        )
+        user = User.objects.create_user(username='testuser')
+        RackReservation.objects.create(rack=self.rack, units=[10, 11], user=user, description='Reserved')
+
+        # Two-unit devices cannot be installed directly below an occupied unit
+        self.assertEqual(self.rack.get_available_units(u_height=2), list(range(39, 2, -1)))
+        self.assertEqual(self.rack.get_available_units(u_height=2, rack_face=RACK_FACE_FRONT), list(range(41, 2, -1)))
+        self.assertEqual(
+            self.rack.get_available_units(u_height=1, rack_face=RACK_FACE_REAR),
+            [42] + list(range(40, 2, -1))
+        )
+        self.assertEqual(self.rack.get_available_units(u_height=2, exclude=[device1.pk])[-1], 1)
+
+        # Occupied and reserved units both count toward utilization
+        self.assertEqual(self.rack.get_utilization(), int(5 / 42 * 100))
+
+        occupancy = RackOccupancy.for_racks([self.rack])[self.rack.pk]
+        self.assertEqual(occupancy.get_available_units(u_height=2), self.rack.get_available_units(u_height=2))
+        self.assertEqual(occupancy.front_elevation[-1]['device'], device1)
+        self.assertEqual(len(occupancy.front_elevation), 41)
+        self.assertEqual(sorted(occupancy.reserved_units), [10, 11])
+
+    def test_annotate_utilization(self):
+
+        rack2 = Rack.objects.create(name='TestRack2', site=self.site1, u_height=10)
+        device = Device.objects.create(
+            name='TestSwitch1',
+            device_type=self.device_type['ff2048'],
+            device_role=self.role['Switch'],
+            site=self.site1,
+            rack=self.rack,
+            position=1,
+            face=RACK_FACE_FRONT
+        )
+        user = User.objects.create_user(username='testuser')
+        RackReservation.objects.create(rack=self.rack, units=[1, 2, 3], user=user, description='Reserved')
+        RackReservation.objects.create(rack=rack2, units=[1, 2], user=user, description='Reserved')
+
+        # A PowerFeed (1920VA available) feeding a PDU with one outlet, which powers the switch
+        powerpanel = PowerPanel.objects.create(site=self.site1, name='Panel 1')
+        pdu = Device.objects.create(
+            name='TestPDU',
+            device_type=self.device_type['cc5000'],
+            device_role=self.role['PDU'],
+            site=self.site1,
+            rack=self.rack
+        )
+        pdu_powerport = PowerPort.objects.create(device=pdu, name='Power Port 1')
+        PowerFeed.objects.create(
+            power_panel=powerpanel, rack=self.rack, name='Feed 1', connected_endpoint=pdu_powerport
+        )
+        poweroutlet = PowerOutlet.objects.create(device=pdu, name='Power Outlet 1', power_port=pdu_powerport)
+        PowerPort.objects.create(
+            device=device, name='Power Port 1', allocated_draw=480, _connected_poweroutlet=poweroutlet
+        )
+
+        # Two half-depth devices occupying the same units on opposite faces
+        rack3 = Rack.objects.create(name='TestRack3', site=self.site1, u_height=10)
+        half_depth = DeviceType.objects.create(
+            manufacturer=self.manufacturer,
+            model='FrameForwarder 1024',
+            slug='ff1024',
+            u_height=2,
+            is_full_depth=False
+        )
+        for face in (RACK_FACE_FRONT, RACK_FACE_REAR):
+            Device.objects.create(
+                device_type=half_depth,
+                device_role=self.role['Switch'],
+                site=self.site1,
+                rack=rack3,
+                position=1,
+                face=face
+            )
+
+        racks = {rack.pk: rack for rack in Rack.objects.annotate_utilization()}
+        self.assertEqual(racks[self.rack.pk].occupied_unit_count, 1)
+        self.assertEqual(racks[self.rack.pk].reserved_unit_count, 3)
+        self.assertEqual(racks[self.rack.pk].utilization, int(3 / 42 * 100))
+        self.assertEqual(racks[self.rack.pk].allocated_power, 480)
+        self.assertEqual(racks[self.rack.pk].available_power, 1920)
+        self.assertEqual(racks[self.rack.pk].power_utilization, 25)
+        self.assertEqual(racks[rack2.pk].utilization, 20)
+        self.assertEqual(racks[rack2.pk].power_utilization, 0)
+        self.assertEqual(racks[rack3.pk].occupied_unit_count, 2)
+        self.assertEqual(racks[rack3.pk].utilization, 20)
+
+        # The annotated values match those calculated for each rack individually
+        for rack in (self.rack, rack2, rack3):
+            self.assertEqual(racks[rack.pk].get_utilization(), rack.get_utilization())
+            self.assertEqual(racks[rack.pk].get_power_utilization(), rack.get_power_utilization())
+
 
 class DeviceTestCase(TestCase):
 
@@ -484,3 +611,80 @@ class CablePathTestCase(TestCase):
         interface2 = Interface.objects.get(pk=self.interface2.pk)
         self.assertIsNone(interface2.connected_endpoint)
         self.assertIsNone(interface2.connection_status)
+
+    def test_stored_path(self):
+
+        cable1 = Cable(termination_a=self.interface1, termination_b=self.front_port1)
+        cable1.save()
+        cable2 = Cable(termination_a=self.rear_port1, termination_b=self.rear_port2)
+        cable2.save()
+        cable3 = Cable(termination_a=self.front_port2, termination_b=self.interface2)
+        cable3.save()
+
+        interface1 = Interface.objects.get(pk=self.interface1.pk)
+        cable_path = CablePath.objects.get(
+            origin_type=ContentType.objects.get_for_model(Interface), origin_id=interface1.pk
+        )
+        self.assertEqual(cable_path.destination, self.interface2)
+        self.assertTrue(cable_path.is_connected)
+        self.assertEqual(interface1.trace(), [
+            (self.interface1, cable1, self.front_port1),
+            (self.rear_port1, cable2, self.rear_port2),
+            (self.front_port2, cable3, self.interface2),
+        ])
+        self.assertEqual(interface1.trace(), interface1._trace())
+
+        # Remap the far front port to a different rear port position; the path should now end at the rear port
+        for rear_port in (self.rear_port1, self.rear_port2):
+            rear_port.positions = 2
+            rear_port.save()
+        self.front_port2.rear_port_position = 2
+        self.front_port2.save()
+        interface1 = Interface.objects.get(pk=self.interface1.pk)
+        self.assertEqual(interface1.trace(), [
+            (self.interface1, cable1, self.front_port1),
+            (self.rear_port1, cable2, self.rear_port2),
+        ])
+        self.assertEqual(interface1.get_cable_path().destination, self.rear_port2)
+
+        # Deleting a cable removes the stored path from its terminations
+        cable1.delete()
+        interface1 = Interface.objects.get(pk=self.interface1.pk)
+        self.assertEqual(interface1.trace(), [(interface1, None, None)])
+        self.assertFalse(CablePath.objects.filter(nodes__contains=[CablePath.get_node(interface1)]).exists())
+
+    def test_deferred_paths(self):
+
+        # Build the path with path computation deferred
+        with defer_cable_paths():
+            cable1 = Cable(termination_a=self.interface1, termination_b=self.front_port1)
+            cable1.save()
+            cable2 = Cable(termination_a=self.rear_port1, termination_b=self.rear_port2)
+            cable2.save()
+            cable3 = Cable(termination_a=self.front_port2, termination_b=self.interface2)
+            cable3.save()
+            self.assertFalse(CablePath.objects.exists())
+        interface1 = Interface.objects.get(pk=self.interface1.pk)
+        self.assertEqual(interface1.connected_endpoint, self.interface2)
+        self.assertEqual(interface1.connection_status, CONNECTION_STATUS_CONNECTED)
+        interface2 = Interface.objects.get(pk=self.interface2.pk)
+        self.assertEqual(interface2.connected_endpoint, self.interface1)
+        self.assertEqual(interface1.trace(), [
+            (self.interface1, cable1, self.front_port1),
+            (self.rear_port1, cable2, self.rear_port2),
+            (self.front_port2, cable3, self.interface2),
+        ])
+
+        # Tear down the path with path computation deferred
+        with defer_cable_paths():
+            cable2.delete()
+            cable3.delete()
+        interface1 = Interface.objects.get(pk=self.interface1.pk)
+        self.assertIsNone(interface1.connected_endpoint)
+        self.assertIsNone(interface1.connection_status)
+        interface2 = Interface.objects.get(pk=self.interface2.pk)
+        self.assertIsNone(interface2.connected_endpoint)
+        self.assertEqual(interface1.trace(), [
+            (self.interface1, cable1, self.front_port1),
+            (self.rear_port1, None, None),
+        ])
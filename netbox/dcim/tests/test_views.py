@@ -1,13 +1,25 @@
 import urllib.parse
+from unittest.mock import patch
 
+import netaddr
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
 from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
-from dcim.constants import CABLE_TYPE_CAT6, IFACE_TYPE_1GE_FIXED
+from dcim.constants import CABLE_TYPE_CAT6, IFACE_MODE_ACCESS, IFACE_TYPE_1GE_FIXED, IFACE_TYPE_LAG, PORT_TYPE_8P8C
 from dcim.models import (
-    Cable, Device, DeviceRole, DeviceType, Interface, InventoryItem, Manufacturer, Platform, Rack, RackGroup,
-    RackReservation, RackRole, Site, Region, VirtualChassis,
+    Cable, Device, DeviceRole, DeviceType, FrontPort, FrontPortTemplate, Interface, InterfaceTemplate, InventoryItem,
+    Manufacturer, Platform, Rack, RackGroup, RackReservation, RackRole, RearPort, RearPortTemplate, Site, Region,
+    VirtualChassis,
 )
+from dcim.utils import update_connected_endpoints
+from dcim.views import CableBulkDeleteView, CableBulkImportView
+from extras.constants import CF_TYPE_TEXT, OBJECTCHANGE_ACTION_CREATE, OBJECTCHANGE_ACTION_DELETE
+from extras.models import CustomField, CustomFieldValue, ObjectChange
+from ipam.models import IPAddress, VLAN
+from tenancy.models import Tenant
 from utilities.testing import create_test_user
 
 
@@ -56,6 +68,75 @@ class SiteTestCase(TestCase):
         response = self.client.get('{}?{}'.format(url, urllib.parse.urlencode(params)))
         self.assertEqual(response.status_code, 200)
 
+    def test_site_list_count(self):
+
+        url = reverse('dcim:site_list')
+
+        response = self.client.get(url)
+        self.assertContains(response, 'Showing 1-3 of 3')
+
+        # Estimated counts are reported as such
+        response = self.client.get('{}?count=estimate'.format(url))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['table'].paginator.count_approximate)
+        self.assertContains(response, 'Showing 1-3 of about')
+
+    @patch('utilities.paginator.estimate_count', return_value=1)
+    def test_site_list_count_underestimated(self, estimate_count):
+
+        url = reverse('dcim:site_list')
+
+        # An estimate lower than the actual count must not prevent navigating to later pages
+        response = self.client.get('{}?count=estimate&per_page=2'.format(url))
+        self.assertEqual([row.record for row in response.context['table'].page.object_list], list(Site.objects.all()[:2]))
+        self.assertContains(response, 'Showing 1-2 of about 3')
+        self.assertContains(response, 'page=2')
+
+        response = self.client.get('{}?count=estimate&per_page=2&page=2'.format(url))
+        self.assertEqual(response.context['table'].page.number, 2)
+        self.assertContains(response, 'Showing 3-3 of about 3')
+        self.assertEqual([row.record for row in response.context['table'].page.object_list], [Site.objects.last()])
+        self.assertFalse(response.context['table'].page.has_next())
+
+    def test_site_bulk_edit(self):
+
+        user = create_test_user('editor', permissions=['dcim.change_site'])
+        self.client.force_login(user)
+        tenant = Tenant.objects.create(name='Tenant 1', slug='tenant-1')
+        custom_field = CustomField.objects.create(type=CF_TYPE_TEXT, name='code')
+        custom_field.obj_type.set([ContentType.objects.get_for_model(Site)])
+        site1 = Site.objects.get(name='Site 1')
+        site1.tags.add('Foo', 'Bar')
+        CustomFieldValue.objects.create(field=custom_field, obj=site1, serialized_value='ABC')
+        last_updated = site1.last_updated
+
+        data = {
+            'pk': [site.pk for site in Site.objects.all()],
+            'tenant': tenant.pk,
+            'cf_code': 'XYZ',
+            'add_tags': 'Baz',
+            'remove_tags': 'Foo',
+            '_nullify': ['region'],
+            '_apply': True,
+        }
+        response = self.client.post(reverse('dcim:site_bulk_edit'), data)
+        self.assertEqual(response.status_code, 302)
+
+        for site in Site.objects.all():
+            self.assertEqual(site.tenant, tenant)
+            self.assertIsNone(site.region)
+            self.assertEqual(site.cf['code'], 'XYZ')
+            self.assertEqual(sorted(site.tags.names()), ['Bar', 'Baz'] if site == site1 else ['Baz'])
+        self.assertGreater(Site.objects.get(pk=site1.pk).last_updated, last_updated)
+
+        # A change is logged for each Site, reflecting its new state
+        objectchanges = ObjectChange.objects.filter(changed_object_type=ContentType.objects.get_for_model(Site))
+        self.assertEqual(objectchanges.count(), 3)
+        objectchange = objectchanges.get(changed_object_id=site1.pk)
+        self.assertEqual(objectchange.object_data['tenant'], tenant.pk)
+        self.assertEqual(objectchange.object_data['custom_fields'], {'code': 'XYZ'})
+        self.assertEqual(sorted(objectchange.object_data['tags']), ['Bar', 'Baz'])
+
     def test_site(self):
 
         site = Site.objects.first()
@@ -300,6 +381,194 @@ class DeviceTestCase(TestCase):
         response = self.client.get('{}?{}'.format(url, urllib.parse.urlencode(params)))
         self.assertEqual(response.status_code, 200)
 
+    def test_device_export(self):
+
+        Device.objects.filter(name='Device 1').update(comments='Foo, "bar"')
+
+        url = reverse('dcim:device_list')
+        response = self.client.get('{}?export'.format(url))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+
+        rows = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(rows[0], ','.join(Device.csv_headers))
+        self.assertEqual(len(rows), 4)
+        self.assertTrue(rows[1].startswith('Device 1,Device Role 1,,Manufacturer 1,Device Type 1,'))
+        self.assertTrue(rows[1].endswith(',"Foo, ""bar"""'))
+
+    def test_device_export_queries(self):
+
+        def export():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get('{}?export'.format(reverse('dcim:device_list')))
+                rows = b''.join(response.streaming_content).decode('utf-8').splitlines()
+            return rows, len(queries)
+
+        _, query_count = export()
+
+        # Related objects are retrieved along with each device, even if they are absent from the first devices exported
+        site = Site.objects.first()
+        rack = Rack.objects.create(name='Rack 1', site=site, group=RackGroup.objects.create(
+            name='Rack Group 1', slug='rack-group-1', site=site
+        ))
+        device = Device.objects.first()
+        Device.objects.bulk_create([
+            Device(name='Device {}'.format(i), site=site, device_type=device.device_type, device_role=device.device_role)
+            for i in range(4, 16)
+        ])
+        Device.objects.filter(name='Device 15').update(rack=rack)
+
+        rows, racked_query_count = export()
+        self.assertEqual(len(rows), 16)
+        self.assertIn(',Rack Group 1,Rack 1,', rows[-1])
+        self.assertEqual(racked_query_count, query_count)
+
+    def test_device_import(self):
+
+        user = create_test_user('importer', permissions=['dcim.add_device'])
+        self.client.force_login(user)
+        devicetype = DeviceType.objects.first()
+        InterfaceTemplate.objects.create(device_type=devicetype, name='eth0')
+        rearport = RearPortTemplate.objects.create(
+            device_type=devicetype, name='Rear Port 1', type=PORT_TYPE_8P8C, positions=2
+        )
+        FrontPortTemplate.objects.create(
+            device_type=devicetype, name='Front Port 1', type=PORT_TYPE_8P8C, rear_port=rearport
+        )
+
+        csv_data = [
+            'name,device_role,manufacturer,model_name,status,site,asset_tag',
+        ] + [
+            'Device {0},Device Role 1,Manufacturer 1,Device Type 1,Active,Site 1,TAG{0}'.format(i) for i in range(4, 7)
+        ]
+        response = self.client.post(reverse('dcim:device_import'), {'csv': '\n'.join(csv_data)})
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'import_success.html')
+
+        # Components are instantiated and a change is logged for each new Device
+        devices = Device.objects.filter(name__in=['Device 4', 'Device 5', 'Device 6'])
+        self.assertEqual(devices.count(), 3)
+        for device in devices:
+            self.assertEqual(device.interfaces.get().name, 'eth0')
+            self.assertEqual(device.frontports.get().rear_port, device.rearports.get())
+        self.assertEqual(
+            ObjectChange.objects.filter(changed_object_type__model='device', action=OBJECTCHANGE_ACTION_CREATE).count(),
+            3
+        )
+
+    def test_device_import_errors(self):
+
+        user = create_test_user('importer', permissions=['dcim.add_device'])
+        self.client.force_login(user)
+
+        # Every invalid row is reported
+        csv_data = [
+            'name,device_role,manufacturer,model_name,status,site',
+            'Device 4,Device Role 2,Manufacturer 1,Device Type 1,Active,Site 1',
+            'Device 5,Device Role 1,Manufacturer 1,Device Type 1,Active,Site 2',
+        ]
+        response = self.client.post(reverse('dcim:device_import'), {'csv': '\n'.join(csv_data)})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Row 1 device_role')
+        self.assertContains(response, 'Row 2 site')
+
+        # Conflicts between rows are attributed to the offending row
+        csv_data = [
+            'name,device_role,manufacturer,model_name,status,site,asset_tag',
+            'Device 4,Device Role 1,Manufacturer 1,Device Type 1,Active,Site 1,TAG1',
+            'Device 5,Device Role 1,Manufacturer 1,Device Type 1,Active,Site 1,TAG1',
+        ]
+        response = self.client.post(reverse('dcim:device_import'), {'csv': '\n'.join(csv_data)})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'Row 1:')
+        self.assertContains(response, 'Row 2:')
+
+        self.assertEqual(Device.objects.count(), 3)
+
+    def test_device_import_rack_conflict(self):
+
+        user = create_test_user('importer', permissions=['dcim.add_device'])
+        self.client.force_login(user)
+        Rack.objects.create(name='Rack 1', site=Site.objects.first())
+        DeviceType.objects.create(
+            model='Device Type 2', slug='device-type-2', manufacturer=Manufacturer.objects.first(), u_height=2
+        )
+
+        # A full-depth device overlapping the rack units of a device in an earlier row is rejected
+        csv_data = [
+            'name,device_role,manufacturer,model_name,status,site,rack_name,position,face',
+            'Device 4,Device Role 1,Manufacturer 1,Device Type 2,Active,Site 1,Rack 1,1,Front',
+            'Device 5,Device Role 1,Manufacturer 1,Device Type 2,Active,Site 1,Rack 1,2,Rear',
+        ]
+        response = self.client.post(reverse('dcim:device_import'), {'csv': '\n'.join(csv_data)})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'Row 1 position')
+        self.assertContains(response, 'Row 2 position')
+        self.assertEqual(Device.objects.count(), 3)
+
+        # Non-overlapping devices are imported
+        csv_data[2] = 'Device 5,Device Role 1,Manufacturer 1,Device Type 2,Active,Site 1,Rack 1,3,Rear'
+        response = self.client.post(reverse('dcim:device_import'), {'csv': '\n'.join(csv_data)})
+        self.assertTemplateUsed(response, 'import_success.html')
+        self.assertEqual(Device.objects.count(), 5)
+
+    @patch('utilities.views.BULK_DELETE_CHUNK_SIZE', 2)
+    def test_device_bulk_delete(self):
+
+        user = create_test_user('deleter', permissions=['dcim.delete_device'])
+        self.client.force_login(user)
+        for i, device in enumerate(Device.objects.all(), start=1):
+            for j in range(1, 4):
+                interface = Interface.objects.create(device=device, name='eth{}'.format(j))
+                IPAddress.objects.create(address=netaddr.IPNetwork('10.0.{}.{}/24'.format(i, j)), interface=interface)
+            rearport = RearPort.objects.create(device=device, name='Rear Port 1', type=PORT_TYPE_8P8C, positions=1)
+            FrontPort.objects.create(device=device, name='Front Port 1', type=PORT_TYPE_8P8C, rear_port=rearport)
+
+        data = {
+            'pk': list(Device.objects.values_list('pk', flat=True)),
+            'confirm': True,
+            '_confirm': True,
+        }
+        response = self.client.post(reverse('dcim:device_bulk_delete'), data)
+        self.assertEqual(response.status_code, 302)
+
+        # Devices and their dependent objects are deleted in batches
+        for model in (Device, Interface, IPAddress, FrontPort, RearPort):
+            self.assertFalse(model.objects.exists())
+
+        # A change is logged for each deleted object
+        objectchanges = ObjectChange.objects.filter(action=OBJECTCHANGE_ACTION_DELETE)
+        for model, count in ((Device, 3), (Interface, 9), (IPAddress, 9), (FrontPort, 3), (RearPort, 3)):
+            self.assertEqual(
+                objectchanges.filter(changed_object_type=ContentType.objects.get_for_model(model)).count(), count
+            )
+        self.assertEqual(set(objectchanges.values_list('user', flat=True)), {user.pk})
+        self.assertEqual(objectchanges.values('request_id').distinct().count(), 1)
+
+    def test_device_bulk_delete_protected(self):
+
+        user = create_test_user('deleter', permissions=['dcim.view_device', 'dcim.delete_device'])
+        self.client.force_login(user)
+        for device in Device.objects.all():
+            Interface.objects.create(device=device, name='eth0')
+        master = Device.objects.get(name='Device 3')
+        master.virtual_chassis = VirtualChassis.objects.create(master=master)
+        master.vc_position = 1
+        master.save()
+
+        data = {
+            'pk': list(Device.objects.values_list('pk', flat=True)),
+            'confirm': True,
+            '_confirm': True,
+        }
+        response = self.client.post(reverse('dcim:device_bulk_delete'), data, follow=True)
+        self.assertContains(response, 'Unable to delete the requested devices')
+
+        # Nothing is deleted if any object is protected
+        self.assertEqual(Device.objects.count(), 3)
+        self.assertEqual(Interface.objects.count(), 3)
+        self.assertFalse(ObjectChange.objects.filter(action=OBJECTCHANGE_ACTION_DELETE).exists())
+
     def test_device(self):
 
         device = Device.objects.first()
@@ -307,6 +576,69 @@ class DeviceTestCase(TestCase):
         self.assertEqual(response.status_code, 200)
 
 
+class InterfaceTestCase(TestCase):
+
+    def setUp(self):
+        user = create_test_user(permissions=['dcim.change_interface'])
+        self.client = Client()
+        self.client.force_login(user)
+
+        site = Site.objects.create(name='Site 1', slug='site-1')
+        manufacturer = Manufacturer.objects.create(name='Manufacturer 1', slug='manufacturer-1')
+        devicetype = DeviceType.objects.create(model='Device Type 1', manufacturer=manufacturer)
+        devicerole = DeviceRole.objects.create(name='Device Role 1', slug='device-role-1')
+        self.device = Device.objects.create(
+            name='Device 1', site=site, device_type=devicetype, device_role=devicerole
+        )
+        self.vlan = VLAN.objects.create(vid=100, name='VLAN 100')
+
+        for i in range(1, 4):
+            Interface.objects.create(
+                device=self.device, name='eth{}'.format(i), type=IFACE_TYPE_1GE_FIXED, mode=IFACE_MODE_ACCESS,
+                untagged_vlan=self.vlan
+            )
+
+    def test_interface_bulk_edit(self):
+
+        data = {
+            'pk': [iface.pk for iface in Interface.objects.all()],
+            'mtu': 9000,
+            '_nullify': ['mode'],
+            '_apply': True,
+        }
+        url = reverse('dcim:interface_bulk_edit', kwargs={'pk': self.device.pk})
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 302)
+
+        # Untagged VLANs are removed from non-802.1Q interfaces, as by Interface.save()
+        for interface in Interface.objects.all():
+            self.assertEqual(interface.mtu, 9000)
+            self.assertIsNone(interface.mode)
+            self.assertIsNone(interface.untagged_vlan)
+        self.assertEqual(
+            ObjectChange.objects.filter(changed_object_type__model='interface', related_object_id=self.device.pk).count(),
+            3
+        )
+
+    def test_interface_bulk_edit_invalid(self):
+
+        lag = Interface.objects.create(device=self.device, name='lag1', type=IFACE_TYPE_LAG)
+        Interface.objects.filter(name='eth1').update(lag=lag)
+
+        # Each object is validated by the model's clean() method
+        data = {
+            'pk': [iface.pk for iface in Interface.objects.all()],
+            'type': IFACE_TYPE_1GE_FIXED,
+            'mtu': 9000,
+            '_apply': True,
+        }
+        url = reverse('dcim:interface_bulk_edit', kwargs={'pk': self.device.pk})
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Interface.objects.filter(mtu=9000).exists())
+        self.assertFalse(ObjectChange.objects.exists())
+
+
 class InventoryItemTestCase(TestCase):
 
     def setUp(self):
@@ -403,6 +735,33 @@ class CableTestCase(TestCase):
         response = self.client.get(cable.get_absolute_url())
         self.assertEqual(response.status_code, 200)
 
+    def test_cable_import_csv(self):
+
+        device1, device2 = Device.objects.order_by('name')
+        iface1 = Interface.objects.create(device=device1, name='Interface 4', type=IFACE_TYPE_1GE_FIXED)
+        iface2 = Interface.objects.create(device=device2, name='Interface 4', type=IFACE_TYPE_1GE_FIXED)
+        csv_data = '\n'.join([
+            'side_a_device,side_a_type,side_a_name,side_b_device,side_b_type,side_b_name',
+            'Device 1,interface,Interface 4,Device 2,interface,Interface 4',
+        ])
+
+        # Cable paths are computed in a single pass when cables are imported by a background job
+        with patch('dcim.utils.update_connected_endpoints', wraps=update_connected_endpoints) as update:
+            result = CableBulkImportView().import_csv(csv_data)
+        self.assertEqual(result['errors'], [])
+        self.assertEqual(update.call_count, 1)
+        self.assertEqual(Interface.objects.get(pk=iface1.pk).connected_endpoint, iface2)
+
+    @patch('utilities.views.BULK_DELETE_CHUNK_SIZE', 2)
+    def test_cable_delete_objects(self):
+
+        # Cable paths are torn down in a single pass per batch when cables are deleted by a background job
+        with patch('dcim.utils.update_connected_endpoints', wraps=update_connected_endpoints) as update:
+            result = CableBulkDeleteView().delete_objects(Cable.objects.values_list('pk', flat=True))
+        self.assertEqual(result, {'count': 3, 'errors': []})
+        self.assertEqual(update.call_count, 2)
+        self.assertFalse(Interface.objects.filter(_connected_interface__isnull=False).exists())
+
 
 class VirtualChassisTestCase(TestCase):
 
@@ -0,0 +1,261 @@
+import threading
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Count
+
+from .constants import CONNECTION_STATUS_CONNECTED, CONNECTION_STATUS_PLANNED, RACK_FACE_FRONT, RACK_FACE_REAR
+from .models import Cable, CablePath
+
+
+_deferred = threading.local()
+
+
+class DeferredCableChanges:
+    """
+    Cable changes recorded by dcim.signals while cable path computation is deferred.
+
+    cables: The PKs of saved Cables
+    terminations: The (content type ID, ID) of each termination affected by a deleted Cable or a modified port
+    torn_down: The (content type ID, ID) pairs of endpoints which were connected through a deleted Cable
+    """
+    def __init__(self):
+        self.cables = set()
+        self.terminations = set()
+        self.torn_down = []
+
+
+def get_deferred_cable_changes():
+    """
+    Return the DeferredCableChanges for the current thread, or None if cable path computation is not deferred.
+    """
+    return getattr(_deferred, 'changes', None)
+
+
+@contextmanager
+def defer_cable_paths():
+    """
+    Suppress the per-cable computation of cable paths and connected endpoints while Cables are saved or deleted in bulk.
+    On exit, every affected path is retraced and all affected endpoints are updated in a single batched pass. This
+    should be used within a transaction.
+    """
+    if get_deferred_cable_changes() is not None:
+        # Already deferred; the outermost block will perform the update
+        yield
+        return
+
+    _deferred.changes = DeferredCableChanges()
+    try:
+        yield
+        changes = _deferred.changes
+    finally:
+        del _deferred.changes
+    update_connected_endpoints(changes)
+
+
+def get_connection_fields(model):
+    """
+    Return the names of the concrete fields which record a termination's connected endpoint.
+    """
+    return [
+        field.name for field in model._meta.concrete_fields
+        if field.name in ('connected_endpoint', 'connection_status') or field.name.startswith('_connected_')
+    ]
+
+
+def update_connected_endpoints(changes):
+    """
+    Rebuild the cable paths affected by the given DeferredCableChanges and update the connected endpoints of each
+    Cable's path (or tear down the paths of deleted Cables) using bulk updates.
+    """
+    cables = list(Cable.objects.filter(pk__in=changes.cables))
+    terminations = set(changes.terminations)
+    for cable in cables:
+        terminations.add((cable.termination_a_type_id, cable.termination_a_id))
+        terminations.add((cable.termination_b_type_id, cable.termination_b_id))
+    paths = CablePath.rebuild(terminations)
+
+    # Determine the endpoints of each saved Cable (see Cable.get_path_endpoints())
+    connections = []
+    for cable in cables:
+        _, a_path = paths.get((cable.termination_b_type_id, cable.termination_b_id), (None, None))
+        _, b_path = paths.get((cable.termination_a_type_id, cable.termination_a_id), (None, None))
+        if a_path is None or b_path is None or a_path.destination_id is None or b_path.destination_id is None:
+            continue
+        if cable.status == CONNECTION_STATUS_PLANNED or not (a_path.is_connected and b_path.is_connected):
+            path_status = CONNECTION_STATUS_PLANNED
+        else:
+            path_status = CONNECTION_STATUS_CONNECTED
+        connections.append((
+            (a_path.destination_type_id, a_path.destination_id),
+            (b_path.destination_type_id, b_path.destination_id),
+            path_status
+        ))
+
+    # Retrieve all endpoints with one query per type
+    endpoint_ids = defaultdict(set)
+    for endpoint_a, endpoint_b in changes.torn_down + [connection[:2] for connection in connections]:
+        endpoint_ids[endpoint_a[0]].add(endpoint_a[1])
+        endpoint_ids[endpoint_b[0]].add(endpoint_b[1])
+    endpoints = {}
+    for content_type_id, pks in endpoint_ids.items():
+        model = ContentType.objects.get_for_id(content_type_id).model_class()
+        for endpoint in model.objects.filter(pk__in=pks):
+            endpoints[(content_type_id, endpoint.pk)] = endpoint
+
+    # Tear down the paths of deleted Cables before connecting new paths, in the order the changes were made
+    updated = set()
+    for endpoint_a, endpoint_b in changes.torn_down:
+        for key in (endpoint_a, endpoint_b):
+            if key in endpoints:
+                endpoints[key].connected_endpoint = None
+                endpoints[key].connection_status = None
+                updated.add(key)
+    for key_a, key_b, path_status in connections:
+        endpoint_a, endpoint_b = endpoints.get(key_a), endpoints.get(key_b)
+        # Paths which end at a pass-through port do not form a connection
+        if not hasattr(endpoint_a, 'connection_status') or not hasattr(endpoint_b, 'connection_status'):
+            continue
+        endpoint_a.connected_endpoint = endpoint_b
+        endpoint_a.connection_status = path_status
+        endpoint_b.connected_endpoint = endpoint_a
+        endpoint_b.connection_status = path_status
+        updated.update((key_a, key_b))
+
+    updated_endpoints = defaultdict(list)
+    for key in updated:
+        updated_endpoints[type(endpoints[key])].append(endpoints[key])
+    for model, objects in updated_endpoints.items():
+        model.objects.bulk_update(objects, get_connection_fields(model), batch_size=100)
+
+
+class RackOccupancy:
+    """
+    Bitmaps of the units within a Rack which are occupied by Devices (on the front face, the rear face, or either) and
+    reserved by RackReservations, where bit n-1 represents unit n. Free space, utilization and elevations are all
+    derived from the bitmaps rather than by testing units individually.
+    """
+    def __init__(self, rack, devices=(), reservations=()):
+        self.rack = rack
+        self.all_units = (1 << rack.u_height) - 1
+        self.devices = []
+        self.front = 0
+        self.rear = 0
+        self.occupied = 0
+        self.reserved = 0
+        self.reserved_units = {}
+        for device in devices:
+            self.add_device(device)
+        for reservation in reservations:
+            for u in reservation.units:
+                self.reserved_units[u] = reservation
+                if 1 <= u <= rack.u_height:
+                    self.reserved |= 1 << (u - 1)
+
+    @classmethod
+    def for_racks(cls, racks, exclude=None):
+        """
+        Return a dictionary mapping the PK of each Rack to its RackOccupancy, retrieving the installed Devices of all
+        racks in a single query (and their reservations in another). Optionally exclude a list of Device PKs (e.g. a
+        Device being moved within its rack).
+        """
+        from .models import Device, RackReservation
+
+        racks = [rack for rack in racks if rack.pk is not None]
+        devices = defaultdict(list)
+        reservations = defaultdict(list)
+        if racks:
+            device_queryset = Device.objects.filter(
+                rack__in=racks, position__gte=1
+            ).exclude(
+                pk__in=exclude or []
+            ).select_related(
+                'device_type__manufacturer', 'device_role'
+            ).annotate(
+                devicebay_count=Count('device_bays')
+            )
+            for device in device_queryset:
+                devices[device.rack_id].append(device)
+            for reservation in RackReservation.objects.filter(rack__in=racks).select_related('user'):
+                reservations[reservation.rack_id].append(reservation)
+
+        return {rack.pk: cls(rack, devices[rack.pk], reservations[rack.pk]) for rack in racks}
+
+    @staticmethod
+    def get_mask(position, u_height):
+        """
+        Return the bitmap of the units occupied by an object of the given height at the given position.
+        """
+        return ((1 << u_height) - 1) << (position - 1)
+
+    def add_device(self, device):
+        mask = self.get_mask(device.position, device.device_type.u_height)
+        self.devices.append(device)
+        self.occupied |= mask
+        if device.face == RACK_FACE_FRONT or device.device_type.is_full_depth:
+            self.front |= mask
+        if device.face == RACK_FACE_REAR or device.device_type.is_full_depth:
+            self.rear |= mask
+
+    def get_occupied(self, face=None):
+        """
+        Return the bitmap of occupied units on the given face (or on either face if None).
+        """
+        if face is None:
+            return self.occupied
+        return self.front if int(face) == RACK_FACE_FRONT else self.rear
+
+    def get_available_units(self, u_height=1, face=None):
+        """
+        Return the units (in descending order) at which a device of the given height could be installed on the given
+        face (or on both faces if None; i.e. a full-depth device).
+        """
+        free = ~self.get_occupied(face) & self.all_units
+        # A unit is available if it and the u_height - 1 units above it are all free
+        fits = free
+        for i in range(1, u_height):
+            fits &= free >> i
+        return [u for u in range(self.rack.u_height, 0, -1) if fits >> (u - 1) & 1]
+
+    def get_utilization(self):
+        """
+        Return the percentage of units which are occupied or reserved.
+        """
+        used = (self.occupied | self.reserved) & self.all_units
+        return int(float(bin(used).count('1')) / self.rack.u_height * 100)
+
+    def get_elevation(self, face=RACK_FACE_FRONT, remove_redundant=False):
+        """
+        Return a list of rack units as dictionaries (see Rack.get_rack_units()).
+        """
+        elevation = OrderedDict()
+        for u in self.rack.units:
+            elevation[u] = {'id': u, 'name': 'U{}'.format(u), 'face': face, 'device': None}
+
+        # The face may be given as a string (e.g. from form data)
+        face = int(face) if face not in (None, '') else None
+        for device in self.devices:
+            if device.face != face and not device.device_type.is_full_depth:
+                continue
+            if remove_redundant:
+                elevation[device.position]['device'] = device
+                for u in range(device.position + 1, device.position + device.device_type.u_height):
+                    elevation.pop(u, None)
+            else:
+                for u in range(device.position, device.position + device.device_type.u_height):
+                    elevation[u]['device'] = device
+
+        return list(elevation.values())
+
+    @property
+    def utilization(self):
+        return self.get_utilization()
+
+    @property
+    def front_elevation(self):
+        return self.get_elevation(RACK_FACE_FRONT, remove_redundant=True)
+
+    @property
+    def rear_elevation(self):
+        return self.get_elevation(RACK_FACE_REAR, remove_redundant=True)
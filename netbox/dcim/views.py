@@ -1,9 +1,11 @@
 import re
+from contextlib import contextmanager
 
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.mixins import PermissionRequiredMixin
 from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ValidationError
 from django.core.paginator import EmptyPage, PageNotAnInteger
 from django.db import transaction
 from django.db.models import Count, F
@@ -23,13 +25,13 @@ from ipam.models import Prefix, VLAN
 from ipam.tables import InterfaceIPAddressTable, InterfaceVLANTable
 from utilities.forms import ConfirmationForm
 from utilities.paginator import EnhancedPaginator
-from utilities.utils import csv_format
 from utilities.views import (
     BulkComponentCreateView, BulkDeleteView, BulkEditView, BulkImportView, ComponentCreateView, GetReturnURLMixin,
     ObjectDeleteView, ObjectEditView, ObjectListView,
 )
 from virtualization.models import VirtualMachine
 from . import filters, forms, tables
+from .constants import RACK_FACE_FRONT, RACK_FACE_REAR
 from .models import (
     Cable, ConsolePort, ConsolePortTemplate, ConsoleServerPort, ConsoleServerPortTemplate, Device, DeviceBay,
     DeviceBayTemplate, DeviceRole, DeviceType, FrontPort, FrontPortTemplate, Interface, InterfaceTemplate,
@@ -37,6 +39,7 @@ from .models import (
     PowerPortTemplate, Rack, RackGroup, RackReservation, RackRole, RearPort, RearPortTemplate, Region, Site,
     VirtualChassis,
 )
+from .utils import RackOccupancy, defer_cable_paths
 
 
 class BulkRenameView(GetReturnURLMixin, View):
@@ -108,7 +111,7 @@ class BulkDisconnectView(GetReturnURLMixin, View):
 
             if form.is_valid():
 
-                with transaction.atomic():
+                with transaction.atomic(), defer_cable_paths():
 
                     count = 0
                     for obj in self.model.objects.filter(pk__in=form.cleaned_data['pk']):
@@ -344,10 +347,10 @@ class RackRoleBulkDeleteView(PermissionRequiredMixin, BulkDeleteView):
 class RackListView(PermissionRequiredMixin, ObjectListView):
     permission_required = 'dcim.view_rack'
     queryset = Rack.objects.prefetch_related(
-        'site', 'group', 'tenant', 'role', 'devices__device_type'
+        'site', 'group', 'tenant', 'role'
     ).annotate(
         device_count=Count('devices')
-    )
+    ).annotate_utilization()
     filter = filters.RackFilter
     filter_form = forms.RackFilterForm
     table = tables.RackDetailTable
@@ -362,7 +365,7 @@ class RackElevationListView(PermissionRequiredMixin, View):
 
     def get(self, request):
 
-        racks = Rack.objects.prefetch_related('site', 'group', 'tenant', 'role', 'devices__device_type')
+        racks = Rack.objects.prefetch_related('site', 'group', 'tenant', 'role').annotate_utilization()
         racks = filters.RackFilter(request.GET, racks).qs
         total_count = racks.count()
 
@@ -377,6 +380,12 @@ class RackElevationListView(PermissionRequiredMixin, View):
         except EmptyPage:
             page = paginator.page(paginator.num_pages)
 
+        # Retrieve the devices and reservations of all racks on the page at once
+        page.object_list = list(page.object_list)
+        occupancies = RackOccupancy.for_racks(page.object_list)
+        for rack in page.object_list:
+            rack.occupancy = occupancies[rack.pk]
+
         # Determine rack face
         if request.GET.get('face') == '1':
             face_id = 1
@@ -409,6 +418,7 @@ class RackView(PermissionRequiredMixin, View):
 
         reservations = RackReservation.objects.filter(rack=rack)
         power_feeds = PowerFeed.objects.filter(rack=rack).prefetch_related('power_panel')
+        occupancy = rack.get_occupancy()
 
         return render(request, 'dcim/rack.html', {
             'rack': rack,
@@ -417,8 +427,9 @@ class RackView(PermissionRequiredMixin, View):
             'nonracked_devices': nonracked_devices,
             'next_rack': next_rack,
             'prev_rack': prev_rack,
-            'front_elevation': rack.get_front_elevation(),
-            'rear_elevation': rack.get_rear_elevation(),
+            'occupancy': occupancy,
+            'front_elevation': occupancy.front_elevation,
+            'rear_elevation': occupancy.rear_elevation,
         })
 
 
@@ -1085,6 +1096,34 @@ class DeviceBulkImportView(PermissionRequiredMixin, BulkImportView):
     template_name = 'dcim/device_import.html'
     default_return_url = 'dcim:device_list'
 
+    def _can_bulk_create(self):
+        # Device.save() only instantiates components for new Devices, which is done in _post_bulk_create(). Rack units
+        # occupied by Devices of earlier records (which Device.clean() cannot see) are checked in _clean_batch_obj().
+        return True
+
+    def _clean_batch_obj(self, obj, batch_state):
+
+        if obj.rack_id is None or not obj.position:
+            return
+
+        # Record the units claimed on each face of each rack. A full-depth device occupies both faces.
+        claimed_units = batch_state.setdefault('claimed_units', {})
+        faces = [RACK_FACE_FRONT, RACK_FACE_REAR] if obj.device_type.is_full_depth else [obj.face]
+        units = set(range(obj.position, obj.position + obj.device_type.u_height))
+        for face in faces:
+            if units & claimed_units.get((obj.rack_id, face), set()):
+                raise ValidationError({
+                    'position': "U{} is already occupied by a device of an earlier row, or does not have sufficient "
+                                "space to accommodate a(n) {} ({}U).".format(
+                                    obj.position, obj.device_type, obj.device_type.u_height
+                                )
+                })
+        for face in faces:
+            claimed_units.setdefault((obj.rack_id, face), set()).update(units)
+
+    def _post_bulk_create(self, objs):
+        Device.instantiate_components(objs)
+
 
 class ChildDeviceBulkImportView(PermissionRequiredMixin, BulkImportView):
     permission_required = 'dcim.add_device'
@@ -1354,11 +1393,18 @@ class InterfaceDeleteView(PermissionRequiredMixin, ObjectDeleteView):
 
 class InterfaceBulkEditView(PermissionRequiredMixin, BulkEditView):
     permission_required = 'dcim.change_interface'
-    queryset = Interface.objects.all()
+    queryset = Interface.objects.select_related('device')
     parent_model = Device
     table = tables.InterfaceTable
     form = forms.InterfaceBulkEditForm
 
+    def _can_bulk_update(self):
+        # Interface.save() enforces VLAN assignment rules, which are applied in _post_bulk_update()
+        return True
+
+    def _post_bulk_update(self, queryset):
+        Interface.update_vlan_assignments(queryset)
+
 
 class InterfaceBulkRenameView(PermissionRequiredMixin, BulkRenameView):
     permission_required = 'dcim.change_interface'
@@ -1805,6 +1851,12 @@ class CableBulkImportView(PermissionRequiredMixin, BulkImportView):
     table = tables.CableTable
     default_return_url = 'dcim:cable_list'
 
+    def _import(self, form, progress=None):
+        # Compute cable paths and connected endpoints in a single pass once all cables have been imported (whether
+        # within the request or by a background job)
+        with transaction.atomic(), defer_cable_paths():
+            return super()._import(form, progress)
+
 
 class CableBulkEditView(PermissionRequiredMixin, BulkEditView):
     permission_required = 'dcim.change_cable'
@@ -1822,6 +1874,13 @@ class CableBulkDeleteView(PermissionRequiredMixin, BulkDeleteView):
     table = tables.CableTable
     default_return_url = 'dcim:cable_list'
 
+    @contextmanager
+    def _delete_batch(self):
+        # Tear down cable paths in a single pass once each batch of cables has been deleted (whether within the request
+        # or by a background job)
+        with defer_cable_paths():
+            yield
+
 
 #
 # Connections
@@ -1842,20 +1901,15 @@ class ConsoleConnectionsListView(PermissionRequiredMixin, ObjectListView):
     template_name = 'dcim/console_connections_list.html'
 
     def queryset_to_csv(self):
-        csv_data = [
-            # Headers
-            ','.join(['console_server', 'port', 'device', 'console_port', 'connection_status'])
-        ]
-        for obj in self.queryset:
-            csv = csv_format([
-                obj.connected_endpoint.device.identifier if obj.connected_endpoint else None,
-                obj.connected_endpoint.name if obj.connected_endpoint else None,
-                obj.device.identifier,
-                obj.name,
-                obj.get_connection_status_display(),
-            ])
-            csv_data.append(csv)
-        return csv_data
+        # Headers
+        yield ['console_server', 'port', 'device', 'console_port', 'connection_status']
+        yield from self.iterate_queryset(self.queryset, lambda obj: [
+            obj.connected_endpoint.device.identifier if obj.connected_endpoint else None,
+            obj.connected_endpoint.name if obj.connected_endpoint else None,
+            obj.device.identifier,
+            obj.name,
+            obj.get_connection_status_display(),
+        ])
 
 
 class PowerConnectionsListView(PermissionRequiredMixin, ObjectListView):
@@ -1873,20 +1927,15 @@ class PowerConnectionsListView(PermissionRequiredMixin, ObjectListView):
     template_name = 'dcim/power_connections_list.html'
 
     def queryset_to_csv(self):
-        csv_data = [
-            # Headers
-            ','.join(['pdu', 'outlet', 'device', 'power_port', 'connection_status'])
-        ]
-        for obj in self.queryset:
-            csv = csv_format([
-                obj.connected_endpoint.device.identifier if obj.connected_endpoint else None,
-                obj.connected_endpoint.name if obj.connected_endpoint else None,
-                obj.device.identifier,
-                obj.name,
-                obj.get_connection_status_display(),
-            ])
-            csv_data.append(csv)
-        return csv_data
+        # Headers
+        yield ['pdu', 'outlet', 'device', 'power_port', 'connection_status']
+        yield from self.iterate_queryset(self.queryset, lambda obj: [
+            obj.connected_endpoint.device.identifier if obj.connected_endpoint else None,
+            obj.connected_endpoint.name if obj.connected_endpoint else None,
+            obj.device.identifier,
+            obj.name,
+            obj.get_connection_status_display(),
+        ])
 
 
 class InterfaceConnectionsListView(PermissionRequiredMixin, ObjectListView):
@@ -1906,26 +1955,21 @@ class InterfaceConnectionsListView(PermissionRequiredMixin, ObjectListView):
     template_name = 'dcim/interface_connections_list.html'
 
     def queryset_to_csv(self):
-        csv_data = [
-            # Headers
-            ','.join([
-                'device_a', 'interface_a', 'interface_a_description',
-                'device_b', 'interface_b', 'interface_b_description',
-                'connection_status'
-            ])
+        # Headers
+        yield [
+            'device_a', 'interface_a', 'interface_a_description',
+            'device_b', 'interface_b', 'interface_b_description',
+            'connection_status'
         ]
-        for obj in self.queryset:
-            csv = csv_format([
-                obj.connected_endpoint.device.identifier if obj.connected_endpoint else None,
-                obj.connected_endpoint.name if obj.connected_endpoint else None,
-                obj.connected_endpoint.description if obj.connected_endpoint else None,
-                obj.device.identifier,
-                obj.name,
-                obj.description,
-                obj.get_connection_status_display(),
-            ])
-            csv_data.append(csv)
-        return csv_data
+        yield from self.iterate_queryset(self.queryset, lambda obj: [
+            obj.connected_endpoint.device.identifier if obj.connected_endpoint else None,
+            obj.connected_endpoint.name if obj.connected_endpoint else None,
+            obj.connected_endpoint.description if obj.connected_endpoint else None,
+            obj.device.identifier,
+            obj.name,
+            obj.description,
+            obj.get_connection_status_display(),
+        ])
 
 
 #
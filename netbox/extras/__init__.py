@@ -5,11 +5,11 @@ from django.core.exceptions import ImproperlyConfigured
 default_app_config = 'extras.apps.ExtrasConfig'
 
 # check that django-rq is installed and we can connect to redis
-if settings.WEBHOOKS_ENABLED:
+if settings.WEBHOOKS_ENABLED or settings.BACKGROUND_JOBS_ENABLED:
     try:
         import django_rq
     except ImportError:
         raise ImproperlyConfigured(
             "django-rq is not installed! You must install this package per "
-            "the documentation to use the webhook backend."
+            "the documentation to use the webhook backend or background jobs."
         )
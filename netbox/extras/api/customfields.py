@@ -6,7 +6,7 @@ from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
 from extras.constants import CF_TYPE_BOOLEAN, CF_TYPE_DATE, CF_TYPE_INTEGER, CF_TYPE_SELECT
-from extras.models import CustomField, CustomFieldChoice, CustomFieldValue
+from extras.models import CustomField, CustomFieldChoice, CustomFieldValue, get_custom_fields_for_model
 from utilities.api import ValidatedModelSerializer
 
 
@@ -93,12 +93,19 @@ class CustomFieldModelSerializer(ValidatedModelSerializer):
     Extends ModelSerializer to render any CustomFields and their values associated with an object.
     """
     custom_fields = CustomFieldsSerializer(required=False)
+    field_sources = {
+        'custom_fields': ['custom_field_values'],
+    }
 
     def __init__(self, *args, **kwargs):
 
         def _populate_custom_fields(instance, fields):
             custom_fields = {f.name: None for f in fields}
+            fields_by_pk = {f.pk: f for f in fields}
             for cfv in instance.custom_field_values.all():
+                if cfv.field_id in fields_by_pk:
+                    # Avoid retrieving the CustomField of each value individually
+                    cfv.field = fields_by_pk[cfv.field_id]
                 if cfv.field.type == CF_TYPE_SELECT:
                     custom_fields[cfv.field.name] = CustomFieldChoiceSerializer(cfv.value).data
                 else:
@@ -107,11 +114,12 @@ class CustomFieldModelSerializer(ValidatedModelSerializer):
 
         super().__init__(*args, **kwargs)
 
-        if self.instance is not None:
+        # Skip custom fields if they have been omitted from the response
+        fieldset = self.context.get('fieldset')
+        if self.instance is not None and (fieldset is None or 'custom_fields' in fieldset):
 
             # Retrieve the set of CustomFields which apply to this type of object
-            content_type = ContentType.objects.get_for_model(self.Meta.model)
-            fields = CustomField.objects.filter(obj_type=content_type)
+            fields = get_custom_fields_for_model(self.Meta.model)
 
             # Populate CustomFieldValues for each instance from database
             try:
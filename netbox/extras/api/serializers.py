@@ -102,6 +102,9 @@ class ImageAttachmentSerializer(ValidatedModelSerializer):
         queryset=ContentType.objects.all()
     )
     parent = serializers.SerializerMethodField(read_only=True)
+    field_sources = {
+        'parent': ['parent'],
+    }
 
     class Meta:
         model = ImageAttachment
@@ -213,6 +216,24 @@ class ReportDetailSerializer(ReportSerializer):
     result = ReportResultSerializer()
 
 
+#
+# Background jobs
+#
+
+class JobSerializer(serializers.Serializer):
+    id = serializers.CharField(read_only=True)
+    action = serializers.CharField(read_only=True)
+    status = serializers.CharField(read_only=True)
+    model = serializers.CharField(read_only=True)
+    created = serializers.DateTimeField(read_only=True)
+    completed = serializers.DateTimeField(read_only=True)
+    total = serializers.IntegerField(read_only=True)
+    processed = serializers.IntegerField(read_only=True)
+    count = serializers.IntegerField(read_only=True)
+    object_ids = serializers.ListField(child=serializers.IntegerField(), read_only=True)
+    errors = serializers.ListField(child=serializers.CharField(), read_only=True)
+
+
 #
 # Change logging
 #
@@ -231,6 +252,10 @@ class ObjectChangeSerializer(serializers.ModelSerializer):
     changed_object = serializers.SerializerMethodField(
         read_only=True
     )
+    object_data = serializers.JSONField(
+        source='get_object_data',
+        read_only=True
+    )
 
     class Meta:
         model = ObjectChange
@@ -41,6 +41,9 @@ router.register(r'config-contexts', views.ConfigContextViewSet)
 # Reports
 router.register(r'reports', views.ReportViewSet, basename='report')
 
+# Import jobs
+router.register(r'jobs', views.JobViewSet, basename='job')
+
 # Change logging
 router.register(r'object-changes', views.ObjectChangeViewSet)
 
@@ -1,5 +1,6 @@
 from collections import OrderedDict
 
+from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from django.db.models import Count
 from django.http import Http404, HttpResponse
@@ -10,6 +11,7 @@ from rest_framework.response import Response
 from rest_framework.viewsets import ReadOnlyModelViewSet, ViewSet
 
 from extras import filters
+from extras.jobs import get_job
 from extras.models import (
     ConfigContext, CustomFieldChoice, ExportTemplate, Graph, ImageAttachment, ObjectChange, ReportResult, TopologyMap,
     Tag,
@@ -72,27 +74,35 @@ class CustomFieldModelViewSet(ModelViewSet):
 
     def get_serializer_context(self):
 
-        # Gather all custom fields for the model
-        content_type = ContentType.objects.get_for_model(self.queryset.model)
-        custom_fields = content_type.custom_fields.prefetch_related('choices')
+        # The serializer context may be requested several times per request, so gather the custom fields only once
+        if not hasattr(self, '_custom_fields'):
 
-        # Cache all relevant CustomFieldChoices. This saves us from having to do a lookup per select field per object.
-        custom_field_choices = {}
-        for field in custom_fields:
-            for cfc in field.choices.all():
-                custom_field_choices[cfc.id] = cfc.value
-        custom_field_choices = custom_field_choices
+            # Gather all custom fields for the model
+            content_type = ContentType.objects.get_for_model(self.queryset.model)
+            self._custom_fields = content_type.custom_fields.prefetch_related('choices')
+
+            # Cache all relevant CustomFieldChoices. This saves us from having to do a lookup per select field per
+            # object.
+            self._custom_field_choices = {}
+            for field in self._custom_fields:
+                for cfc in field.choices.all():
+                    self._custom_field_choices[cfc.id] = cfc.value
 
         context = super().get_serializer_context()
         context.update({
-            'custom_fields': custom_fields,
-            'custom_field_choices': custom_field_choices,
+            'custom_fields': self._custom_fields,
+            'custom_field_choices': self._custom_field_choices,
         })
         return context
 
     def get_queryset(self):
-        # Prefetch custom field values
-        return super().get_queryset().prefetch_related('custom_field_values__field')
+        queryset = super().get_queryset()
+
+        # Prefetch custom field values (unless they have been omitted from the response)
+        if 'custom_fields' in self.fieldset:
+            queryset = queryset.prefetch_related('custom_field_values__field')
+
+        return queryset
 
 
 #
@@ -252,6 +262,33 @@ class ReportViewSet(ViewSet):
         return Response(serializer.data)
 
 
+#
+# Background jobs
+#
+
+class JobViewSet(ViewSet):
+    """
+    Retrieve the status of a background job.
+    """
+    permission_classes = [IsAuthenticatedOrLoginNotRequired]
+    _ignore_model_permissions = True
+    exclude_from_schema = True
+
+    def retrieve(self, request, pk):
+
+        if not settings.BACKGROUND_JOBS_ENABLED:
+            raise Http404
+
+        # Jobs are visible only to the user who submitted them
+        job = get_job(pk)
+        if job is None or not job.is_visible_to(request.user):
+            raise Http404
+
+        serializer = serializers.JobSerializer(job)
+
+        return Response(serializer.data)
+
+
 #
 # Change logging
 #
@@ -263,3 +300,12 @@ class ObjectChangeViewSet(ReadOnlyModelViewSet):
     queryset = ObjectChange.objects.prefetch_related('user')
     serializer_class = serializers.ObjectChangeSerializer
     filterset_class = filters.ObjectChangeFilter
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+
+        # Retrieve the snapshots of any changes recorded as deltas using a single query
+        if page is not None:
+            ObjectChange.prefetch_snapshots(page)
+
+        return page
@@ -129,6 +129,9 @@ EXPORTTEMPLATE_MODELS = [
     'virtualization.virtualmachine',
 ]
 
+# The minimum size (in characters) of each chunk of a streamed ExportTemplate response
+EXPORTTEMPLATE_CHUNK_SIZE = 8192
+
 # ExportTemplate language choices
 TEMPLATE_LANGUAGE_DJANGO = 10
 TEMPLATE_LANGUAGE_JINJA2 = 20
@@ -231,3 +234,30 @@ WEBHOOK_MODELS = [
     'virtualization.cluster',
     'virtualization.virtualmachine',
 ]
+
+# Background job actions
+JOB_ACTION_IMPORT = 'import'
+JOB_ACTION_DELETE = 'delete'
+
+# Background job statuses
+JOB_STATUS_PENDING = 'pending'
+JOB_STATUS_RUNNING = 'running'
+JOB_STATUS_COMPLETED = 'completed'
+JOB_STATUS_FAILED = 'failed'
+JOB_STATUS_ERRORED = 'errored'
+JOB_STATUS_CLASSES = {
+    JOB_STATUS_PENDING: 'default',
+    JOB_STATUS_RUNNING: 'info',
+    JOB_STATUS_COMPLETED: 'success',
+    JOB_STATUS_FAILED: 'warning',
+    JOB_STATUS_ERRORED: 'danger',
+}
+
+# The number of objects processed by a background job between progress updates
+JOB_PROGRESS_INTERVAL = 100
+
+# The maximum number of seconds for which a background job may run
+JOB_TIMEOUT = 3600
+
+# The number of seconds for which the results of a background job are retained
+JOB_RESULT_TTL = 86400
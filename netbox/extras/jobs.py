@@ -0,0 +1,125 @@
+from .constants import (
+    JOB_ACTION_DELETE, JOB_ACTION_IMPORT, JOB_RESULT_TTL, JOB_STATUS_COMPLETED, JOB_STATUS_ERRORED, JOB_STATUS_FAILED,
+    JOB_STATUS_PENDING, JOB_STATUS_RUNNING, JOB_TIMEOUT,
+)
+
+JOB_FUNC_NAMES = {
+    JOB_ACTION_IMPORT: 'extras.jobs_worker.process_import',
+    JOB_ACTION_DELETE: 'extras.jobs_worker.process_delete',
+}
+
+
+class BackgroundJob:
+    """
+    The status of a background job (and its results, once completed) as recorded by RQ.
+    """
+    def __init__(self, job):
+        self.job = job
+        self.id = job.id
+        self.action = job.meta.get('action')
+        self.view_name = job.args[0]
+        self.user_id = job.meta.get('user_id')
+        self.model = job.meta.get('model')
+        self.return_url = job.meta.get('return_url')
+        self.total = job.meta.get('total')
+        self.processed = job.meta.get('processed', 0)
+        self.created = job.enqueued_at
+        self.completed = job.ended_at
+
+        result = (job.result if job.is_finished else None) or {}
+        self.object_ids = result.get('object_ids', [])
+        self.count = result.get('count', len(self.object_ids))
+        self.errors = result.get('errors', [])
+
+    @property
+    def status(self):
+        if self.job.is_finished:
+            return JOB_STATUS_FAILED if self.errors else JOB_STATUS_COMPLETED
+        if self.job.is_failed:
+            return JOB_STATUS_ERRORED
+        if self.job.is_started:
+            return JOB_STATUS_RUNNING
+        return JOB_STATUS_PENDING
+
+    @property
+    def progress(self):
+        """
+        Return the percentage of objects processed.
+        """
+        if not self.total:
+            return 0
+        return int(float(self.processed) / self.total * 100)
+
+    def is_visible_to(self, user):
+        """
+        A job may be viewed only by the user who submitted it (or a superuser).
+        """
+        return user.is_superuser or (user.is_authenticated and user.pk == self.user_id)
+
+
+def enqueue_job(action, view, data, request, model):
+    """
+    Enqueue a background job to process the given data (CSV data or a list of PKs) using the given view. Returns the ID
+    of the new job.
+    """
+    # We must only import django_rq if background jobs are enabled.
+    from django_rq import get_queue
+
+    view_class = type(view)
+    job = get_queue('default').enqueue(
+        JOB_FUNC_NAMES[action],
+        '{}.{}'.format(view_class.__module__, view_class.__name__),
+        data,
+        request.user.pk,
+        request.id,
+        meta={
+            'action': action,
+            'user_id': request.user.pk,
+            'model': model._meta.label_lower,
+            'return_url': view.get_return_url(request),
+        },
+        job_timeout=JOB_TIMEOUT,
+        result_ttl=JOB_RESULT_TTL
+    )
+
+    return job.id
+
+
+def enqueue_import(view, csv_data, request):
+    """
+    Enqueue a background job to import CSV data using the given BulkImportView.
+    """
+    return enqueue_job(JOB_ACTION_IMPORT, view, csv_data, request, view.model_form._meta.model)
+
+
+def enqueue_delete(view, pk_list, request):
+    """
+    Enqueue a background job to delete the objects with the given PKs using the given BulkDeleteView.
+    """
+    return enqueue_job(JOB_ACTION_DELETE, view, list(pk_list), request, view.queryset.model)
+
+
+def enqueue_objectchanges(objectchanges):
+    """
+    Enqueue a background job to record the given ObjectChanges and enqueue any resulting webhooks.
+    """
+    from django_rq import get_queue
+
+    get_queue('default').enqueue(
+        'extras.jobs_worker.process_objectchanges',
+        objectchanges,
+        job_timeout=JOB_TIMEOUT
+    )
+
+
+def get_job(job_id):
+    """
+    Return the BackgroundJob with the given ID, or None if no such job exists (or it has expired).
+    """
+    from django_rq import get_queue
+
+    job = get_queue('default').fetch_job(job_id)
+    if job is None or job.func_name not in JOB_FUNC_NAMES.values():
+        return None
+
+    return BackgroundJob(job)
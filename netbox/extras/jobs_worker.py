@@ -0,0 +1,73 @@
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.utils.module_loading import import_string
+from django_rq import job
+from rq import get_current_job
+
+from extras.constants import JOB_PROGRESS_INTERVAL
+from extras.middleware import change_logging, write_deferred_objectchanges
+
+
+class JobRequest:
+    """
+    Represents the request which submitted a background job, to which all resulting changes are attributed.
+    """
+    def __init__(self, user, request_id):
+        self.user = user
+        self.id = request_id
+
+
+def _run_job(view_name, user_id, request_id, func):
+    """
+    Instantiate the named view and call func(view, progress) with change logging enabled. The number of objects
+    processed is published to the job's metadata as the job progresses.
+    """
+    current_job = get_current_job()
+
+    def publish_progress(processed, total):
+        if processed % JOB_PROGRESS_INTERVAL and processed != total:
+            return
+        current_job.meta.update({
+            'processed': processed,
+            'total': total,
+        })
+        current_job.save_meta()
+
+    view = import_string(view_name)()
+    request = JobRequest(User.objects.get(pk=user_id), request_id)
+
+    with change_logging(request):
+        return func(view, publish_progress)
+
+
+@job('default')
+def process_import(view_name, csv_data, user_id, request_id):
+    """
+    Import CSV data using the named BulkImportView.
+    """
+    return _run_job(view_name, user_id, request_id, lambda view, progress: view.import_csv(csv_data, progress))
+
+
+@job('default')
+def process_delete(view_name, pk_list, user_id, request_id):
+    """
+    Delete the objects with the given PKs using the named BulkDeleteView.
+    """
+    return _run_job(view_name, user_id, request_id, lambda view, progress: view.delete_objects(pk_list, progress))
+
+
+@job('default')
+def process_objectchanges(objectchanges):
+    """
+    Record ObjectChanges handed off by a request which exceeded CHANGELOG_INLINE_LIMIT.
+    """
+    write_deferred_objectchanges(objectchanges)
+
+
+@job('default')
+def purge_changelog():
+    """
+    Delete expired changes from the change log. This job may be scheduled (e.g. using rq-scheduler) as an alternative
+    to running the purge_changelog management command.
+    """
+    call_command('purge_changelog')
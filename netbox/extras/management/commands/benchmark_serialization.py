@@ -0,0 +1,91 @@
+import json
+import time
+
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers import serialize
+from django.db import connection
+
+from extras.models import CustomField, cache_custom_fields
+from utilities.api import QueryCounter
+from utilities.utils import serialize_object
+
+
+def legacy_serialize_object(obj):
+    """
+    Serialize an object as serialize_object() did previously: by encoding it using Django's JSON serializer and
+    decoding the result, then retrieving its custom fields (and their definitions) and tags.
+    """
+    data = json.loads(serialize('json', [obj]))[0]['fields']
+
+    if hasattr(obj, 'get_custom_fields'):
+        fields = CustomField.objects.filter(obj_type=ContentType.objects.get_for_model(obj))
+        values_dict = {cfv.field_id: cfv.value for cfv in obj.custom_field_values.all()}
+        data['custom_fields'] = {field.name: str(values_dict.get(field.pk)) for field in fields}
+
+    if hasattr(obj, 'tags'):
+        # Tags are sorted here only for comparison with serialize_object()
+        data['tags'] = sorted(tag.name for tag in obj.tags.all())
+
+    return data
+
+
+class Command(BaseCommand):
+    help = "Compare the speed of serializing objects for change logging against the previous implementation"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model', default='dcim.device',
+            help="The model of the objects to serialize, as <app_label>.<model> (default: dcim.device)"
+        )
+        parser.add_argument('--count', type=int, default=1000, help="Number of objects to serialize")
+        parser.add_argument(
+            '--prefetch', action='store_true',
+            help="Prefetch the tags and custom field values of the objects (as a bulk edit would)"
+        )
+
+    def run(self, label, objects, func):
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            start = time.monotonic()
+            results = [func(obj) for obj in objects]
+            elapsed = time.monotonic() - start
+
+        self.stdout.write("{:<8} {:.3f}s ({:.0f} objects/s), {} queries".format(
+            label, elapsed, len(objects) / elapsed if elapsed else 0, counter.count
+        ))
+        return results, elapsed
+
+    def handle(self, *args, **options):
+
+        try:
+            model = apps.get_model(options['model'])
+        except (LookupError, ValueError):
+            raise CommandError("Invalid model: {}".format(options['model']))
+
+        queryset = model.objects.all()
+        if options['prefetch']:
+            if hasattr(model, 'tags'):
+                queryset = queryset.prefetch_related('tags')
+            if hasattr(model, 'get_custom_fields'):
+                queryset = queryset.prefetch_related('custom_field_values')
+        objects = list(queryset[:options['count']])
+        if not objects:
+            raise CommandError("No {} objects exist to serialize".format(model._meta.verbose_name))
+
+        self.stdout.write("Serializing {} {} objects{}...".format(
+            len(objects), model._meta.verbose_name, " (prefetched)" if options['prefetch'] else ""
+        ))
+        legacy_results, legacy_elapsed = self.run('Legacy', objects, legacy_serialize_object)
+        with cache_custom_fields():
+            results, elapsed = self.run('Current', objects, serialize_object)
+
+        if elapsed:
+            self.stdout.write("Speedup: {:.1f}x".format(legacy_elapsed / elapsed))
+
+        mismatches = sum(1 for legacy, current in zip(legacy_results, results) if legacy != current)
+        if mismatches:
+            self.stdout.write(self.style.ERROR("{} objects were serialized differently".format(mismatches)))
+        else:
+            self.stdout.write(self.style.SUCCESS("All objects were serialized identically"))
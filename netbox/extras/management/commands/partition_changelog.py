@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from extras.partitioning import PARTITIONING_MIN_VERSION, maintain_partitions
+
+
+class Command(BaseCommand):
+    help = "Partition the change log table by month (PostgreSQL 11 or later) and create partitions for upcoming months"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months-ahead', type=int, default=3, help="Number of future months to create partitions for (default: 3)"
+        )
+
+    def handle(self, *args, **options):
+
+        if connection.vendor != 'postgresql' or connection.pg_version < PARTITIONING_MIN_VERSION:
+            raise CommandError("Partitioning the change log requires PostgreSQL 11 or later.")
+
+        created = maintain_partitions(months_ahead=options['months_ahead'])
+        for name in created:
+            self.stdout.write("\tCreated partition {}".format(name))
+
+        self.stdout.write(self.style.SUCCESS("Created {} partitions.".format(len(created))))
@@ -0,0 +1,53 @@
+from datetime import timedelta
+
+from cacheops import invalidate_model
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from prometheus_client import Counter
+
+from extras.models import ObjectChange
+from extras.partitioning import drop_expired_partitions
+
+changelog_purged = Counter('changelog_purged', 'Number of expired change records purged')
+
+
+class Command(BaseCommand):
+    help = "Delete logged changes older than CHANGELOG_RETENTION days"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000, help="Number of changes to delete per batch (default: 1000)"
+        )
+        parser.add_argument(
+            '--pause', type=float, default=1.0, help="Number of seconds to pause between batches (default: 1)"
+        )
+
+    def handle(self, *args, **options):
+
+        if not settings.CHANGELOG_RETENTION:
+            self.stdout.write("Change log retention is disabled (CHANGELOG_RETENTION = 0); nothing to purge.")
+            return
+
+        cutoff = timezone.now() - timedelta(days=settings.CHANGELOG_RETENTION)
+        self.stdout.write("Purging changes logged before {:%Y-%m-%d %H:%M:%S}...".format(cutoff))
+
+        def progress(count):
+            if options['verbosity'] > 1:
+                self.stdout.write("\t{} changes purged".format(count))
+
+        # If the change log has been partitioned, drop any partitions which have expired entirely
+        dropped_count = drop_expired_partitions(cutoff)
+        if dropped_count:
+            if settings.CACHEOPS_ENABLED:
+                invalidate_model(ObjectChange)
+            progress(dropped_count)
+
+        count = dropped_count + ObjectChange.objects.filter(time__lt=cutoff).delete_in_batches(
+            batch_size=options['batch_size'],
+            pause=options['pause'],
+            progress=lambda count: progress(dropped_count + count)
+        )
+        changelog_purged.inc(count)
+
+        self.stdout.write(self.style.SUCCESS("Purged {} changes.".format(count)))
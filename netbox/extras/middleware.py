@@ -1,28 +1,42 @@
-import random
 import threading
 import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import timedelta
 
 from django.conf import settings
+from django.db.models import Count
 from django.db.models.signals import post_delete, post_save
 from django.utils import timezone
-from django.utils.functional import curry
 from django_prometheus.models import model_deletes, model_inserts, model_updates
 
+from utilities.utils import dict_delta
 from .constants import (
     OBJECTCHANGE_ACTION_CREATE, OBJECTCHANGE_ACTION_DELETE, OBJECTCHANGE_ACTION_UPDATE,
 )
-from .models import ObjectChange
-from .signals import purge_changelog
-from .webhooks import enqueue_webhooks
+from .jobs import enqueue_objectchanges
+from .models import ObjectChange, cache_custom_fields
+from .signals import flush_changelog, purge_changelog
+from .webhooks import enqueue_webhooks, get_webhooks
 
 _thread_locals = threading.local()
 
 
+def _get_request():
+    """
+    Return the request to which changes made by the current thread are attributed, or None if change logging is not
+    enabled for the current thread.
+    """
+    return getattr(_thread_locals, 'request', None)
+
+
 def handle_changed_object(sender, instance, **kwargs):
     """
     Fires when an object is created or updated
     """
+    if _get_request() is None:
+        return
+
     # Queue the object and a new ObjectChange for processing once the request completes
     if hasattr(instance, 'to_objectchange'):
         action = OBJECTCHANGE_ACTION_CREATE if kwargs['created'] else OBJECTCHANGE_ACTION_UPDATE
@@ -32,24 +46,184 @@ def handle_changed_object(sender, instance, **kwargs):
         )
 
 
-def _handle_deleted_object(request, sender, instance, **kwargs):
+def handle_deleted_object(sender, instance, **kwargs):
     """
     Fires when an object is deleted
     """
-    # Record an Object Change
+    request = _get_request()
+    if request is None:
+        return
+
+    # Queue a new ObjectChange to be written along with any other changes. The object must be serialized now, before it
+    # (and any related objects) are actually deleted from the database.
     if hasattr(instance, 'to_objectchange'):
         objectchange = instance.to_objectchange(OBJECTCHANGE_ACTION_DELETE)
-        objectchange.user = request.user
-        objectchange.request_id = request.id
-        objectchange.save()
+        _thread_locals.changed_objects.append(
+            (instance, objectchange)
+        )
 
     # Enqueue webhooks
-    enqueue_webhooks(instance, request.user, request.id, OBJECTCHANGE_ACTION_DELETE)
+    _enqueue_webhooks(request, instance, OBJECTCHANGE_ACTION_DELETE)
 
     # Increment metric counters
     model_deletes.labels(instance._meta.model_name).inc()
 
 
+def _enqueue_webhooks(request, instance, action):
+    """
+    Enqueue any webhooks for the given object and action. The applicable webhooks are retrieved only once per model and
+    action while change logging is enabled.
+    """
+    key = (instance._meta.label_lower, action)
+    if key not in _thread_locals.webhooks:
+        _thread_locals.webhooks[key] = get_webhooks(instance.__class__, action)
+
+    enqueue_webhooks(instance, request.user, request.id, action, webhooks=_thread_locals.webhooks[key])
+
+
+def _encode_deltas(objectchanges):
+    """
+    If CHANGELOG_SNAPSHOT_INTERVAL is set, record the data of each updated or deleted object as a delta against the most
+    recent full snapshot of that object, so long as fewer than CHANGELOG_SNAPSHOT_INTERVAL changes (including the
+    snapshot itself) have been recorded since. Otherwise, the ObjectChange becomes a new snapshot. Snapshots are
+    retrieved using two queries per content type.
+    """
+    interval = settings.CHANGELOG_SNAPSHOT_INTERVAL
+    if interval < 2:
+        return
+
+    # Group the IDs of the changed objects by content type (created objects have no prior snapshot)
+    object_ids_by_type = OrderedDict()
+    for objectchange in objectchanges:
+        if objectchange.action != OBJECTCHANGE_ACTION_CREATE:
+            object_ids_by_type.setdefault(objectchange.changed_object_type_id, set()).add(
+                objectchange.changed_object_id
+            )
+
+    # Map each object to the PK and data of its most recent snapshot, and the number of deltas recorded since. Snapshots
+    # which have already expired are ignored, since they are about to be purged.
+    snapshots = {}
+    for content_type_id, object_ids in object_ids_by_type.items():
+        type_changes = ObjectChange.objects.filter(
+            changed_object_type_id=content_type_id, changed_object_id__in=object_ids
+        )
+        if settings.CHANGELOG_RETENTION:
+            type_changes = type_changes.filter(
+                time__gte=timezone.now() - timedelta(days=settings.CHANGELOG_RETENTION)
+            )
+        type_snapshots = {
+            object_id: [pk, data, 0] for object_id, pk, data in type_changes.filter(
+                snapshot_id__isnull=True
+            ).order_by(
+                'changed_object_id', '-time', '-pk'
+            ).distinct('changed_object_id').values_list('changed_object_id', 'pk', 'object_data')
+        }
+        if not type_snapshots:
+            continue
+        delta_counts = dict(type_changes.filter(
+            snapshot_id__in=[snapshot[0] for snapshot in type_snapshots.values()]
+        ).order_by().values('snapshot_id').annotate(count=Count('pk')).values_list('snapshot_id', 'count'))
+        for object_id, snapshot in type_snapshots.items():
+            snapshot[2] = delta_counts.get(snapshot[0], 0)
+            snapshots[(content_type_id, object_id)] = snapshot
+
+    for objectchange in objectchanges:
+        key = (objectchange.changed_object_type_id, objectchange.changed_object_id)
+        snapshot = snapshots.get(key)
+        if objectchange.action == OBJECTCHANGE_ACTION_CREATE or snapshot is None or snapshot[2] + 1 >= interval:
+            # Record a full snapshot. Any later changes to the object in this batch are also recorded in full, since
+            # the new snapshot can't be referenced until it has been saved.
+            snapshots[key] = None
+            continue
+        objectchange.snapshot_id = snapshot[0]
+        objectchange.object_data = dict_delta(snapshot[1], objectchange.object_data)
+        snapshot[2] += 1
+
+
+def _write_objectchanges(request):
+    """
+    Record all queued ObjectChanges using a single query, then enqueue webhooks and increment metric counters for each
+    object created or updated. If more changes are queued than CHANGELOG_INLINE_LIMIT, the remainder are handed off to
+    a background job. Returns True if any changes were written (or handed off).
+    """
+    changed_objects = _thread_locals.changed_objects
+    _thread_locals.changed_objects = []
+
+    if not changed_objects:
+        return False
+
+    for obj, objectchange in changed_objects:
+        objectchange.user = request.user
+        objectchange.user_name = request.user.username
+        objectchange.request_id = request.id
+
+        # Increment metric counters (deleted objects have been counted already)
+        if objectchange.action == OBJECTCHANGE_ACTION_CREATE:
+            model_inserts.labels(obj._meta.model_name).inc()
+        elif objectchange.action == OBJECTCHANGE_ACTION_UPDATE:
+            model_updates.labels(obj._meta.model_name).inc()
+
+    # Hand off any changes beyond the inline limit to a background job
+    limit = settings.CHANGELOG_INLINE_LIMIT
+    if limit and settings.BACKGROUND_JOBS_ENABLED and len(changed_objects) > limit:
+        enqueue_objectchanges([objectchange for _, objectchange in changed_objects[limit:]])
+        changed_objects = changed_objects[:limit]
+
+    objectchanges = [objectchange for _, objectchange in changed_objects]
+    _encode_deltas(objectchanges)
+    ObjectChange.objects.bulk_create(objectchanges)
+
+    # Enqueue webhooks (deleted objects have been acted upon already)
+    for obj, objectchange in changed_objects:
+        if objectchange.action != OBJECTCHANGE_ACTION_DELETE:
+            _enqueue_webhooks(request, obj, objectchange.action)
+
+    return True
+
+
+def write_deferred_objectchanges(objectchanges):
+    """
+    Record ObjectChanges handed off by a request (see _write_objectchanges()), then enqueue webhooks for each object
+    created or updated. Webhooks receive the current state of each object; any objects which have since been deleted are
+    skipped.
+    """
+    _encode_deltas(objectchanges)
+    ObjectChange.objects.bulk_create(objectchanges)
+
+    if not settings.WEBHOOKS_ENABLED:
+        return
+
+    # Group the changes to created and updated objects by content type, so that the objects can be retrieved in bulk
+    objectchanges_by_type = OrderedDict()
+    for objectchange in objectchanges:
+        if objectchange.action != OBJECTCHANGE_ACTION_DELETE:
+            objectchanges_by_type.setdefault(objectchange.changed_object_type, []).append(objectchange)
+
+    for content_type, type_objectchanges in objectchanges_by_type.items():
+        model = content_type.model_class()
+        instances = model.objects.in_bulk([objectchange.changed_object_id for objectchange in type_objectchanges])
+        webhooks = {}
+        for objectchange in type_objectchanges:
+            instance = instances.get(objectchange.changed_object_id)
+            if instance is None:
+                continue
+            if objectchange.action not in webhooks:
+                webhooks[objectchange.action] = get_webhooks(model, objectchange.action)
+            enqueue_webhooks(
+                instance, objectchange.user, objectchange.request_id, objectchange.action,
+                webhooks=webhooks[objectchange.action]
+            )
+
+
+def handle_flush_changelog(sender, **kwargs):
+    """
+    Write any queued ObjectChanges immediately (e.g. once a batch of deletions has been committed).
+    """
+    request = _get_request()
+    if request is not None:
+        _write_objectchanges(request)
+
+
 def purge_objectchange_cache(sender, **kwargs):
     """
     Delete any queued object changes waiting to be written.
@@ -57,6 +231,49 @@ def purge_objectchange_cache(sender, **kwargs):
     _thread_locals.changed_objects = []
 
 
+@contextmanager
+def change_logging(request):
+    """
+    Enable change logging for the current thread by connecting the appropriate signals to their receivers before code is
+    run. The receivers remain connected afterward: signals are shared by all threads, so disconnecting them would also
+    disable change logging for any other request in progress. Instead, each receiver acts on behalf of the request
+    being processed by the current thread (if any). On exit, an ObjectChange is recorded (and any webhooks are enqueued) for
+    each object created or updated. ObjectChanges for deleted objects are likewise written in bulk; long-running
+    operations may send the flush_changelog signal to write the changes queued so far. CustomFields are cached in the
+    meantime (see cache_custom_fields()).
+
+    :param request: The request (or any object having `user` and `id` attributes) to which changes are attributed
+    """
+    # Initialize an empty list to cache objects being saved, and the webhooks applicable to each model and action.
+    # Signals don't include the request context, so the receivers retrieve the current request from thread-local
+    # storage.
+    _thread_locals.changed_objects = []
+    _thread_locals.webhooks = {}
+    _thread_locals.request = request
+
+    # Connect our receivers to the post_save and post_delete signals.
+    post_save.connect(handle_changed_object, dispatch_uid='cache_changed_object')
+    post_delete.connect(handle_deleted_object, dispatch_uid='cache_deleted_object')
+
+    # Provide hooks for purging and flushing the change cache
+    purge_changelog.connect(purge_objectchange_cache)
+    flush_changelog.connect(handle_flush_changelog, dispatch_uid='flush_changelog')
+
+    try:
+
+        # The CustomFields applicable to each model are retrieved only once, for use both in serializing changed
+        # objects and in rendering webhook payloads
+        with cache_custom_fields():
+
+            yield
+
+            # Record any cached changes
+            _write_objectchanges(request)
+
+    finally:
+        _thread_locals.request = None
+
+
 class ObjectChangeMiddleware(object):
     """
     This middleware performs three functions in response to an object being created, updated, or deleted:
@@ -68,61 +285,21 @@ class ObjectChangeMiddleware(object):
     The post_save and post_delete signals are employed to catch object modifications, however changes are recorded a bit
     differently for each. Objects being saved are cached into thread-local storage for action *after* the response has
     completed. This ensures that serialization of the object is performed only after any related objects (e.g. tags)
-    have been created. Conversely, deletions are acted upon immediately, so that the serialized representation of the
-    object is recorded before it (and any related objects) are actually deleted from the database.
+    have been created. Conversely, deleted objects are serialized (and any webhooks enqueued) immediately, so that the
+    serialized representation of the object is captured before any related objects are deleted from the database. The
+    resulting ObjectChanges are written along with all others.
     """
     def __init__(self, get_response):
         self.get_response = get_response
 
     def __call__(self, request):
 
-        # Initialize an empty list to cache objects being saved.
-        _thread_locals.changed_objects = []
-
         # Assign a random unique ID to the request. This will be used to associate multiple object changes made during
         # the same request.
         request.id = uuid.uuid4()
 
-        # Signals don't include the request context, so we're currying it into the post_delete function ahead of time.
-        handle_deleted_object = curry(_handle_deleted_object, request)
-
-        # Connect our receivers to the post_save and post_delete signals.
-        post_save.connect(handle_changed_object, dispatch_uid='cache_changed_object')
-        post_delete.connect(handle_deleted_object, dispatch_uid='cache_deleted_object')
-
-        # Provide a hook for purging the change cache
-        purge_changelog.connect(purge_objectchange_cache)
-
-        # Process the request
-        response = self.get_response(request)
-
-        # If the change cache is empty, there's nothing more we need to do.
-        if not _thread_locals.changed_objects:
-            return response
-
-        # Create records for any cached objects that were created/updated.
-        for obj, objectchange in _thread_locals.changed_objects:
-
-            # Record the change
-            objectchange.user = request.user
-            objectchange.request_id = request.id
-            objectchange.save()
-
-            # Enqueue webhooks
-            enqueue_webhooks(obj, request.user, request.id, objectchange.action)
-
-            # Increment metric counters
-            if objectchange.action == OBJECTCHANGE_ACTION_CREATE:
-                model_inserts.labels(obj._meta.model_name).inc()
-            elif objectchange.action == OBJECTCHANGE_ACTION_UPDATE:
-                model_updates.labels(obj._meta.model_name).inc()
-
-        # Housekeeping: 1% chance of clearing out expired ObjectChanges. This applies only to requests which result in
-        # one or more changes being logged.
-        if settings.CHANGELOG_RETENTION and random.randint(1, 100) == 1:
-            cutoff = timezone.now() - timedelta(days=settings.CHANGELOG_RETENTION)
-            purged_count, _ = ObjectChange.objects.filter(
-                time__lt=cutoff
-            ).delete()
+        # Process the request with change logging enabled
+        with change_logging(request):
+            response = self.get_response(request)
 
         return response
@@ -0,0 +1,29 @@
+# Generated by Django 2.2.28 on 2026-10-18 06:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('extras', '0025_objectchange_time_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='objectchange',
+            index=models.Index(fields=['changed_object_type', 'changed_object_id', 'time'], name='extras_oc_changed_object_time'),
+        ),
+        migrations.AddIndex(
+            model_name='objectchange',
+            index=models.Index(fields=['related_object_type', 'related_object_id', 'time'], name='extras_oc_related_object_time'),
+        ),
+        migrations.AddIndex(
+            model_name='objectchange',
+            index=models.Index(fields=['request_id', 'time'], name='extras_oc_request_id_time'),
+        ),
+        migrations.AddIndex(
+            model_name='objectchange',
+            index=models.Index(fields=['user', 'time'], name='extras_oc_user_time'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('extras', '0026_objectchange_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='objectchange',
+            name='snapshot_id',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
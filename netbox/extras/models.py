@@ -1,5 +1,8 @@
+import threading
 from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import date
+from itertools import chain
 
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.fields import GenericForeignKey
@@ -8,18 +11,18 @@ from django.contrib.postgres.fields import JSONField
 from django.core.validators import ValidationError
 from django.db import models
 from django.db.models import F, Q
-from django.http import HttpResponse
-from django.template import Template, Context
+from django.http import StreamingHttpResponse
+from django.template import Context
 from django.urls import reverse
 import graphviz
-from jinja2 import Environment
 from taggit.models import TagBase, GenericTaggedItemBase
 
 from dcim.constants import CONNECTION_STATUS_CONNECTED
 from utilities.fields import ColorField
-from utilities.utils import deepmerge, foreground_color, model_names_to_filter_dict
+from utilities.utils import apply_dict_delta, deepmerge, foreground_color, model_names_to_filter_dict
 from .constants import *
-from .querysets import ConfigContextQuerySet
+from .querysets import ConfigContextQuerySet, ObjectChangeQuerySet
+from .utils import get_django_template, get_jinja2_template
 
 
 #
@@ -107,6 +110,40 @@ class Webhook(models.Model):
 # Custom fields
 #
 
+# CustomFields retrieved while caching is enabled (see cache_custom_fields())
+_custom_field_cache = threading.local()
+
+
+@contextmanager
+def cache_custom_fields():
+    """
+    Cache the CustomFields applicable to each model (see get_custom_fields_for_model()) until the context is exited.
+    Changes made to CustomFields in the meantime are not reflected.
+    """
+    previous = getattr(_custom_field_cache, 'fields', None)
+    if previous is None:
+        _custom_field_cache.fields = {}
+    try:
+        yield
+    finally:
+        _custom_field_cache.fields = previous
+
+
+def get_custom_fields_for_model(model):
+    """
+    Return a list of the CustomFields applicable to the given model (or instance). Within cache_custom_fields(), the
+    CustomFields (and their choices) are retrieved only once per model.
+    """
+    content_type = ContentType.objects.get_for_model(model)
+    cache = getattr(_custom_field_cache, 'fields', None)
+    if cache is None:
+        return list(CustomField.objects.filter(obj_type=content_type))
+
+    if content_type.pk not in cache:
+        cache[content_type.pk] = list(CustomField.objects.filter(obj_type=content_type).prefetch_related('choices'))
+    return cache[content_type.pk]
+
+
 class CustomFieldModel(models.Model):
     _cf = None
 
@@ -131,13 +168,17 @@ class CustomFieldModel(models.Model):
         """
 
         # Find all custom fields applicable to this type of object
-        content_type = ContentType.objects.get_for_model(self)
-        fields = CustomField.objects.filter(obj_type=content_type)
+        fields = get_custom_fields_for_model(self)
 
         # If the object exists, populate its custom fields with values
         if hasattr(self, 'pk'):
-            values = self.custom_field_values.all()
-            values_dict = {cfv.field_id: cfv.value for cfv in values}
+            fields_by_pk = {field.pk: field for field in fields}
+            values_dict = {}
+            for cfv in self.custom_field_values.all():
+                if cfv.field_id in fields_by_pk:
+                    # Avoid retrieving the CustomField of each value individually
+                    cfv.field = fields_by_pk[cfv.field_id]
+                    values_dict[cfv.field_id] = cfv.value
             return OrderedDict([(field, values_dict.get(field.pk)) for field in fields])
         else:
             return OrderedDict([(field, None) for field in fields])
@@ -233,6 +274,12 @@ class CustomField(models.Model):
             # Read date as YYYY-MM-DD
             return date(*[int(n) for n in serialized_value.split('-')])
         if self.type == CF_TYPE_SELECT:
+            # Use any prefetched choices to avoid a query
+            if 'choices' in getattr(self, '_prefetched_objects_cache', {}):
+                for choice in self.choices.all():
+                    if choice.pk == int(serialized_value):
+                        return choice
+                raise CustomFieldChoice.DoesNotExist
             return self.choices.get(pk=int(serialized_value))
         return serialized_value
 
@@ -400,13 +447,13 @@ class Graph(models.Model):
         return self.name
 
     def embed_url(self, obj):
-        template = Template(self.source)
+        template = get_django_template(self.source)
         return template.render(Context({'obj': obj}))
 
     def embed_link(self, obj):
         if self.link is None:
             return ''
-        template = Template(self.link)
+        template = get_django_template(self.link)
         return template.render(Context({'obj': obj}))
 
 
@@ -459,39 +506,60 @@ class ExportTemplate(models.Model):
     def __str__(self):
         return '{}: {}'.format(self.content_type, self.name)
 
-    def render(self, queryset):
+    def generate(self, queryset):
         """
-        Render the contents of the template.
+        Render the contents of the template incrementally, yielding the output in chunks. Jinja2 templates are rendered
+        as the queryset is iterated, so the output need not be held in memory in its entirety.
         """
         context = {
             'queryset': queryset
         }
 
         if self.template_language == TEMPLATE_LANGUAGE_DJANGO:
-            template = Template(self.template_code)
-            output = template.render(Context(context))
+            template = get_django_template(self.template_code)
+            output = [template.render(Context(context))]
 
         elif self.template_language == TEMPLATE_LANGUAGE_JINJA2:
-            template = Environment().from_string(source=self.template_code)
-            output = template.render(**context)
+            output = get_jinja2_template(self.template_code).generate(**context)
 
         else:
-            return None
-
-        # Replace CRLF-style line terminators
-        output = output.replace('\r\n', '\n')
+            return
+
+        # Replace CRLF-style line terminators (which may be split across chunks)
+        chunk = ''
+        for fragment in output:
+            chunk += fragment
+            if len(chunk) >= EXPORTTEMPLATE_CHUNK_SIZE:
+                if chunk.endswith('\r'):
+                    chunk, remainder = chunk[:-1], '\r'
+                else:
+                    remainder = ''
+                yield chunk.replace('\r\n', '\n')
+                chunk = remainder
+        if chunk:
+            yield chunk.replace('\r\n', '\n')
 
-        return output
+    def render(self, queryset):
+        """
+        Render the contents of the template.
+        """
+        if self.template_language not in (TEMPLATE_LANGUAGE_DJANGO, TEMPLATE_LANGUAGE_JINJA2):
+            return None
+        return ''.join(self.generate(queryset))
 
     def render_to_response(self, queryset):
         """
-        Render the template to an HTTP response, delivered as a named file attachment
+        Render the template to an HTTP response, delivered as a named file attachment. The response is streamed as the
+        template is rendered.
         """
-        output = self.render(queryset)
+        output = self.generate(queryset)
         mime_type = 'text/plain' if not self.mime_type else self.mime_type
 
+        # Render the first chunk before returning the response so that any error in the template can be reported
+        output = chain([next(output, '')], output)
+
         # Build the response
-        response = HttpResponse(output, content_type=mime_type)
+        response = StreamingHttpResponse(output, content_type=mime_type)
         filename = 'netbox_{}{}'.format(
             queryset.model._meta.verbose_name_plural,
             '.{}'.format(self.file_extension) if self.file_extension else ''
@@ -884,6 +952,10 @@ class ObjectChange(models.Model):
     Record a change to an object and the user account associated with that change. A change record may optionally
     indicate an object related to the one being changed. For example, a change to an interface may also indicate the
     parent device. This will ensure changes made to component models appear in the parent model's changelog.
+
+    The object's data is normally recorded in full. If CHANGELOG_SNAPSHOT_INTERVAL is set, it may instead be recorded as
+    a delta against the most recent full snapshot of the object (identified by snapshot_id); use get_object_data() to
+    retrieve the complete data in either case.
     """
     time = models.DateTimeField(
         auto_now_add=True,
@@ -939,6 +1011,13 @@ class ObjectChange(models.Model):
     object_data = JSONField(
         editable=False
     )
+    snapshot_id = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+        editable=False
+    )
+
+    objects = ObjectChangeQuerySet.as_manager()
 
     csv_headers = [
         'time', 'user', 'user_name', 'request_id', 'action', 'changed_object_type', 'changed_object_id',
@@ -947,6 +1026,12 @@ class ObjectChange(models.Model):
 
     class Meta:
         ordering = ['-time']
+        indexes = [
+            models.Index(fields=['changed_object_type', 'changed_object_id', 'time'], name='extras_oc_changed_object_time'),
+            models.Index(fields=['related_object_type', 'related_object_id', 'time'], name='extras_oc_related_object_time'),
+            models.Index(fields=['request_id', 'time'], name='extras_oc_request_id_time'),
+            models.Index(fields=['user', 'time'], name='extras_oc_user_time'),
+        ]
 
     def __str__(self):
         return '{} {} {} by {}'.format(
@@ -969,6 +1054,41 @@ class ObjectChange(models.Model):
     def get_absolute_url(self):
         return reverse('extras:objectchange', args=[self.pk])
 
+    @property
+    def is_delta(self):
+        return self.snapshot_id is not None
+
+    def get_object_data(self):
+        """
+        Return the complete data of the changed object, applying the delta (if any) to the snapshot against which it was
+        recorded. Returns None if the snapshot has since been purged from the change log.
+        """
+        if self.snapshot_id is None:
+            return self.object_data
+
+        if not hasattr(self, '_snapshot_data'):
+            self._snapshot_data = ObjectChange.objects.filter(
+                pk=self.snapshot_id
+            ).values_list('object_data', flat=True).first()
+        if self._snapshot_data is None:
+            return None
+
+        return apply_dict_delta(self._snapshot_data, self.object_data)
+
+    @classmethod
+    def prefetch_snapshots(cls, objectchanges):
+        """
+        Retrieve the snapshots of all the given ObjectChanges which were recorded as deltas using a single query.
+        """
+        pk_list = {oc.snapshot_id for oc in objectchanges if oc.snapshot_id is not None}
+        if not pk_list:
+            return
+
+        snapshots = dict(cls.objects.filter(pk__in=pk_list).values_list('pk', 'object_data'))
+        for oc in objectchanges:
+            if oc.snapshot_id is not None:
+                oc._snapshot_data = snapshots.get(oc.snapshot_id)
+
     def to_csv(self):
         return (
             self.time,
@@ -981,7 +1101,7 @@ class ObjectChange(models.Model):
             self.related_object_type,
             self.related_object_id,
             self.object_repr,
-            self.object_data,
+            self.get_object_data(),
         )
 
 
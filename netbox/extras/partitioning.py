@@ -0,0 +1,166 @@
+"""
+Optional monthly partitioning of the change log table (requires PostgreSQL 11 or later). Once the table has been
+partitioned, queries filtered by time scan only the relevant partitions, and expired changes can be purged by dropping
+entire partitions rather than deleting individual rows.
+"""
+from datetime import datetime
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import ObjectChange
+
+# The minimum PostgreSQL version which supports partitioning the change log table
+PARTITIONING_MIN_VERSION = 110000
+
+TABLE = ObjectChange._meta.db_table
+DEFAULT_PARTITION = '{}_default'.format(TABLE)
+
+
+def _month_start(dt, offset=0):
+    """
+    Return the start of the month containing the given datetime (in UTC), plus the given number of months.
+    """
+    month = dt.year * 12 + dt.month - 1 + offset
+    return datetime(month // 12, month % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def _partition_name(month_start):
+    return '{}_y{:04d}m{:02d}'.format(TABLE, month_start.year, month_start.month)
+
+
+def is_partitioned(cursor):
+    cursor.execute(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass)", [TABLE]
+    )
+    return cursor.fetchone()[0]
+
+
+def get_partitions(cursor):
+    """
+    Return a list of (name, start, end) for each monthly partition of the change log table, oldest first.
+    """
+    cursor.execute(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = %s::regclass",
+        [TABLE]
+    )
+    partitions = []
+    for name, in cursor.fetchall():
+        if name == DEFAULT_PARTITION:
+            continue
+        start = datetime.strptime(name[len(TABLE):], '_y%Ym%m').replace(tzinfo=timezone.utc)
+        partitions.append((name, start, _month_start(start, 1)))
+    return sorted(partitions, key=lambda p: p[1])
+
+
+def create_partitions(cursor, start, end):
+    """
+    Create any missing monthly partitions for the months from start up to and including end. Returns the names of the
+    partitions created.
+    """
+    existing = {name for name, _, _ in get_partitions(cursor)}
+    created = []
+    month_start = _month_start(start)
+    while month_start <= end:
+        name = _partition_name(month_start)
+        if name not in existing:
+            cursor.execute(
+                "CREATE TABLE {} PARTITION OF {} FOR VALUES FROM (%s) TO (%s)".format(name, TABLE),
+                [month_start, _month_start(month_start, 1)]
+            )
+            created.append(name)
+        month_start = _month_start(month_start, 1)
+    return created
+
+
+def partition_table(cursor, months_ahead):
+    """
+    Convert the change log table into a table partitioned by month, copying all existing changes. Indexes and foreign
+    key constraints are recreated on the new table, and its primary key is extended to include the time (as required of
+    a partitioned table).
+    """
+    old_table = '{}_old'.format(TABLE)
+
+    # Check any deferred constraints now, since the table can't be altered while it has pending trigger events
+    cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+    cursor.execute("LOCK TABLE {} IN ACCESS EXCLUSIVE MODE".format(TABLE))
+
+    # Record the definitions of the existing indexes (excluding the primary key) and foreign key constraints
+    cursor.execute(
+        "SELECT pg_get_indexdef(i.indexrelid) FROM pg_index i WHERE i.indrelid = %s::regclass AND NOT i.indisprimary",
+        [TABLE]
+    )
+    index_defs = [row[0] for row in cursor.fetchall()]
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'",
+        [TABLE]
+    )
+    constraint_defs = cursor.fetchall()
+    cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [TABLE])
+    sequence = cursor.fetchone()[0]
+
+    # Create the partitioned table in place of the original
+    cursor.execute("ALTER TABLE {} RENAME TO {}".format(TABLE, old_table))
+    cursor.execute(
+        "CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS INCLUDING CONSTRAINTS, PRIMARY KEY (id, time)) "
+        "PARTITION BY RANGE (time)".format(TABLE, old_table)
+    )
+    cursor.execute("ALTER SEQUENCE {} OWNED BY {}.id".format(sequence, TABLE))
+
+    # Create partitions spanning all existing changes, plus a default partition for any which fall outside them
+    cursor.execute("SELECT MIN(time) FROM {}".format(old_table))
+    oldest = cursor.fetchone()[0] or timezone.now()
+    create_partitions(cursor, oldest, _month_start(timezone.now(), months_ahead))
+    cursor.execute("CREATE TABLE {} PARTITION OF {} DEFAULT".format(DEFAULT_PARTITION, TABLE))
+
+    # Copy all changes to the new table and drop the original
+    cursor.execute("INSERT INTO {} SELECT * FROM {}".format(TABLE, old_table))
+    cursor.execute("DROP TABLE {}".format(old_table))
+
+    # Recreate indexes (which cascade to each partition) and foreign key constraints
+    for index_def in index_defs:
+        cursor.execute(index_def.replace(' ON {} '.format(old_table), ' ON {} '.format(TABLE)).replace(
+            ' ON public.{} '.format(old_table), ' ON public.{} '.format(TABLE)
+        ))
+    for name, constraint_def in constraint_defs:
+        cursor.execute("ALTER TABLE {} ADD CONSTRAINT {} {}".format(TABLE, name, constraint_def))
+
+
+def maintain_partitions(months_ahead=3):
+    """
+    Partition the change log table by month (if it has not been already), and ensure that partitions exist for the
+    current month and the given number of months ahead. Returns the names of the partitions created.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        if not is_partitioned(cursor):
+            partition_table(cursor, months_ahead)
+            return [name for name, _, _ in get_partitions(cursor)]
+        return create_partitions(cursor, timezone.now(), _month_start(timezone.now(), months_ahead))
+
+
+def drop_expired_partitions(cutoff):
+    """
+    Drop all monthly partitions of the change log table which contain only changes older than the cutoff time. Returns
+    the number of changes dropped. Does nothing if the table has not been partitioned. Deltas in other partitions which
+    depend upon snapshots being dropped are rebased first.
+    """
+    if connection.vendor != 'postgresql' or connection.pg_version < PARTITIONING_MIN_VERSION:
+        return 0
+
+    dropped_count = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        if not is_partitioned(cursor):
+            return 0
+        expired_partitions = [(name, end) for name, start, end in get_partitions(cursor) if end <= cutoff]
+        if not expired_partitions:
+            return 0
+
+        # Rebase any surviving deltas recorded against snapshots in the expired partitions
+        ObjectChange.objects.filter(time__lt=expired_partitions[-1][1]).rebase_dependent_deltas()
+
+        for name, end in expired_partitions:
+            cursor.execute("SELECT COUNT(*) FROM {}".format(name))
+            dropped_count += cursor.fetchone()[0]
+            cursor.execute("DROP TABLE {}".format(name))
+
+    return dropped_count
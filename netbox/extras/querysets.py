@@ -1,21 +1,62 @@
+import time
 from collections import OrderedDict
 
-from django.db.models import Q, QuerySet
+from cacheops import invalidate_model
+from django.conf import settings
+from django.db.models import Q, QuerySet, prefetch_related_objects
+
+from utilities.utils import apply_dict_delta, dict_delta
 
 
 class CustomFieldQueryset:
     """
-    Annotate custom fields on objects within a QuerySet.
+    Annotate custom fields on objects within a QuerySet. Iterating over a CustomFieldQueryset retrieves objects in
+    chunks using a server-side cursor, applying the QuerySet's prefetch_related() lookups (and retrieving custom field
+    values) for each chunk in turn, so that memory use does not grow with the size of the QuerySet. All other
+    attributes are passed through to the underlying QuerySet.
     """
+    chunk_size = 1000
+
     def __init__(self, queryset, custom_fields):
         self.queryset = queryset
         self.model = queryset.model
         self.custom_fields = custom_fields
 
+    def __getattr__(self, name):
+        return getattr(self.queryset, name)
+
+    def __len__(self):
+        return self.queryset.count()
+
     def __iter__(self):
-        for obj in self.queryset:
-            values_dict = {cfv.field_id: cfv.value for cfv in obj.custom_field_values.all()}
+        lookups = list(self.queryset._prefetch_related_lookups)
+        if self.custom_fields and 'custom_field_values' not in lookups:
+            lookups.append('custom_field_values')
+
+        chunk = []
+        for obj in self.queryset.prefetch_related(None).iterator(chunk_size=self.chunk_size):
+            chunk.append(obj)
+            if len(chunk) >= self.chunk_size:
+                yield from self._annotate_chunk(chunk, lookups)
+                chunk = []
+        if chunk:
+            yield from self._annotate_chunk(chunk, lookups)
+
+    def _annotate_chunk(self, chunk, lookups):
+        if lookups:
+            prefetch_related_objects(chunk, *lookups)
+        fields = {field.pk: field for field in self.custom_fields}
+        for obj in chunk:
+            values_dict = {}
+            if fields:
+                for cfv in obj.custom_field_values.all():
+                    if cfv.field_id in fields:
+                        # Avoid retrieving the CustomField of each value individually
+                        cfv.field = fields[cfv.field_id]
+                        values_dict[cfv.field_id] = cfv.value
             obj.custom_fields = OrderedDict([(field, values_dict.get(field.pk)) for field in self.custom_fields])
+            # Populate the cache used by CustomFieldModel.cf
+            obj._cf = {field.name: value for field, value in obj.custom_fields.items()}
             yield obj
 
 
@@ -48,3 +89,86 @@ class ConfigContextQuerySet(QuerySet):
             Q(tenants=obj.tenant) | Q(tenants=None),
             is_active=True,
         ).order_by('weight', 'name')
+
+
+class ObjectChangeQuerySet(QuerySet):
+
+    def rebase_dependent_deltas(self, batch_size=1000):
+        """
+        Prepare the ObjectChanges in the QuerySet for deletion by rebasing any deltas outside the QuerySet which were
+        recorded against snapshots within it (see CHANGELOG_SNAPSHOT_INTERVAL). For each such snapshot, the oldest
+        dependent delta becomes a full snapshot, and any others are recorded as deltas against it instead. Returns the
+        number of ObjectChanges rebased.
+        """
+        dependents = self.model.objects.filter(
+            snapshot_id__in=self.values('pk')
+        ).exclude(
+            pk__in=self.values('pk')
+        ).order_by('time', 'pk')
+
+        # Map the PK of each snapshot being deleted to its data, and the PK and data of the ObjectChange replacing it
+        snapshots = {}
+        rebased_count = 0
+
+        def rebase(chunk):
+            snapshot_data = dict(self.model.objects.filter(
+                pk__in={oc.snapshot_id for oc in chunk if oc.snapshot_id not in snapshots}
+            ).values_list('pk', 'object_data'))
+            for oc in chunk:
+                if oc.snapshot_id in snapshots:
+                    original_data, pk, data = snapshots[oc.snapshot_id]
+                    oc.object_data = dict_delta(data, apply_dict_delta(original_data, oc.object_data))
+                    oc.snapshot_id = pk
+                elif oc.snapshot_id in snapshot_data:
+                    original_data = snapshot_data[oc.snapshot_id]
+                    data = apply_dict_delta(original_data, oc.object_data)
+                    snapshots[oc.snapshot_id] = (original_data, oc.pk, data)
+                    oc.object_data = data
+                    oc.snapshot_id = None
+            self.model.objects.bulk_update(chunk, ['snapshot_id', 'object_data'])
+
+        chunk = []
+        for oc in dependents.only('pk', 'time', 'snapshot_id', 'object_data').iterator(chunk_size=batch_size):
+            chunk.append(oc)
+            if len(chunk) >= batch_size:
+                rebase(chunk)
+                rebased_count += len(chunk)
+                chunk = []
+        if chunk:
+            rebase(chunk)
+            rebased_count += len(chunk)
+
+        return rebased_count
+
+    def delete_in_batches(self, batch_size, pause=0, progress=None):
+        """
+        Delete the ObjectChanges in the QuerySet (oldest first) in batches of at most batch_size, pausing for the given
+        number of seconds between batches. Each batch is deleted using a single query without loading the objects, so
+        that no lock is held for long. Any deltas outside the QuerySet which depend upon snapshots within it are first
+        rebased (see rebase_dependent_deltas()). Returns the number of ObjectChanges deleted.
+
+        :param progress: An optional callable which is passed the running total after each batch is deleted
+        """
+        self.rebase_dependent_deltas(batch_size)
+
+        deleted_count = 0
+
+        while True:
+            pk_list = list(self.order_by('time').values_list('pk', flat=True)[:batch_size])
+            if not pk_list:
+                break
+
+            # ObjectChanges have no dependent objects, so no deletion signals or cascades are required
+            deleted_count += self.model.objects.filter(pk__in=pk_list)._raw_delete(self.db)
+            if progress is not None:
+                progress(deleted_count)
+
+            if len(pk_list) < batch_size:
+                break
+            time.sleep(pause)
+
+        # Cached queries are not invalidated by a raw deletion
+        if deleted_count and settings.CACHEOPS_ENABLED:
+            invalidate_model(self.model)
+
+        return deleted_count
@@ -32,3 +32,4 @@ cache_invalidated.connect(cache_invalidated_collector)
 #
 
 purge_changelog = Signal()
+flush_changelog = Signal()
@@ -3,9 +3,8 @@ from collections import OrderedDict
 from django import template
 from django.contrib.contenttypes.models import ContentType
 from django.utils.safestring import mark_safe
-from jinja2 import Environment
-
 from extras.models import CustomLink
+from extras.utils import render_jinja2
 
 
 register = template.Library()
@@ -33,7 +32,7 @@ def custom_links(obj):
     context = {
         'obj': obj,
     }
-    template_code = ''
+    links_html = ''
     group_names = OrderedDict()
 
     for cl in custom_links:
@@ -46,11 +45,11 @@ def custom_links(obj):
 
         # Add non-grouped links
         else:
-            text_rendered = Environment().from_string(source=cl.text).render(**context)
+            text_rendered = render_jinja2(cl.text, context)
             if text_rendered:
                 link_target = ' target="_blank"' if cl.new_window else ''
-                template_code += LINK_BUTTON.format(
-                    cl.url, link_target, cl.button_class, text_rendered
+                links_html += LINK_BUTTON.format(
+                    render_jinja2(cl.url, context), link_target, cl.button_class, text_rendered
                 )
 
     # Add grouped links to template
@@ -59,19 +58,16 @@ def custom_links(obj):
         links_rendered = []
 
         for cl in links:
-            text_rendered = Environment().from_string(source=cl.text).render(**context)
+            text_rendered = render_jinja2(cl.text, context)
             if text_rendered:
                 link_target = ' target="_blank"' if cl.new_window else ''
                 links_rendered.append(
-                    GROUP_LINK.format(cl.url, link_target, cl.text)
+                    GROUP_LINK.format(render_jinja2(cl.url, context), link_target, text_rendered)
                 )
 
         if links_rendered:
-            template_code += GROUP_BUTTON.format(
+            links_html += GROUP_BUTTON.format(
                 links[0].button_class, group, ''.join(links_rendered)
             )
 
-    # Render template
-    rendered = Environment().from_string(source=template_code).render(**context)
-
-    return mark_safe(rendered)
+    return mark_safe(links_html)
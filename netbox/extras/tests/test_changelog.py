@@ -1,10 +1,23 @@
+import uuid
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 
 from dcim.models import Site
 from extras.constants import OBJECTCHANGE_ACTION_CREATE, OBJECTCHANGE_ACTION_UPDATE, OBJECTCHANGE_ACTION_DELETE
+from extras.middleware import change_logging, write_deferred_objectchanges
 from extras.models import ObjectChange
-from utilities.testing import APITestCase
+from extras.partitioning import drop_expired_partitions, get_partitions, is_partitioned, maintain_partitions
+from utilities.testing import APITestCase, create_test_user
 
 
 class ChangeLogTest(APITestCase):
@@ -70,3 +83,316 @@ class ChangeLogTest(APITestCase):
         self.assertEqual(oc.changed_object, None)
         self.assertEqual(oc.object_repr, site.name)
         self.assertEqual(oc.action, OBJECTCHANGE_ACTION_DELETE)
+
+
+class ChangeLogRequest:
+
+    def __init__(self, user):
+        self.user = user
+        self.id = uuid.uuid4()
+
+
+class ChangeLogSnapshotIntervalTest(APITestCase):
+
+    def setUp(self):
+
+        super().setUp()
+
+        self.request = ChangeLogRequest(self.user)
+        with change_logging(self.request):
+            self.site = Site.objects.create(name='Site 1', slug='site-1')
+
+    def update_site(self, **attrs):
+        with change_logging(self.request):
+            for attr, value in attrs.items():
+                setattr(self.site, attr, value)
+            self.site.save()
+
+    @override_settings(CHANGELOG_SNAPSHOT_INTERVAL=3)
+    def test_snapshot_interval(self):
+
+        self.update_site(facility='Facility 1')
+        self.update_site(asn=65001)
+        self.update_site(facility='')
+
+        snapshot, delta1, delta2, snapshot2 = ObjectChange.objects.order_by('time', 'pk')
+
+        # Every third change records a full snapshot; the changes in between record only a delta
+        self.assertFalse(snapshot.is_delta)
+        self.assertEqual(delta1.snapshot_id, snapshot.pk)
+        self.assertEqual({path[0] for path, value in delta1.object_data['set']}, {'facility', 'last_updated'})
+        self.assertEqual(delta1.object_data['unset'], [])
+        self.assertEqual(delta2.snapshot_id, snapshot.pk)
+        self.assertFalse(snapshot2.is_delta)
+        self.assertEqual(snapshot2.object_data['facility'], '')
+
+        # The complete object data is reconstructed from the snapshot
+        self.assertEqual(delta1.get_object_data()['facility'], 'Facility 1')
+        self.assertEqual(delta1.get_object_data()['name'], 'Site 1')
+        self.assertEqual(delta2.get_object_data()['facility'], 'Facility 1')
+        self.assertEqual(delta2.get_object_data()['asn'], 65001)
+
+    @override_settings(CHANGELOG_SNAPSHOT_INTERVAL=0)
+    def test_snapshot_interval_disabled(self):
+
+        self.update_site(facility='Facility 1')
+
+        self.assertFalse(ObjectChange.objects.filter(snapshot_id__isnull=False).exists())
+        self.assertEqual(ObjectChange.objects.first().object_data['facility'], 'Facility 1')
+
+    @override_settings(CHANGELOG_SNAPSHOT_INTERVAL=10)
+    def test_snapshot_purged(self):
+
+        self.update_site(facility='Facility 1')
+        ObjectChange.objects.filter(snapshot_id__isnull=True).delete()
+
+        self.assertIsNone(ObjectChange.objects.get().get_object_data())
+
+    def age_snapshot(self):
+        ObjectChange.objects.filter(snapshot_id__isnull=True).update(time=timezone.now() - timedelta(days=200))
+
+    @override_settings(CHANGELOG_SNAPSHOT_INTERVAL=10, CHANGELOG_RETENTION=90)
+    def test_purge_snapshot(self):
+
+        self.update_site(facility='Facility 1')
+        self.update_site(asn=65001)
+        self.update_site(facility='Facility 2')
+        self.age_snapshot()
+        expected_data = [oc.get_object_data() for oc in ObjectChange.objects.filter(snapshot_id__isnull=False)]
+
+        call_command('purge_changelog', pause=0, stdout=StringIO())
+
+        # The oldest surviving delta becomes a full snapshot, against which the others are rebased
+        objectchanges = list(ObjectChange.objects.order_by('time', 'pk'))
+        self.assertEqual(len(objectchanges), 3)
+        self.assertFalse(objectchanges[0].is_delta)
+        self.assertEqual(objectchanges[1].snapshot_id, objectchanges[0].pk)
+        self.assertEqual(objectchanges[2].snapshot_id, objectchanges[0].pk)
+        self.assertEqual(
+            sorted([oc.get_object_data() for oc in objectchanges], key=str),
+            sorted(expected_data, key=str)
+        )
+        self.assertEqual(objectchanges[2].get_object_data()['facility'], 'Facility 2')
+
+        # Further changes are recorded against the new snapshot
+        self.update_site(asn=65002)
+        self.assertEqual(ObjectChange.objects.order_by('time', 'pk').last().snapshot_id, objectchanges[0].pk)
+
+    @override_settings(CHANGELOG_SNAPSHOT_INTERVAL=10, CHANGELOG_RETENTION=90)
+    def test_expired_snapshot(self):
+
+        self.age_snapshot()
+        self.update_site(facility='Facility 1')
+
+        # An expired snapshot is not used as the basis of a delta
+        self.assertFalse(ObjectChange.objects.order_by('time', 'pk').last().is_delta)
+
+    @override_settings(CHANGELOG_SNAPSHOT_INTERVAL=10)
+    def test_drop_partition_snapshot(self):
+
+        self.update_site(facility='Facility 1')
+        self.age_snapshot()
+
+        maintain_partitions()
+        drop_expired_partitions(timezone.now() - timedelta(days=90))
+
+        objectchange = ObjectChange.objects.get()
+        self.assertFalse(objectchange.is_delta)
+        self.assertEqual(objectchange.get_object_data()['facility'], 'Facility 1')
+
+    @override_settings(CHANGELOG_SNAPSHOT_INTERVAL=10)
+    def test_get_objectchanges(self):
+
+        self.update_site(facility='Facility 1')
+        self.update_site(asn=65001)
+
+        url = reverse('extras-api:objectchange-list')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, **self.header)
+
+        # The snapshot is retrieved once for all deltas
+        snapshot_queries = [q for q in queries if '"extras_objectchange"."id" IN' in q['sql']]
+        self.assertEqual(len(snapshot_queries), 1)
+
+        self.assertEqual(response.data['count'], 3)
+        for result in response.data['results']:
+            self.assertEqual(result['object_data']['name'], 'Site 1')
+        self.assertEqual(response.data['results'][0]['object_data']['asn'], 65001)
+        self.assertEqual(response.data['results'][0]['object_data']['facility'], 'Facility 1')
+
+    @override_settings(CHANGELOG_SNAPSHOT_INTERVAL=10)
+    def test_view_objectchange(self):
+
+        self.update_site(facility='Facility 1')
+        self.client.force_login(self.user)
+
+        response = self.client.get(ObjectChange.objects.first().get_absolute_url())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Changes Since')
+
+
+class ChangeLogInlineLimitTest(TestCase):
+
+    def setUp(self):
+
+        self.request = ChangeLogRequest(create_test_user())
+
+    def create_sites(self, count):
+        with change_logging(self.request):
+            for i in range(1, count + 1):
+                Site.objects.create(name='Site {}'.format(i), slug='site-{}'.format(i))
+
+    @patch('extras.middleware.get_webhooks', return_value=[])
+    def test_bulk_write(self, get_webhooks):
+
+        with CaptureQueriesContext(connection) as queries:
+            self.create_sites(5)
+
+        # The changes are recorded using a single query, and webhooks are retrieved once per model and action
+        inserts = [q for q in queries if q['sql'].startswith('INSERT INTO "extras_objectchange"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(ObjectChange.objects.count(), 5)
+        get_webhooks.assert_called_once_with(Site, OBJECTCHANGE_ACTION_CREATE)
+
+    @override_settings(CHANGELOG_INLINE_LIMIT=2, BACKGROUND_JOBS_ENABLED=True)
+    @patch('extras.middleware.enqueue_objectchanges')
+    def test_inline_limit(self, enqueue_objectchanges):
+
+        self.create_sites(5)
+
+        # Only the first two changes are recorded within the request
+        self.assertEqual(ObjectChange.objects.count(), 2)
+        self.assertEqual(enqueue_objectchanges.call_count, 1)
+        deferred = enqueue_objectchanges.call_args[0][0]
+        self.assertEqual([oc.object_repr for oc in deferred], ['Site 3', 'Site 4', 'Site 5'])
+        self.assertTrue(all(oc.request_id == self.request.id for oc in deferred))
+
+        # The remaining changes are recorded by the background job
+        write_deferred_objectchanges(deferred)
+        self.assertEqual(ObjectChange.objects.filter(request_id=self.request.id).count(), 5)
+
+    @override_settings(CHANGELOG_INLINE_LIMIT=10, BACKGROUND_JOBS_ENABLED=True)
+    @patch('extras.middleware.enqueue_objectchanges')
+    def test_within_inline_limit(self, enqueue_objectchanges):
+
+        self.create_sites(5)
+
+        self.assertEqual(ObjectChange.objects.count(), 5)
+        self.assertFalse(enqueue_objectchanges.called)
+
+    @override_settings(CHANGELOG_INLINE_LIMIT=2, BACKGROUND_JOBS_ENABLED=False)
+    @patch('extras.middleware.enqueue_objectchanges')
+    def test_inline_limit_without_background_jobs(self, enqueue_objectchanges):
+
+        self.create_sites(5)
+
+        self.assertEqual(ObjectChange.objects.count(), 5)
+        self.assertFalse(enqueue_objectchanges.called)
+
+
+class PurgeChangeLogTest(TestCase):
+
+    def setUp(self):
+
+        site = Site.objects.create(name='Site 1', slug='site-1')
+        for i in range(7):
+            ObjectChange.objects.create(
+                user_name='testuser', request_id=uuid.uuid4(), action=OBJECTCHANGE_ACTION_UPDATE,
+                changed_object_type=ContentType.objects.get_for_model(Site), changed_object_id=site.pk,
+                object_repr=site.name, object_data={}
+            )
+
+        # Age five of the changes beyond the retention period
+        self.expired_pks = list(ObjectChange.objects.order_by('pk').values_list('pk', flat=True)[:5])
+        ObjectChange.objects.filter(pk__in=self.expired_pks).update(time=timezone.now() - timedelta(days=100))
+
+    def test_delete_in_batches(self):
+
+        progress = []
+        count = ObjectChange.objects.filter(pk__in=self.expired_pks).delete_in_batches(
+            batch_size=2, progress=progress.append
+        )
+
+        self.assertEqual(count, 5)
+        self.assertEqual(progress, [2, 4, 5])
+        self.assertEqual(ObjectChange.objects.count(), 2)
+
+    @override_settings(CHANGELOG_RETENTION=90)
+    def test_purge_changelog(self):
+
+        call_command('purge_changelog', batch_size=2, pause=0, stdout=StringIO())
+
+        self.assertEqual(ObjectChange.objects.count(), 2)
+        self.assertFalse(ObjectChange.objects.filter(pk__in=self.expired_pks).exists())
+
+    @override_settings(CHANGELOG_RETENTION=0)
+    def test_purge_changelog_retention_disabled(self):
+
+        call_command('purge_changelog', pause=0, stdout=StringIO())
+
+        self.assertEqual(ObjectChange.objects.count(), 7)
+
+
+class PartitionChangeLogTest(TestCase):
+
+    def setUp(self):
+
+        site = Site.objects.create(name='Site 1', slug='site-1')
+        for days in (0, 0, 100, 100, 200):
+            objectchange = ObjectChange.objects.create(
+                user_name='testuser', request_id=uuid.uuid4(), action=OBJECTCHANGE_ACTION_UPDATE,
+                changed_object_type=ContentType.objects.get_for_model(Site), changed_object_id=site.pk,
+                object_repr=site.name, object_data={}
+            )
+            ObjectChange.objects.filter(pk=objectchange.pk).update(time=timezone.now() - timedelta(days=days))
+
+    def test_maintain_partitions(self):
+
+        maintain_partitions(months_ahead=2)
+
+        with connection.cursor() as cursor:
+            self.assertTrue(is_partitioned(cursor))
+            partitions = get_partitions(cursor)
+            cursor.execute("SELECT indexname FROM pg_indexes WHERE tablename = 'extras_objectchange'")
+            indexes = [row[0] for row in cursor.fetchall()]
+
+        # Indexes have been recreated on the partitioned table
+        self.assertIn('extras_oc_changed_object_time', indexes)
+
+        # Partitions span the oldest change through two months from now
+        self.assertLessEqual(partitions[0][1], timezone.now() - timedelta(days=200))
+        self.assertGreater(partitions[-1][2], timezone.now() + timedelta(days=31))
+        self.assertEqual(ObjectChange.objects.count(), 5)
+
+        # Changes can still be logged and retrieved
+        objectchange = ObjectChange.objects.create(
+            user_name='testuser', request_id=uuid.uuid4(), action=OBJECTCHANGE_ACTION_CREATE,
+            changed_object_type=ContentType.objects.get_for_model(Site), changed_object_id=1, object_repr='Site 2',
+            object_data={}
+        )
+        self.assertEqual(ObjectChange.objects.get(pk=objectchange.pk).object_repr, 'Site 2')
+
+        # Maintenance is idempotent
+        self.assertEqual(maintain_partitions(months_ahead=2), [])
+
+    def test_drop_expired_partitions(self):
+
+        # Nothing is dropped unless the table has been partitioned
+        self.assertEqual(drop_expired_partitions(timezone.now()), 0)
+
+        maintain_partitions()
+        dropped_count = drop_expired_partitions(timezone.now() - timedelta(days=90))
+
+        # Only partitions which have expired entirely are dropped
+        self.assertIn(dropped_count, (1, 3))
+        self.assertEqual(ObjectChange.objects.count(), 5 - dropped_count)
+        self.assertEqual(ObjectChange.objects.filter(time__gt=timezone.now() - timedelta(days=90)).count(), 2)
+
+    @override_settings(CHANGELOG_RETENTION=90)
+    def test_purge_partitioned_changelog(self):
+
+        maintain_partitions()
+        call_command('purge_changelog', pause=0, stdout=StringIO())
+
+        self.assertEqual(ObjectChange.objects.count(), 2)
@@ -0,0 +1,68 @@
+from django.contrib.contenttypes.models import ContentType
+from django.test import TestCase
+from jinja2.exceptions import SecurityError
+
+from dcim.models import Site
+from extras.models import CustomLink
+from extras.templatetags.custom_links import custom_links
+from extras.utils import get_jinja2_template, render_jinja2
+
+
+class CustomLinkTest(TestCase):
+
+    def setUp(self):
+
+        content_type = ContentType.objects.get_for_model(Site)
+        CustomLink.objects.create(
+            content_type=content_type,
+            name='Link 1',
+            text='View {{ obj.name }}',
+            url='http://example.com/?site={{ obj.slug }}',
+            new_window=False
+        )
+        CustomLink.objects.create(
+            content_type=content_type,
+            name='Link 2',
+            text='{% if obj.facility %}Facility {{ obj.facility }}{% endif %}',
+            url='http://example.com/?facility={{ obj.facility }}',
+            group_name='Group 1',
+            new_window=True
+        )
+        CustomLink.objects.create(
+            content_type=content_type,
+            name='Link 3',
+            text='Site {{ obj.pk }}',
+            url='http://example.com/{{ obj.pk }}/',
+            group_name='Group 1',
+            new_window=False
+        )
+
+    def test_custom_links(self):
+
+        site1 = Site.objects.create(name='Site 1', slug='site-1', facility='DC1')
+        site2 = Site.objects.create(name='Site 2', slug='site-2')
+
+        output = custom_links(site1)
+        self.assertIn('<a href="http://example.com/?site=site-1" class="btn btn-sm btn-default">View Site 1</a>', output)
+        self.assertIn('<li><a href="http://example.com/?facility=DC1" target="_blank">Facility DC1</a></li>', output)
+        self.assertIn('<li><a href="http://example.com/{0}/">Site {0}</a></li>'.format(site1.pk), output)
+
+        # Links which render no text are omitted
+        output = custom_links(site2)
+        self.assertIn('View Site 2', output)
+        self.assertNotIn('facility=', output)
+
+    def test_template_cache(self):
+
+        template_code = '{{ obj.name }}'
+        self.assertIs(get_jinja2_template(template_code), get_jinja2_template(template_code))
+        self.assertEqual(render_jinja2(template_code, {'obj': Site(name='Site 1')}), 'Site 1')
+
+    def test_sandbox(self):
+
+        site = Site.objects.create(name='Site 1', slug='site-1')
+
+        # Methods which modify data may not be called from within a template
+        with self.assertRaises(SecurityError):
+            render_jinja2('{{ obj.delete() }}', {'obj': site})
+        self.assertTrue(Site.objects.filter(pk=site.pk).exists())
@@ -0,0 +1,92 @@
+from django.contrib.contenttypes.models import ContentType
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from dcim.models import Region, Site
+from extras.constants import CF_TYPE_TEXT, TEMPLATE_LANGUAGE_DJANGO
+from extras.models import CustomField, CustomFieldValue, ExportTemplate
+from extras.querysets import CustomFieldQueryset
+from utilities.testing import create_test_user
+
+
+class ExportTemplateTest(TestCase):
+
+    def setUp(self):
+
+        user = create_test_user(permissions=['dcim.view_site'])
+        self.client = Client()
+        self.client.force_login(user)
+
+        self.content_type = ContentType.objects.get_for_model(Site)
+        region = Region.objects.create(name='Region 1', slug='region-1')
+        for i in range(1, 6):
+            Site.objects.create(name='Site {}'.format(i), slug='site-{}'.format(i), region=region)
+
+        self.custom_field = CustomField.objects.create(type=CF_TYPE_TEXT, name='code')
+        self.custom_field.obj_type.set([self.content_type])
+        for site in Site.objects.all():
+            CustomFieldValue.objects.create(
+                field=self.custom_field, obj_type=self.content_type, obj_id=site.pk, serialized_value=site.slug.upper()
+            )
+
+    def test_custom_field_queryset(self):
+
+        queryset = CustomFieldQueryset(Site.objects.prefetch_related('region'), [self.custom_field])
+        queryset.chunk_size = 2
+
+        # Related objects and custom field values are retrieved once per chunk
+        with self.assertNumQueries(1 + 3 * 2):
+            sites = [site for site in queryset]
+            for site in sites:
+                self.assertEqual(site.custom_fields[self.custom_field], site.slug.upper())
+                self.assertEqual(site.cf['code'], site.slug.upper())
+                self.assertEqual(site.region.name, 'Region 1')
+
+        self.assertEqual(len(sites), 5)
+        self.assertEqual(len(queryset), 5)
+        self.assertEqual(queryset.filter(slug='site-1').count(), 1)
+
+    def test_export_jinja2(self):
+
+        ExportTemplate.objects.create(
+            content_type=self.content_type,
+            name='Jinja2 Template',
+            template_code='{% for site in queryset %}{{ site.name }},{{ site.cf.code }}\r\n{% endfor %}',
+            file_extension='txt'
+        )
+
+        url = '{}?export=Jinja2 Template'.format(reverse('dcim:site_list'))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="netbox_sites.txt"')
+
+        output = b''.join(response.streaming_content).decode('utf-8')
+        self.assertEqual(output, ''.join('Site {0},SITE-{0}\n'.format(i) for i in range(1, 6)))
+
+    def test_export_django(self):
+
+        export_template = ExportTemplate.objects.create(
+            content_type=self.content_type,
+            name='Django Template',
+            template_language=TEMPLATE_LANGUAGE_DJANGO,
+            template_code='{% for site in queryset %}{{ site.name }}\r\n{% endfor %}'
+        )
+
+        self.assertEqual(
+            export_template.render(Site.objects.all()),
+            ''.join('Site {}\n'.format(i) for i in range(1, 6))
+        )
+
+    def test_export_error(self):
+
+        ExportTemplate.objects.create(
+            content_type=self.content_type,
+            name='Invalid Template',
+            template_code='{{ queryset.foo() }}'
+        )
+
+        # Errors encountered while rendering are reported rather than streamed
+        url = '{}?export=Invalid Template'.format(reverse('dcim:site_list'))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('There was an error rendering the selected export template', response.content.decode('utf-8'))
@@ -0,0 +1,142 @@
+import threading
+import uuid
+
+from django.test import TestCase
+
+from dcim.models import Device, DeviceRole, DeviceType, Manufacturer, Site
+from dcim.views import SiteBulkDeleteView, SiteBulkImportView
+from extras.constants import OBJECTCHANGE_ACTION_CREATE, OBJECTCHANGE_ACTION_DELETE
+from extras.middleware import change_logging
+from extras.models import ObjectChange
+from utilities.testing import create_test_user
+
+
+class JobRequest:
+
+    def __init__(self, user):
+        self.user = user
+        self.id = uuid.uuid4()
+
+
+class ImportCSVTest(TestCase):
+
+    def setUp(self):
+
+        self.request = JobRequest(create_test_user(permissions=['dcim.add_site']))
+
+    def test_import_csv(self):
+
+        csv_data = '\n'.join(['name,slug'] + ['Site {0},site-{0}'.format(i) for i in range(1, 6)])
+        progress = []
+
+        with change_logging(self.request):
+            result = SiteBulkImportView().import_csv(csv_data, progress=lambda *args: progress.append(args))
+
+        self.assertEqual(result['errors'], [])
+        self.assertEqual(sorted(result['object_ids']), sorted(Site.objects.values_list('pk', flat=True)))
+        self.assertEqual(progress, [(i, 5) for i in range(1, 6)])
+
+        # Changes are attributed to the request which submitted the import
+        objectchanges = ObjectChange.objects.filter(request_id=self.request.id)
+        self.assertEqual(objectchanges.count(), 5)
+        for objectchange in objectchanges:
+            self.assertEqual(objectchange.user, self.request.user)
+            self.assertEqual(objectchange.action, OBJECTCHANGE_ACTION_CREATE)
+
+    def test_import_csv_errors(self):
+
+        Site.objects.create(name='Site 3', slug='site-3')
+        csv_data = '\n'.join(['name,slug'] + ['Site {0},site-{0}'.format(i) for i in range(1, 6)])
+
+        with change_logging(self.request):
+            result = SiteBulkImportView().import_csv(csv_data)
+
+        # Nothing is imported (or logged) if any record is invalid
+        self.assertEqual(result['object_ids'], [])
+        self.assertEqual(len(result['errors']), 2)
+        self.assertTrue(result['errors'][0].startswith('Row 3 name:'))
+        self.assertEqual(Site.objects.count(), 1)
+        self.assertFalse(ObjectChange.objects.exists())
+
+        # Invalid CSV headers are reported
+        result = SiteBulkImportView().import_csv('name,slug,foo\nSite 1,site-1,bar')
+        self.assertEqual(result, {'object_ids': [], 'errors': ['Unexpected column header "foo" found.']})
+
+
+class DeleteObjectsTest(TestCase):
+
+    def setUp(self):
+
+        self.request = JobRequest(create_test_user(permissions=['dcim.delete_site']))
+        for i in range(1, 6):
+            Site.objects.create(name='Site {}'.format(i), slug='site-{}'.format(i))
+
+    def test_delete_objects(self):
+
+        pk_list = list(Site.objects.values_list('pk', flat=True))
+        progress = []
+
+        with change_logging(self.request):
+            result = SiteBulkDeleteView().delete_objects(pk_list, progress=lambda *args: progress.append(args))
+
+        self.assertEqual(result, {'count': 5, 'errors': []})
+        self.assertFalse(Site.objects.exists())
+        self.assertEqual(progress, [(5, 5)])
+
+        # Changes are attributed to the request which submitted the deletion
+        objectchanges = ObjectChange.objects.filter(request_id=self.request.id)
+        self.assertEqual(objectchanges.count(), 5)
+        for objectchange in objectchanges:
+            self.assertEqual(objectchange.user, self.request.user)
+            self.assertEqual(objectchange.action, OBJECTCHANGE_ACTION_DELETE)
+
+        # Deleting objects which have already been deleted (e.g. when resuming an interrupted job) is a no-op
+        with change_logging(self.request):
+            result = SiteBulkDeleteView().delete_objects(pk_list)
+        self.assertEqual(result, {'count': 0, 'errors': []})
+
+    def test_delete_objects_concurrent_requests(self):
+
+        other_request = JobRequest(create_test_user(username='testuser2'))
+        entered, done = threading.Event(), threading.Event()
+
+        def process_other_request():
+            with change_logging(other_request):
+                entered.set()
+                done.wait(10)
+
+        # Enable change logging for another request in a separate thread while objects are being deleted
+        thread = threading.Thread(target=process_other_request)
+        thread.start()
+        try:
+            entered.wait(10)
+            with change_logging(self.request):
+                SiteBulkDeleteView().delete_objects(Site.objects.values_list('pk', flat=True))
+        finally:
+            done.set()
+            thread.join()
+
+        # Each deletion is attributed to the request processed by the current thread
+        self.assertEqual(ObjectChange.objects.count(), 5)
+        self.assertEqual(ObjectChange.objects.filter(request_id=self.request.id, user=self.request.user).count(), 5)
+
+    def test_delete_objects_protected(self):
+
+        manufacturer = Manufacturer.objects.create(name='Manufacturer 1', slug='manufacturer-1')
+        Device.objects.create(
+            name='Device 1',
+            site=Site.objects.get(name='Site 3'),
+            device_type=DeviceType.objects.create(manufacturer=manufacturer, model='Device Type 1'),
+            device_role=DeviceRole.objects.create(name='Device Role 1', slug='device-role-1')
+        )
+
+        with change_logging(self.request):
+            result = SiteBulkDeleteView().delete_objects(Site.objects.values_list('pk', flat=True))
+
+        # Nothing is deleted if any object is protected
+        self.assertEqual(result['count'], 0)
+        self.assertEqual(result['errors'], [
+            'Unable to delete the requested sites. The following dependent devices were found: Device 1'
+        ])
+        self.assertEqual(Site.objects.count(), 5)
+        self.assertFalse(ObjectChange.objects.exists())
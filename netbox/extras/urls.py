@@ -42,4 +42,7 @@ urlpatterns = [
     path(r'scripts/', views.ScriptListView.as_view(), name='script_list'),
     path(r'scripts/<str:module>/<str:name>/', views.ScriptView.as_view(), name='script'),
 
+    # Import jobs
+    path(r'jobs/<str:job_id>/', views.JobView.as_view(), name='job'),
+
 ]
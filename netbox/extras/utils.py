@@ -0,0 +1,36 @@
+from functools import lru_cache
+
+from django.template import Template
+from jinja2.sandbox import SandboxedEnvironment
+
+
+# The maximum number of compiled templates to retain (per template language)
+TEMPLATE_CACHE_SIZE = 512
+
+# A shared sandboxed environment for rendering user-defined Jinja2 templates
+jinja2_env = SandboxedEnvironment()
+
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def get_jinja2_template(template_code):
+    """
+    Return the compiled Jinja2 template for the given template code. Compiled templates are cached by their source, so
+    a template is compiled only once regardless of how many objects it is rendered for, and a modified template is
+    simply compiled anew.
+    """
+    return jinja2_env.from_string(template_code)
+
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def get_django_template(template_code):
+    """
+    Return the compiled Django template for the given template code (see get_jinja2_template()).
+    """
+    return Template(template_code)
+
+
+def render_jinja2(template_code, context):
+    """
+    Render Jinja2 template code with the given context.
+    """
+    return get_jinja2_template(template_code).render(**context)
@@ -6,6 +6,7 @@ from django.contrib.contenttypes.models import ContentType
 from django.db.models import Count, Q
 from django.http import Http404, HttpResponseForbidden
 from django.shortcuts import get_object_or_404, redirect, render
+from django.utils.module_loading import import_string
 from django.utils.safestring import mark_safe
 from django.views.generic import View
 from django_tables2 import RequestConfig
@@ -14,6 +15,8 @@ from utilities.forms import ConfirmationForm
 from utilities.paginator import EnhancedPaginator
 from utilities.views import BulkDeleteView, BulkEditView, ObjectDeleteView, ObjectEditView, ObjectListView
 from . import filters, forms
+from .constants import JOB_ACTION_IMPORT, JOB_STATUS_CLASSES, JOB_STATUS_COMPLETED
+from .jobs import get_job
 from .models import ConfigContext, ImageAttachment, ObjectChange, ReportResult, Tag, TaggedItem
 from .reports import get_report, get_reports
 from .scripts import get_scripts, run_script
@@ -208,6 +211,7 @@ class ObjectChangeView(PermissionRequiredMixin, View):
 
         return render(request, 'extras/objectchange.html', {
             'objectchange': objectchange,
+            'object_data': objectchange.get_object_data(),
             'related_changes_table': related_changes_table,
             'related_changes_count': related_changes.count()
         })
@@ -422,3 +426,33 @@ class ScriptView(PermissionRequiredMixin, View):
             'output': output,
             'execution_time': execution_time,
         })
+
+
+#
+# Background jobs
+#
+
+class JobView(View):
+    """
+    Display the progress of a background job, and its results (e.g. the imported objects) once it has completed.
+    """
+    def get(self, request, job_id):
+
+        if not settings.BACKGROUND_JOBS_ENABLED:
+            raise Http404
+
+        job = get_job(job_id)
+        if job is None or not job.is_visible_to(request.user):
+            raise Http404
+
+        table = None
+        if job.action == JOB_ACTION_IMPORT and job.status == JOB_STATUS_COMPLETED:
+            import_view = import_string(job.view_name)
+            model = import_view.model_form._meta.model
+            table = import_view.table(model.objects.filter(pk__in=job.object_ids))
+
+        return render(request, 'extras/job.html', {
+            'job': job,
+            'status_class': JOB_STATUS_CLASSES[job.status],
+            'table': table,
+        })
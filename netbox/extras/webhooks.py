@@ -9,13 +9,12 @@ from utilities.api import get_serializer_for_model
 from .constants import WEBHOOK_MODELS
 
 
-def enqueue_webhooks(instance, user, request_id, action):
+def get_webhooks(model, action):
     """
-    Find Webhook(s) assigned to this instance + action and enqueue them
-    to be processed
+    Return a list of the enabled Webhooks assigned to the given model and action.
     """
-    if not settings.WEBHOOKS_ENABLED or instance._meta.label.lower() not in WEBHOOK_MODELS:
-        return
+    if not settings.WEBHOOKS_ENABLED or model._meta.label.lower() not in WEBHOOK_MODELS:
+        return []
 
     # Retrieve any applicable Webhooks
     action_flag = {
@@ -23,10 +22,21 @@ def enqueue_webhooks(instance, user, request_id, action):
         OBJECTCHANGE_ACTION_UPDATE: 'type_update',
         OBJECTCHANGE_ACTION_DELETE: 'type_delete',
     }[action]
-    obj_type = ContentType.objects.get_for_model(instance.__class__)
-    webhooks = Webhook.objects.filter(obj_type=obj_type, enabled=True, **{action_flag: True})
+    obj_type = ContentType.objects.get_for_model(model)
+
+    return list(Webhook.objects.filter(obj_type=obj_type, enabled=True, **{action_flag: True}))
+
+
+def enqueue_webhooks(instance, user, request_id, action, webhooks=None):
+    """
+    Find Webhook(s) assigned to this instance + action and enqueue them
+    to be processed. The applicable Webhooks may be passed in if they have
+    already been retrieved (see get_webhooks()).
+    """
+    if webhooks is None:
+        webhooks = get_webhooks(instance.__class__, action)
 
-    if webhooks.exists():
+    if webhooks:
         # Get the Model's API serializer class and serialize the object
         serializer_class = get_serializer_for_model(instance.__class__)
         serializer_context = {
@@ -27,6 +27,9 @@ class VRFSerializer(TaggitSerializer, CustomFieldModelSerializer):
     tags = TagListSerializerField(required=False)
     ipaddress_count = serializers.IntegerField(read_only=True)
     prefix_count = serializers.IntegerField(read_only=True)
+    field_sources = {
+        'display_name': ['name', 'rd'],
+    }
 
     class Meta:
         model = VRF
@@ -50,13 +53,14 @@ class RIRSerializer(ValidatedModelSerializer):
 
 class AggregateSerializer(TaggitSerializer, CustomFieldModelSerializer):
     rir = NestedRIRSerializer()
+    utilization = serializers.IntegerField(source='get_utilization', read_only=True)
     tags = TagListSerializerField(required=False)
 
     class Meta:
         model = Aggregate
         fields = [
-            'id', 'family', 'prefix', 'rir', 'date_added', 'description', 'tags', 'custom_fields', 'created',
-            'last_updated',
+            'id', 'family', 'prefix', 'rir', 'date_added', 'description', 'utilization', 'tags', 'custom_fields',
+            'created', 'last_updated',
         ]
         read_only_fields = ['family']
 
@@ -106,6 +110,9 @@ class VLANSerializer(TaggitSerializer, CustomFieldModelSerializer):
     role = NestedRoleSerializer(required=False, allow_null=True)
     tags = TagListSerializerField(required=False)
     prefix_count = serializers.IntegerField(read_only=True)
+    field_sources = {
+        'display_name': ['vid', 'name'],
+    }
 
     class Meta:
         model = VLAN
@@ -142,13 +149,16 @@ class PrefixSerializer(TaggitSerializer, CustomFieldModelSerializer):
     vlan = NestedVLANSerializer(required=False, allow_null=True)
     status = ChoiceField(choices=PREFIX_STATUS_CHOICES, required=False)
     role = NestedRoleSerializer(required=False, allow_null=True)
+    utilization = serializers.IntegerField(source='get_utilization', read_only=True)
+    depth = serializers.IntegerField(source='_depth', read_only=True)
+    children = serializers.IntegerField(source='_children', read_only=True)
     tags = TagListSerializerField(required=False)
 
     class Meta:
         model = Prefix
         fields = [
             'id', 'family', 'prefix', 'site', 'vrf', 'tenant', 'vlan', 'status', 'role', 'is_pool', 'description',
-            'tags', 'custom_fields', 'created', 'last_updated',
+            'utilization', 'depth', 'children', 'tags', 'custom_fields', 'created', 'last_updated',
         ]
         read_only_fields = ['family']
 
@@ -1,4 +1,5 @@
 from django.conf import settings
+from django.db import transaction
 from django.db.models import Count
 from django.shortcuts import get_object_or_404
 from rest_framework import status
@@ -58,7 +59,7 @@ class RIRViewSet(ModelViewSet):
 #
 
 class AggregateViewSet(CustomFieldModelViewSet):
-    queryset = Aggregate.objects.prefetch_related('rir').prefetch_related('tags')
+    queryset = Aggregate.objects.prefetch_related('rir').prefetch_related('tags').annotate_utilization()
     serializer_class = serializers.AggregateSerializer
     filterset_class = filters.AggregateFilter
 
@@ -81,7 +82,9 @@ class RoleViewSet(ModelViewSet):
 #
 
 class PrefixViewSet(CustomFieldModelViewSet):
-    queryset = Prefix.objects.prefetch_related('site', 'vrf__tenant', 'tenant', 'vlan', 'role', 'tags')
+    queryset = Prefix.objects.prefetch_related(
+        'site', 'vrf__tenant', 'tenant', 'vlan', 'role', 'tags'
+    ).annotate_utilization()
     serializer_class = serializers.PrefixSerializer
     filterset_class = filters.PrefixFilter
 
@@ -91,7 +94,6 @@ class PrefixViewSet(CustomFieldModelViewSet):
         A convenience method for returning available child prefixes within a parent.
         """
         prefix = get_object_or_404(Prefix, pk=pk)
-        available_prefixes = prefix.get_available_prefixes()
 
         if request.method == 'POST':
 
@@ -102,76 +104,85 @@ class PrefixViewSet(CustomFieldModelViewSet):
             # Normalize to a list of objects
             requested_prefixes = request.data if isinstance(request.data, list) else [request.data]
 
-            # Allocate prefixes to the requested objects based on availability within the parent
-            for i, requested_prefix in enumerate(requested_prefixes):
-
-                # Validate requested prefix size
-                prefix_length = requested_prefix.get('prefix_length')
-                if prefix_length is None:
-                    return Response(
-                        {
-                            "detail": "Item {}: prefix_length field missing".format(i)
-                        },
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                try:
-                    prefix_length = int(prefix_length)
-                except ValueError:
-                    return Response(
-                        {
-                            "detail": "Item {}: Invalid prefix length ({})".format(i, prefix_length),
-                        },
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                if prefix.family == 4 and prefix_length > 32:
-                    return Response(
-                        {
-                            "detail": "Item {}: Invalid prefix length ({}) for IPv4".format(i, prefix_length),
-                        },
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                elif prefix.family == 6 and prefix_length > 128:
-                    return Response(
-                        {
-                            "detail": "Item {}: Invalid prefix length ({}) for IPv6".format(i, prefix_length),
-                        },
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-
-                # Find the first available prefix equal to or larger than the requested size
-                for available_prefix in available_prefixes.iter_cidrs():
-                    if requested_prefix['prefix_length'] >= available_prefix.prefixlen:
-                        allocated_prefix = '{}/{}'.format(available_prefix.network, requested_prefix['prefix_length'])
-                        requested_prefix['prefix'] = allocated_prefix
-                        requested_prefix['vrf'] = prefix.vrf.pk if prefix.vrf else None
-                        break
+            with transaction.atomic():
+
+                # Lock the parent prefix so that concurrent requests are served in order
+                prefix.lock_for_allocation()
+                available_prefixes = prefix.get_available_prefixes()
+
+                # Allocate prefixes to the requested objects based on availability within the parent
+                for i, requested_prefix in enumerate(requested_prefixes):
+
+                    # Validate requested prefix size
+                    prefix_length = requested_prefix.get('prefix_length')
+                    if prefix_length is None:
+                        return Response(
+                            {
+                                "detail": "Item {}: prefix_length field missing".format(i)
+                            },
+                            status=status.HTTP_400_BAD_REQUEST
+                        )
+                    try:
+                        prefix_length = int(prefix_length)
+                    except ValueError:
+                        return Response(
+                            {
+                                "detail": "Item {}: Invalid prefix length ({})".format(i, prefix_length),
+                            },
+                            status=status.HTTP_400_BAD_REQUEST
+                        )
+                    if prefix.family == 4 and prefix_length > 32:
+                        return Response(
+                            {
+                                "detail": "Item {}: Invalid prefix length ({}) for IPv4".format(i, prefix_length),
+                            },
+                            status=status.HTTP_400_BAD_REQUEST
+                        )
+                    elif prefix.family == 6 and prefix_length > 128:
+                        return Response(
+                            {
+                                "detail": "Item {}: Invalid prefix length ({}) for IPv6".format(i, prefix_length),
+                            },
+                            status=status.HTTP_400_BAD_REQUEST
+                        )
+
+                    # Find the first available prefix equal to or larger than the requested size
+                    for available_prefix in available_prefixes.iter_cidrs():
+                        if requested_prefix['prefix_length'] >= available_prefix.prefixlen:
+                            allocated_prefix = '{}/{}'.format(
+                                available_prefix.network, requested_prefix['prefix_length']
+                            )
+                            requested_prefix['prefix'] = allocated_prefix
+                            requested_prefix['vrf'] = prefix.vrf.pk if prefix.vrf else None
+                            break
+                    else:
+                        return Response(
+                            {
+                                "detail": "Insufficient space is available to accommodate the requested prefix size(s)"
+                            },
+                            status=status.HTTP_204_NO_CONTENT
+                        )
+
+                    # Remove the allocated prefix from the list of available prefixes
+                    available_prefixes.remove(allocated_prefix)
+
+                # Initialize the serializer with a list or a single object depending on what was requested
+                context = {'request': request}
+                if isinstance(request.data, list):
+                    serializer = serializers.PrefixSerializer(data=requested_prefixes, many=True, context=context)
                 else:
-                    return Response(
-                        {
-                            "detail": "Insufficient space is available to accommodate the requested prefix size(s)"
-                        },
-                        status=status.HTTP_204_NO_CONTENT
-                    )
-
-                # Remove the allocated prefix from the list of available prefixes
-                available_prefixes.remove(allocated_prefix)
+                    serializer = serializers.PrefixSerializer(data=requested_prefixes[0], context=context)
 
-            # Initialize the serializer with a list or a single object depending on what was requested
-            context = {'request': request}
-            if isinstance(request.data, list):
-                serializer = serializers.PrefixSerializer(data=requested_prefixes, many=True, context=context)
-            else:
-                serializer = serializers.PrefixSerializer(data=requested_prefixes[0], context=context)
-
-            # Create the new Prefix(es)
-            if serializer.is_valid():
-                serializer.save()
-                return Response(serializer.data, status=status.HTTP_201_CREATED)
+                # Create the new Prefix(es)
+                if serializer.is_valid():
+                    serializer.save()
+                    return Response(serializer.data, status=status.HTTP_201_CREATED)
 
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
         else:
 
+            available_prefixes = prefix.get_available_prefixes()
             serializer = serializers.AvailablePrefixSerializer(available_prefixes.iter_cidrs(), many=True, context={
                 'request': request,
                 'vrf': prefix.vrf,
@@ -183,8 +194,8 @@ class PrefixViewSet(CustomFieldModelViewSet):
     def available_ips(self, request, pk=None):
         """
         A convenience method for returning available IP addresses within a prefix. By default, the number of IPs
-        returned will be equivalent to PAGINATE_COUNT. An arbitrary limit (up to MAX_PAGE_SIZE, if set) may be passed,
-        however results will not be paginated.
+        returned will be equivalent to PAGINATE_COUNT. An arbitrary limit (up to MAX_PAGE_SIZE, if set) and offset may
+        be passed, however results will not be paginated.
         """
         prefix = get_object_or_404(Prefix, pk=pk)
 
@@ -198,35 +209,39 @@ class PrefixViewSet(CustomFieldModelViewSet):
             # Normalize to a list of objects
             requested_ips = request.data if isinstance(request.data, list) else [request.data]
 
-            # Determine if the requested number of IPs is available
-            available_ips = prefix.get_available_ips()
-            if available_ips.size < len(requested_ips):
-                return Response(
-                    {
-                        "detail": "An insufficient number of IP addresses are available within the prefix {} ({} "
-                                  "requested, {} available)".format(prefix, len(requested_ips), len(available_ips))
-                    },
-                    status=status.HTTP_204_NO_CONTENT
-                )
-
-            # Assign addresses from the list of available IPs and copy VRF assignment from the parent prefix
-            available_ips = iter(available_ips)
-            prefix_length = prefix.prefix.prefixlen
-            for requested_ip in requested_ips:
-                requested_ip['address'] = '{}/{}'.format(next(available_ips), prefix_length)
-                requested_ip['vrf'] = prefix.vrf.pk if prefix.vrf else None
-
-            # Initialize the serializer with a list or a single object depending on what was requested
-            context = {'request': request}
-            if isinstance(request.data, list):
-                serializer = serializers.IPAddressSerializer(data=requested_ips, many=True, context=context)
-            else:
-                serializer = serializers.IPAddressSerializer(data=requested_ips[0], context=context)
-
-            # Create the new IP address(es)
-            if serializer.is_valid():
-                serializer.save()
-                return Response(serializer.data, status=status.HTTP_201_CREATED)
+            with transaction.atomic():
+
+                # Lock the parent prefix so that concurrent requests are served in order
+                prefix.lock_for_allocation()
+
+                # Determine if the requested number of IPs is available
+                available_ips = list(prefix.iter_available_ips(limit=len(requested_ips)))
+                if len(available_ips) < len(requested_ips):
+                    return Response(
+                        {
+                            "detail": "An insufficient number of IP addresses are available within the prefix {} ({} "
+                                      "requested, {} available)".format(prefix, len(requested_ips), len(available_ips))
+                        },
+                        status=status.HTTP_204_NO_CONTENT
+                    )
+
+                # Assign addresses from the list of available IPs and copy VRF assignment from the parent prefix
+                prefix_length = prefix.prefix.prefixlen
+                for requested_ip, available_ip in zip(requested_ips, available_ips):
+                    requested_ip['address'] = '{}/{}'.format(available_ip, prefix_length)
+                    requested_ip['vrf'] = prefix.vrf.pk if prefix.vrf else None
+
+                # Initialize the serializer with a list or a single object depending on what was requested
+                context = {'request': request}
+                if isinstance(request.data, list):
+                    serializer = serializers.IPAddressSerializer(data=requested_ips, many=True, context=context)
+                else:
+                    serializer = serializers.IPAddressSerializer(data=requested_ips[0], context=context)
+
+                # Create the new IP address(es)
+                if serializer.is_valid():
+                    serializer.save()
+                    return Response(serializer.data, status=status.HTTP_201_CREATED)
 
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -238,13 +253,13 @@ class PrefixViewSet(CustomFieldModelViewSet):
                 limit = settings.PAGINATE_COUNT
             if settings.MAX_PAGE_SIZE:
                 limit = min(limit, settings.MAX_PAGE_SIZE)
+            try:
+                offset = max(int(request.query_params.get('offset', 0)), 0)
+            except ValueError:
+                offset = 0
 
             # Calculate available IPs within the prefix
-            ip_list = []
-            for index, ip in enumerate(prefix.get_available_ips(), start=1):
-                ip_list.append(ip)
-                if index == limit:
-                    break
+            ip_list = list(prefix.iter_available_ips(offset=offset, limit=limit))
             serializer = serializers.AvailableIPSerializer(ip_list, many=True, context={
                 'request': request,
                 'prefix': prefix.prefix,
@@ -139,6 +139,14 @@ class PrefixFilter(TenancyFilterSet, CustomFieldFilterSet):
         method='filter_mask_length',
         label='Mask length',
     )
+    depth = django_filters.NumberFilter(
+        field_name='_depth',
+        label='Depth',
+    )
+    children = django_filters.NumberFilter(
+        field_name='_children',
+        label='Number of child prefixes',
+    )
     vrf_id = django_filters.ModelMultipleChoiceFilter(
         queryset=VRF.objects.all(),
         label='VRF',
@@ -0,0 +1,189 @@
+import threading
+from bisect import bisect_left, bisect_right, insort
+
+import netaddr
+from django.db.models import Count, Max
+
+
+# Index key representing Prefixes across all VRFs (used for global container prefixes)
+ALL_VRFS = 'all'
+
+
+class PrefixIntervals:
+    """
+    A sorted list of (first, -last, pk) tuples representing the integer bounds of every Prefix within a VRF, kept
+    separately for each address family. Negating the last address ensures that a covering prefix is always ordered ahead
+    of the prefixes it contains, so the children of any prefix occupy a contiguous slice which can be located by
+    bisection.
+    """
+    def __init__(self, rows=()):
+        self.intervals = {4: [], 6: []}
+        self.members = {}
+        for pk, prefix in rows:
+            entry = (prefix.first, -prefix.last, pk)
+            self.members[pk] = (prefix.version, entry)
+            self.intervals[prefix.version].append(entry)
+        for intervals in self.intervals.values():
+            intervals.sort()
+
+    def __len__(self):
+        return len(self.members)
+
+    def add(self, pk, prefix):
+        self.remove(pk)
+        entry = (prefix.first, -prefix.last, pk)
+        self.members[pk] = (prefix.version, entry)
+        insort(self.intervals[prefix.version], entry)
+
+    def remove(self, pk):
+        if pk in self.members:
+            family, entry = self.members.pop(pk)
+            intervals = self.intervals[family]
+            del intervals[bisect_left(intervals, entry)]
+
+    def _get_bounds(self, prefix):
+        """
+        Return the list of intervals for the prefix's family along with the slice of it strictly contained by prefix.
+        """
+        intervals = self.intervals[prefix.version]
+        lo = bisect_right(intervals, (prefix.first, -prefix.last, float('inf')))
+        hi = bisect_left(intervals, (prefix.last + 1,), lo)
+        return intervals, lo, hi
+
+    def get_children(self, prefix):
+        """
+        Return the PKs of all Prefixes contained within the given prefix (excluding duplicates of the prefix itself).
+        """
+        intervals, lo, hi = self._get_bounds(prefix)
+        return [pk for _, _, pk in intervals[lo:hi]]
+
+    def get_top_level(self, prefix):
+        """
+        Yield a (first, last, pks, has_children) tuple for each distinct range immediately within the given prefix.
+        Nested children are skipped by bisecting past the end of each range, so the cost scales with the number of
+        top-level children rather than with the total number of descendants.
+        """
+        intervals, i, hi = self._get_bounds(prefix)
+        while i < hi:
+            first, neg_last, _ = intervals[i]
+            # Duplicate prefixes share the same bounds and are adjacent
+            j = bisect_right(intervals, (first, neg_last, float('inf')), i, hi)
+            end = bisect_left(intervals, (-neg_last + 1,), j, hi)
+            yield first, -neg_last, [pk for _, _, pk in intervals[i:j]], end > j
+            i = end
+
+    def get_available(self, prefix):
+        """
+        Yield a (first, last) tuple for each unallocated range within the given prefix.
+        """
+        cursor = prefix.first
+        for first, last, _, _ in self.get_top_level(prefix):
+            if first > cursor:
+                yield cursor, first - 1
+            cursor = last + 1
+        if cursor <= prefix.last:
+            yield cursor, prefix.last
+
+    def get_coverage(self, prefix):
+        """
+        Return the number of addresses within the given prefix which are covered by a child prefix.
+        """
+        return sum(last - first + 1 for first, last, _, _ in self.get_top_level(prefix))
+
+    def get_first_available(self, prefix, prefix_length):
+        """
+        Return the first unallocated IPNetwork of the given length within the prefix (or None).
+        """
+        max_length = 32 if prefix.version == 4 else 128
+        if prefix_length < prefix.prefixlen or prefix_length > max_length:
+            return None
+        size = 2 ** (max_length - prefix_length)
+        for first, last in self.get_available(prefix):
+            # Round up to the next boundary for the requested prefix length
+            start = -(-first // size) * size
+            if start + size - 1 <= last:
+                return netaddr.IPNetwork((start, prefix_length), version=prefix.version)
+        return None
+
+
+class PrefixIndex:
+    """
+    A process-wide cache of PrefixIntervals, keyed by VRF ID (None for the global table) or ALL_VRFS. Each entry is
+    validated against a fingerprint (row count and latest modification time) of its VRF before use so that changes
+    made by other processes are detected. Changes made locally are applied incrementally by ipam.signals, which also
+    advance the expected fingerprint accordingly.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._indexes = {}
+        self._fingerprints = {}
+
+    def _get_queryset(self, key):
+        from .models import Prefix
+        if key == ALL_VRFS:
+            return Prefix.objects.order_by()
+        return Prefix.objects.filter(vrf_id=key).order_by()
+
+    def _get_fingerprint(self, key):
+        fingerprint = self._get_queryset(key).aggregate(count=Count('pk'), last_updated=Max('last_updated'))
+        return fingerprint['count'], fingerprint['last_updated']
+
+    def _discard(self, key):
+        del self._indexes[key]
+        del self._fingerprints[key]
+
+    def get(self, key):
+        """
+        Return the PrefixIntervals for the given key, (re)building it from the database if it is missing or stale.
+        """
+        fingerprint = self._get_fingerprint(key)
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is None or self._fingerprints[key] != fingerprint:
+                index = PrefixIntervals(self._get_queryset(key).values_list('pk', 'prefix'))
+                self._indexes[key] = index
+                self._fingerprints[key] = fingerprint
+            return index
+
+    def update(self, pk, vrf_id, prefix, last_updated):
+        """
+        Record a created or modified Prefix in any loaded indexes.
+        """
+        with self._lock:
+            for key, index in list(self._indexes.items()):
+                count, max_updated = self._fingerprints[key]
+                if key in (vrf_id, ALL_VRFS):
+                    if pk not in index.members:
+                        count += 1
+                    index.add(pk, prefix)
+                    if last_updated is not None and (max_updated is None or last_updated > max_updated):
+                        max_updated = last_updated
+                    self._fingerprints[key] = (count, max_updated)
+                elif pk in index.members:
+                    # The Prefix has been moved to a different VRF, so the latest modification time remaining in this
+                    # VRF can no longer be inferred.
+                    self._discard(key)
+
+    def remove(self, pk, last_updated):
+        """
+        Remove a deleted Prefix from any loaded indexes.
+        """
+        with self._lock:
+            for key, index in list(self._indexes.items()):
+                if pk not in index.members:
+                    continue
+                count, max_updated = self._fingerprints[key]
+                if last_updated is not None and last_updated == max_updated:
+                    # The most recently modified Prefix has been deleted; the index must be revalidated
+                    self._discard(key)
+                else:
+                    index.remove(pk)
+                    self._fingerprints[key] = (count - 1, max_updated)
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+            self._fingerprints.clear()
+
+
+prefix_index = PrefixIndex()
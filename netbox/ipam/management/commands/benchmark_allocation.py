@@ -0,0 +1,93 @@
+import threading
+import time
+
+import netaddr
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+
+from ipam.models import IPAddress, Prefix, VRF
+
+
+class Command(BaseCommand):
+    help = "Measure next-available IP allocation throughput for parallel clients"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--prefix', default='10.255.0.0/16',
+            help="Parent prefix to allocate from (created within a temporary VRF)"
+        )
+        parser.add_argument('--clients', type=int, default=8, help="Number of parallel clients")
+        parser.add_argument('--requests', type=int, default=50, help="Number of requests per client")
+        parser.add_argument('--size', type=int, default=1, help="Number of IPs allocated per request")
+        parser.add_argument(
+            '--no-lock', action='store_true',
+            help="Skip locking the parent prefix (demonstrates duplicate allocations)"
+        )
+
+    def allocate(self, prefix, count, lock):
+        with transaction.atomic():
+            if lock:
+                prefix.lock_for_allocation()
+            available_ips = list(prefix.iter_available_ips(limit=count))
+            for ip in available_ips:
+                IPAddress.objects.create(
+                    address=netaddr.IPNetwork('{}/{}'.format(ip, prefix.prefix.prefixlen)),
+                    vrf=prefix.vrf
+                )
+        return len(available_ips)
+
+    def run_client(self, prefix_pk, options, results):
+        allocated = 0
+        try:
+            prefix = Prefix.objects.get(pk=prefix_pk)
+            for _ in range(options['requests']):
+                allocated += self.allocate(prefix, options['size'], not options['no_lock'])
+        finally:
+            connection.close()
+        results.append(allocated)
+
+    def handle(self, *args, **options):
+
+        try:
+            parent = netaddr.IPNetwork(options['prefix']).cidr
+        except netaddr.AddrFormatError:
+            raise CommandError("Invalid prefix: {}".format(options['prefix']))
+
+        vrf = VRF.objects.create(name='Allocation benchmark', enforce_unique=False)
+        prefix = Prefix.objects.create(prefix=parent, vrf=vrf)
+
+        try:
+            self.stdout.write("Allocating from {} with {} clients x {} requests x {} IPs{}...".format(
+                parent, options['clients'], options['requests'], options['size'],
+                " (unlocked)" if options['no_lock'] else ""
+            ))
+            results = []
+            threads = [
+                threading.Thread(target=self.run_client, args=(prefix.pk, options, results))
+                for _ in range(options['clients'])
+            ]
+            start = time.monotonic()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.monotonic() - start
+
+            allocated = sum(results)
+            duplicates = IPAddress.objects.filter(vrf=vrf).values('address').annotate(
+                count=Count('pk')
+            ).filter(count__gt=1).count()
+
+            self.stdout.write("Allocated {} IPs in {:.2f}s ({:.1f} IPs/s, {:.1f} requests/s)".format(
+                allocated, elapsed, allocated / elapsed, options['clients'] * options['requests'] / elapsed
+            ))
+            if duplicates:
+                self.stdout.write(self.style.ERROR("{} addresses were allocated more than once".format(duplicates)))
+            else:
+                self.stdout.write(self.style.SUCCESS("No duplicate allocations"))
+
+        finally:
+            IPAddress.objects.filter(vrf=vrf).delete()
+            prefix.delete()
+            vrf.delete()
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from ipam.models import Prefix
+
+
+class Command(BaseCommand):
+    help = "Recalculate the stored depth and child count of all prefixes"
+
+    def handle(self, *args, **options):
+        self.stdout.write("Rebuilding prefix hierarchy...")
+        count = Prefix.objects.rebuild_hierarchy()
+        self.stdout.write(self.style.SUCCESS("Updated {} prefixes.".format(count)))
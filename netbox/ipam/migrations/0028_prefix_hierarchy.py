@@ -0,0 +1,45 @@
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+REBUILD_PREFIX_HIERARCHY_SQL = """
+UPDATE ipam_prefix SET
+    _depth = (
+        SELECT COUNT(DISTINCT p.prefix) FROM ipam_prefix p
+        WHERE p.prefix >> ipam_prefix.prefix AND p.vrf_id IS NOT DISTINCT FROM ipam_prefix.vrf_id
+    ),
+    _children = (
+        SELECT COUNT(*) FROM ipam_prefix c
+        WHERE c.prefix << ipam_prefix.prefix AND c.vrf_id IS NOT DISTINCT FROM ipam_prefix.vrf_id
+    )
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ipam', '0027_ipaddress_add_dns_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prefix',
+            name='_depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='prefix',
+            name='_children',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='prefix',
+            index=django.contrib.postgres.indexes.GistIndex(
+                fields=['prefix'], name='ipam_prefix_prefix_gist', opclasses=['inet_ops']
+            ),
+        ),
+        migrations.RunSQL(
+            sql=REBUILD_PREFIX_HIERARCHY_SQL,
+            reverse_sql=migrations.RunSQL.noop
+        ),
+    ]
@@ -1,10 +1,11 @@
 import netaddr
 from django.conf import settings
 from django.contrib.contenttypes.fields import GenericRelation
+from django.contrib.postgres.indexes import GistIndex
 from django.core.exceptions import ValidationError, ObjectDoesNotExist
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
-from django.db.models import F, Q
+from django.db.models import Count, F, Q
 from django.db.models.expressions import RawSQL
 from django.urls import reverse
 from taggit.managers import TaggableManager
@@ -15,7 +16,9 @@ from utilities.models import ChangeLoggedModel
 from utilities.utils import serialize_object
 from .constants import *
 from .fields import IPNetworkField, IPAddressField
-from .querysets import PrefixQuerySet
+from .index import ALL_VRFS, prefix_index
+from .querysets import AggregateQuerySet, PrefixQuerySet
+from .utils import get_available_ranges
 from .validators import DNSValidator
 
 
@@ -156,6 +159,7 @@ class Aggregate(ChangeLoggedModel, CustomFieldModel):
         object_id_field='obj_id'
     )
 
+    objects = AggregateQuerySet.as_manager()
     tags = TaggableManager(through=TaggedItem)
 
     csv_headers = ['prefix', 'rir', 'date_added', 'description']
@@ -214,11 +218,14 @@ class Aggregate(ChangeLoggedModel, CustomFieldModel):
 
     def get_utilization(self):
         """
-        Determine the prefix utilization of the aggregate and return it as a percentage.
+        Determine the prefix utilization of the aggregate and return it as a percentage. If the Aggregate was retrieved
+        using AggregateQuerySet.annotate_utilization(), the annotated value is returned.
         """
-        queryset = Prefix.objects.filter(prefix__net_contained_or_equal=str(self.prefix))
-        child_prefixes = netaddr.IPSet([p.prefix for p in queryset])
-        return int(float(child_prefixes.size) / self.prefix.size * 100)
+        if getattr(self, 'utilization', None) is not None:
+            return self.utilization
+        return Aggregate.objects.filter(pk=self.pk).annotate_utilization().values_list(
+            'utilization', flat=True
+        ).first()
 
 
 class Role(ChangeLoggedModel):
@@ -324,6 +331,14 @@ class Prefix(ChangeLoggedModel, CustomFieldModel):
         content_type_field='obj_type',
         object_id_field='obj_id'
     )
+    _depth = models.PositiveSmallIntegerField(
+        default=0,
+        editable=False
+    )
+    _children = models.PositiveIntegerField(
+        default=0,
+        editable=False
+    )
 
     objects = PrefixQuerySet.as_manager()
     tags = TaggableManager(through=TaggedItem)
@@ -335,6 +350,17 @@ class Prefix(ChangeLoggedModel, CustomFieldModel):
     class Meta:
         ordering = [F('vrf').asc(nulls_first=True), 'family', 'prefix']
         verbose_name_plural = 'prefixes'
+        indexes = [
+            GistIndex(fields=['prefix'], name='ipam_prefix_prefix_gist', opclasses=['inet_ops']),
+        ]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # Remember the original position of the Prefix so that ipam.signals can tell when it has moved (deferred
+        # fields are not loaded)
+        self._original_prefix = self.__dict__.get('prefix')
+        self._original_vrf_id = self.__dict__.get('vrf_id')
 
     def __str__(self):
         return str(self.prefix)
@@ -377,8 +403,23 @@ class Prefix(ChangeLoggedModel, CustomFieldModel):
             # Record address family
             self.family = self.prefix.version
 
+        # Record the Prefix's current position within the hierarchy of its VRF
+        if self.prefix is not None:
+            hierarchy = Prefix.objects.filter(
+                Q(prefix__net_contains=str(self.prefix)) | Q(prefix__net_contained=str(self.prefix)),
+                vrf_id=self.vrf_id
+            ).aggregate(
+                depth=Count('prefix', distinct=True, filter=Q(prefix__net_contains=str(self.prefix))),
+                children=Count('pk', filter=Q(prefix__net_contained=str(self.prefix)))
+            )
+            self._depth = hierarchy['depth']
+            self._children = hierarchy['children']
+
         super().save(*args, **kwargs)
 
+        self._original_prefix = self.prefix
+        self._original_vrf_id = self.vrf_id
+
     def to_csv(self):
         return (
             self.prefix,
@@ -418,6 +459,29 @@ class Prefix(ChangeLoggedModel, CustomFieldModel):
         else:
             return Prefix.objects.filter(prefix__net_contained=str(self.prefix), vrf=self.vrf)
 
+    def lock_for_allocation(self):
+        """
+        Lock this Prefix and all Prefixes which contain it (within its VRF or the global table) for the remainder of the
+        current transaction, then refresh this instance. Any two overlapping Prefixes share their outermost row, so
+        concurrent allocations of child objects are serialized. Rows are locked in address order (outermost first) to
+        avoid deadlocks. Must be called from within an atomic block.
+        """
+        list(Prefix.objects.filter(
+            Q(vrf=self.vrf) | Q(vrf__isnull=True),
+            prefix__net_contains_or_equals=str(self.prefix)
+        ).order_by(
+            'prefix', 'pk'
+        ).select_for_update().values_list('pk', flat=True))
+        self.refresh_from_db()
+
+    def get_child_index(self):
+        """
+        Return the PrefixIntervals index covering the same set of Prefixes as get_child_prefixes().
+        """
+        if self.vrf is None and self.status == PREFIX_STATUS_CONTAINER:
+            return prefix_index.get(ALL_VRFS)
+        return prefix_index.get(self.vrf_id)
+
     def get_child_ips(self):
         """
         Return all IPAddresses within this Prefix and VRF. If this Prefix is a container in the global table, return
@@ -432,23 +496,23 @@ class Prefix(ChangeLoggedModel, CustomFieldModel):
         """
         Return all available Prefixes within this prefix as an IPSet.
         """
-        prefix = netaddr.IPSet(self.prefix)
-        child_prefixes = netaddr.IPSet([child.prefix for child in self.get_child_prefixes()])
-        available_prefixes = prefix - child_prefixes
+        available_prefixes = []
+        for first, last in self.get_child_index().get_available(self.prefix):
+            available_prefixes.extend(netaddr.iprange_to_cidrs(
+                netaddr.IPAddress(first, self.prefix.version),
+                netaddr.IPAddress(last, self.prefix.version)
+            ))
 
-        return available_prefixes
+        return netaddr.IPSet(available_prefixes)
 
-    def get_available_ips(self):
+    def get_available_ip_bounds(self):
         """
-        Return all available IPs within this prefix as an IPSet.
+        Return the integer values of the first and last usable IP addresses within the prefix. The first and last IPs
+        are excluded unless the prefix is a pool or a point-to-point network.
         """
-        prefix = netaddr.IPSet(self.prefix)
-        child_ips = netaddr.IPSet([ip.address.ip for ip in self.get_child_ips()])
-        available_ips = prefix - child_ips
-
         # All IP addresses within a pool are considered usable
         if self.is_pool:
-            return available_ips
+            return self.prefix.first, self.prefix.last
 
         # All IP addresses within a point-to-point prefix (IPv4 /31 or IPv6 /127) are considered usable
         if (
@@ -456,43 +520,88 @@ class Prefix(ChangeLoggedModel, CustomFieldModel):
         ) or (
             self.family == 6 and self.prefix.prefixlen == 127  # RFC 6164
         ):
-            return available_ips
+            return self.prefix.first, self.prefix.last
 
         # Omit first and last IP address from the available set
-        available_ips -= netaddr.IPSet([
-            netaddr.IPAddress(self.prefix.first),
-            netaddr.IPAddress(self.prefix.last),
-        ])
+        return self.prefix.first + 1, self.prefix.last - 1
+
+    def get_available_ip_ranges(self):
+        """
+        Yield a (first, last) tuple of integers for each range of available IPs within the prefix. Child IPs are
+        streamed from the database in address order, so only as many are retrieved as are needed to reach the last
+        range consumed.
+        """
+        first, last = self.get_available_ip_bounds()
+        child_ips = self.get_child_ips().values_list('address', flat=True).iterator()
+        return get_available_ranges(first, last, (address.ip for address in child_ips))
+
+    def iter_available_ips(self, offset=0, limit=None):
+        """
+        Yield available IPs within the prefix as IPAddress objects, skipping the first `offset` available IPs and
+        stopping after `limit` have been returned.
+        """
+        if limit is not None and limit <= 0:
+            return
+        count = 0
+        for first, last in self.get_available_ip_ranges():
+            size = last - first + 1
+            if offset >= size:
+                offset -= size
+                continue
+            for value in range(first + offset, last + 1):
+                yield netaddr.IPAddress(value, self.family)
+                count += 1
+                if count == limit:
+                    return
+            offset = 0
+
+    def get_available_ips(self):
+        """
+        Return all available IPs within this prefix as an IPSet.
+        """
+        available_ips = []
+        for first, last in self.get_available_ip_ranges():
+            available_ips.extend(netaddr.iprange_to_cidrs(
+                netaddr.IPAddress(first, self.family),
+                netaddr.IPAddress(last, self.family)
+            ))
 
-        return available_ips
+        return netaddr.IPSet(available_ips)
 
-    def get_first_available_prefix(self):
+    def get_first_available_prefix(self, prefix_length=None):
         """
-        Return the first available child prefix within the prefix (or None).
+        Return the first available child prefix within the prefix (or None). If a prefix length is specified, return
+        the first available child prefix of that length.
         """
-        available_prefixes = self.get_available_prefixes()
-        if not available_prefixes:
-            return None
-        return available_prefixes.iter_cidrs()[0]
+        index = self.get_child_index()
+        if prefix_length is not None:
+            return index.get_first_available(self.prefix, prefix_length)
+        for first, last in index.get_available(self.prefix):
+            return netaddr.iprange_to_cidrs(
+                netaddr.IPAddress(first, self.prefix.version),
+                netaddr.IPAddress(last, self.prefix.version)
+            )[0]
+        return None
 
     def get_first_available_ip(self):
         """
         Return the first available IP within the prefix (or None).
         """
-        available_ips = self.get_available_ips()
-        if not available_ips:
-            return None
-        return '{}/{}'.format(next(available_ips.__iter__()), self.prefix.prefixlen)
+        for ip in self.iter_available_ips(limit=1):
+            return '{}/{}'.format(ip, self.prefix.prefixlen)
+        return None
 
     def get_utilization(self):
         """
         Determine the utilization of the prefix and return it as a percentage. For Prefixes with a status of
-        "container", calculate utilization based on child prefixes. For all others, count child IP addresses.
+        "container", calculate utilization based on child prefixes. For all others, count child IP addresses. If the
+        Prefix was retrieved using PrefixQuerySet.annotate_utilization(), the annotated value is returned.
         """
+        if getattr(self, 'utilization', None) is not None:
+            return self.utilization
         if self.status == PREFIX_STATUS_CONTAINER:
-            queryset = Prefix.objects.filter(prefix__net_contained=str(self.prefix), vrf=self.vrf)
-            child_prefixes = netaddr.IPSet([p.prefix for p in queryset])
-            return int(float(child_prefixes.size) / self.prefix.size * 100)
+            child_size = prefix_index.get(self.vrf_id).get_coverage(self.prefix)
+            return int(float(child_size) / self.prefix.size * 100)
         else:
             # Compile an IPSet to avoid counting duplicate IPs
             child_count = netaddr.IPSet([ip.address.ip for ip in self.get_child_ips()]).size
@@ -1,16 +1,126 @@
-from django.db.models import QuerySet
+from django.db.models import BooleanField, Case, F, QuerySet, Value, When
+from django.db.models.expressions import RawSQL
+
+from .constants import PREFIX_STATUS_CONTAINER
+
+
+# The number of addresses within a prefix
+PREFIX_SIZE_SQL = "POWER(2::numeric, (CASE WHEN FAMILY({0}) = 4 THEN 32 ELSE 128 END) - MASKLEN({0}))"
+
+# The number of distinct Prefixes which contain a Prefix within its VRF
+PREFIX_DEPTH_SQL = """
+SELECT COUNT(DISTINCT p.prefix) FROM ipam_prefix p
+WHERE p.prefix >> ipam_prefix.prefix AND p.vrf_id IS NOT DISTINCT FROM ipam_prefix.vrf_id
+"""
+
+# The number of Prefixes contained by a Prefix within its VRF
+PREFIX_CHILDREN_SQL = """
+SELECT COUNT(*) FROM ipam_prefix c
+WHERE c.prefix << ipam_prefix.prefix AND c.vrf_id IS NOT DISTINCT FROM ipam_prefix.vrf_id
+"""
+
+# Whether a Prefix contains, equals or is contained by any of a list of prefixes (each within the corresponding VRF)
+PREFIX_SURROUNDING_SQL = """
+EXISTS (
+    SELECT 1 FROM unnest(%s::cidr[], %s::integer[]) AS p(prefix, vrf_id)
+    WHERE (ipam_prefix.prefix >>= p.prefix OR ipam_prefix.prefix << p.prefix)
+    AND ipam_prefix.vrf_id IS NOT DISTINCT FROM p.vrf_id
+)
+"""
+
+# The number of addresses within a Prefix covered by its child Prefixes. Only children which are not themselves
+# contained by another child are counted, so that overlapping space is not counted twice.
+PREFIX_COVERAGE_SQL = """
+SELECT COALESCE(SUM({size}), 0) FROM (
+    SELECT DISTINCT c1.prefix FROM ipam_prefix c1
+    WHERE c1.prefix << ipam_prefix.prefix AND c1.vrf_id IS NOT DISTINCT FROM ipam_prefix.vrf_id AND NOT EXISTS (
+        SELECT 1 FROM ipam_prefix c2
+        WHERE c2.prefix << ipam_prefix.prefix AND c2.vrf_id IS NOT DISTINCT FROM ipam_prefix.vrf_id
+        AND c2.prefix >> c1.prefix
+    )
+) c
+""".format(size=PREFIX_SIZE_SQL.format('c.prefix'))
+
+# The number of unique IP addresses within a Prefix
+PREFIX_IP_COUNT_SQL = """
+SELECT COUNT(DISTINCT HOST(i.address)) FROM ipam_ipaddress i
+WHERE CAST(HOST(i.address) AS INET) << ipam_prefix.prefix AND i.vrf_id IS NOT DISTINCT FROM ipam_prefix.vrf_id
+"""
+
+# Mirrors Prefix.get_utilization(): container utilization is based on child prefixes, all others on child IPs (ignoring
+# the network and broadcast addresses of IPv4 prefixes which are not pools).
+PREFIX_UTILIZATION_SQL = """
+CAST(FLOOR(CASE WHEN ipam_prefix.status = %s THEN
+    ({coverage}) * 100 / {size}
+ELSE
+    ({ip_count}) * 100 / ({size} - CASE
+        WHEN ipam_prefix.family = 4 AND MASKLEN(ipam_prefix.prefix) < 31 AND NOT ipam_prefix.is_pool THEN 2 ELSE 0
+    END)
+END) AS integer)
+""".format(
+    coverage=PREFIX_COVERAGE_SQL,
+    ip_count=PREFIX_IP_COUNT_SQL,
+    size=PREFIX_SIZE_SQL.format('ipam_prefix.prefix')
+)
+
+# Mirrors Aggregate.get_utilization(): the coverage of all child prefixes (in any VRF)
+AGGREGATE_UTILIZATION_SQL = """
+CAST(FLOOR((
+    SELECT COALESCE(SUM({child_size}), 0) FROM (
+        SELECT DISTINCT c1.prefix FROM ipam_prefix c1
+        WHERE c1.prefix <<= ipam_aggregate.prefix AND NOT EXISTS (
+            SELECT 1 FROM ipam_prefix c2 WHERE c2.prefix <<= ipam_aggregate.prefix AND c2.prefix >> c1.prefix
+        )
+    ) c
+) * 100 / {size}) AS integer)
+""".format(
+    child_size=PREFIX_SIZE_SQL.format('c.prefix'),
+    size=PREFIX_SIZE_SQL.format('ipam_aggregate.prefix')
+)
+
+
+class AggregateQuerySet(QuerySet):
+
+    def annotate_utilization(self):
+        """
+        Annotate the prefix utilization of each Aggregate (as a percentage) in a single query.
+        """
+        return self.annotate(utilization=RawSQL(AGGREGATE_UTILIZATION_SQL, []))
 
 
 class PrefixQuerySet(QuerySet):
 
+    def annotate_utilization(self):
+        """
+        Annotate the utilization of each Prefix (as a percentage) in a single query, rather than evaluating
+        get_utilization() for each Prefix individually.
+        """
+        return self.annotate(utilization=RawSQL(PREFIX_UTILIZATION_SQL, [PREFIX_STATUS_CONTAINER]))
+
     def annotate_depth(self, limit=None):
         """
-        Iterate through a QuerySet of Prefixes and annotate the hierarchical level of each. While it would be preferable
-        to do this using .extra() on the QuerySet to count the unique parents of each prefix, that approach introduces
-        performance issues at scale.
+        Annotate the hierarchical level of each Prefix (and whether it has any children) from the depth and child count
+        stored on the Prefix. If a limit is given, Prefixes nested more deeply than the limit are excluded. The result
+        remains a QuerySet, so it can be further filtered, ordered and paginated in the database.
+        """
+        queryset = self.annotate(
+            depth=F('_depth'),
+            has_children=Case(
+                When(_children__gt=0, then=Value(True)),
+                default=Value(False),
+                output_field=BooleanField()
+            )
+        )
+        if limit is not None:
+            queryset = queryset.filter(_depth__lte=limit)
+        return queryset
 
-        Because we're adding a non-field attribute to the model, annotation must be made *after* any QuerySet
-        modifications.
+    def annotate_relative_depth(self, limit=None):
+        """
+        Iterate through a QuerySet of Prefixes and annotate the hierarchical level of each relative to the other Prefixes
+        in the QuerySet (rather than to all Prefixes within its VRF, as annotate_depth() does). The QuerySet must be
+        ordered by VRF and prefix. If a limit is given, a list of the Prefixes nested no more deeply than the limit is
+        returned.
         """
         queryset = self
         stack = []
@@ -31,6 +141,30 @@ class PrefixQuerySet(QuerySet):
                 prev_p.has_children = True
             stack.append(p)
             p.depth = len(stack) - 1
+            p.has_children = False
         if limit is None:
             return queryset
         return list(filter(lambda p: p.depth <= limit, queryset))
+
+    def filter_surrounding(self, positions):
+        """
+        Filter for Prefixes which contain, equal or are contained by any of the given positions, each a (VRF ID, prefix)
+        tuple. Only Prefixes within the same VRF as a position are matched.
+        """
+        vrf_ids, prefixes = zip(*positions) if positions else ((), ())
+        return self.annotate(
+            surrounding=RawSQL(
+                PREFIX_SURROUNDING_SQL, [[str(prefix) for prefix in prefixes], list(vrf_ids)],
+                output_field=BooleanField()
+            )
+        ).filter(surrounding=True)
+
+    def rebuild_hierarchy(self):
+        """
+        Recalculate the stored depth and child count of each Prefix in the QuerySet using a single UPDATE. Returns the
+        number of Prefixes updated.
+        """
+        return self.update(
+            _depth=RawSQL(PREFIX_DEPTH_SQL, []),
+            _children=RawSQL(PREFIX_CHILDREN_SQL, [])
+        )
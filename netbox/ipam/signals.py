@@ -0,0 +1,66 @@
+import netaddr
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .index import prefix_index
+from .models import Prefix
+from .utils import get_deferred_prefix_positions
+
+
+@receiver(post_save, sender=Prefix)
+def update_prefix_index(instance, **kwargs):
+    """
+    When a Prefix is saved, record its new bounds in the prefix index once the transaction has been committed.
+    """
+    pk, vrf_id, last_updated = instance.pk, instance.vrf_id, instance.last_updated
+    prefix = netaddr.IPNetwork(instance.prefix)
+    transaction.on_commit(lambda: prefix_index.update(pk, vrf_id, prefix, last_updated))
+
+
+@receiver(post_delete, sender=Prefix)
+def remove_from_prefix_index(instance, **kwargs):
+    """
+    When a Prefix is deleted, remove it from the prefix index once the transaction has been committed.
+    """
+    pk, last_updated = instance.pk, instance.last_updated
+    transaction.on_commit(lambda: prefix_index.remove(pk, last_updated))
+
+
+def rebuild_prefix_hierarchy(vrf_id, prefix):
+    """
+    Recalculate the stored depth and child count of every Prefix within the given VRF which contains or is contained by
+    the given prefix. If recalculation is deferred, the position is recorded instead.
+    """
+    deferred = get_deferred_prefix_positions()
+    if deferred is not None:
+        deferred.add((vrf_id, str(prefix)))
+        return
+
+    Prefix.objects.filter(
+        Q(prefix__net_contains=str(prefix)) | Q(prefix__net_contained=str(prefix)),
+        vrf_id=vrf_id
+    ).rebuild_hierarchy()
+
+
+@receiver(post_save, sender=Prefix)
+def update_prefix_hierarchy(instance, created, **kwargs):
+    """
+    When a Prefix is created or moved to a new network or VRF, update the Prefixes surrounding both its new and its
+    previous position in the hierarchy.
+    """
+    if created:
+        rebuild_prefix_hierarchy(instance.vrf_id, instance.prefix)
+    elif str(instance.prefix) != str(instance._original_prefix) or instance.vrf_id != instance._original_vrf_id:
+        rebuild_prefix_hierarchy(instance.vrf_id, instance.prefix)
+        if instance._original_prefix is not None:
+            rebuild_prefix_hierarchy(instance._original_vrf_id, instance._original_prefix)
+
+
+@receiver(post_delete, sender=Prefix)
+def remove_from_prefix_hierarchy(instance, **kwargs):
+    """
+    When a Prefix is deleted, update the Prefixes which surrounded it in the hierarchy.
+    """
+    rebuild_prefix_hierarchy(instance.vrf_id, instance.prefix)
@@ -324,6 +324,18 @@ class PrefixDetailTable(PrefixTable):
     class Meta(PrefixTable.Meta):
         fields = ('pk', 'prefix', 'status', 'vrf', 'utilization', 'tenant', 'site', 'vlan', 'role', 'description')
 
+    def before_render(self, request):
+        # Annotate the utilization of all Prefixes on the current page with a single query
+        rows = self.page.object_list if hasattr(self, 'page') else self.rows
+        prefixes = {
+            row.record.pk: row.record for row in rows
+            if row.record.pk and getattr(row.record, 'utilization', None) is None
+        }
+        if prefixes:
+            utilization = Prefix.objects.filter(pk__in=prefixes).annotate_utilization().values_list('pk', 'utilization')
+            for pk, value in utilization:
+                prefixes[pk].utilization = value
+
 
 #
 # IPAddresses
@@ -619,6 +619,11 @@ class PrefixTest(APITestCase):
         response = self.client.get(url, **self.header)
         self.assertEqual(len(response.data), 6)  # 8 - 2 because prefix.is_pool = False
 
+        # Retrieve a subset of available IPs
+        IPAddress.objects.create(address=IPNetwork('192.0.2.2/29'))
+        response = self.client.get('{}?offset=1&limit=2'.format(url), **self.header)
+        self.assertEqual([ip['address'] for ip in response.data], ['192.0.2.3/29', '192.0.2.4/29'])
+
     def test_create_single_available_ip(self):
 
         vrf = VRF.objects.create(name='Test VRF 1', rd='1234')
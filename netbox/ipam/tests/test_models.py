@@ -2,8 +2,10 @@ import netaddr
 from django.core.exceptions import ValidationError
 from django.test import TestCase, override_settings
 
-from ipam.constants import IPADDRESS_ROLE_VIP
-from ipam.models import IPAddress, Prefix, VRF
+from ipam.constants import IPADDRESS_ROLE_VIP, PREFIX_STATUS_CONTAINER
+from ipam.index import PrefixIndex, PrefixIntervals
+from ipam.models import Aggregate, IPAddress, Prefix, RIR, VRF
+from ipam.utils import defer_prefix_hierarchy
 
 
 class TestPrefix(TestCase):
@@ -32,6 +34,250 @@ class TestPrefix(TestCase):
         duplicate_prefix = Prefix(vrf=vrf, prefix=netaddr.IPNetwork('192.0.2.0/24'))
         self.assertRaises(ValidationError, duplicate_prefix.clean)
 
+    def test_get_available_prefixes(self):
+        parent = Prefix.objects.create(prefix=netaddr.IPNetwork('10.0.0.0/16'), status=PREFIX_STATUS_CONTAINER)
+        Prefix.objects.create(prefix=netaddr.IPNetwork('10.0.0.0/24'))
+        Prefix.objects.create(prefix=netaddr.IPNetwork('10.0.0.0/26'))
+        Prefix.objects.create(prefix=netaddr.IPNetwork('10.0.2.0/23'))
+        self.assertEqual(parent.get_available_prefixes(), netaddr.IPSet([
+            '10.0.1.0/24', '10.0.4.0/22', '10.0.8.0/21', '10.0.16.0/20', '10.0.32.0/19', '10.0.64.0/18',
+            '10.0.128.0/17',
+        ]))
+        self.assertEqual(parent.get_first_available_prefix(), netaddr.IPNetwork('10.0.1.0/24'))
+        self.assertEqual(parent.get_first_available_prefix(23), netaddr.IPNetwork('10.0.4.0/23'))
+        self.assertEqual(parent.get_utilization(), 1)
+
+        # Changes must be reflected in the index
+        Prefix.objects.filter(prefix='10.0.2.0/23').delete()
+        Prefix.objects.create(prefix=netaddr.IPNetwork('10.0.1.0/24'))
+        self.assertEqual(parent.get_first_available_prefix(), netaddr.IPNetwork('10.0.2.0/23'))
+
+    def test_get_available_prefixes_vrf(self):
+        vrf = VRF.objects.create(name='Test', rd='1:1')
+        parent = Prefix.objects.create(prefix=netaddr.IPNetwork('10.0.0.0/24'), vrf=vrf)
+        global_parent = Prefix.objects.create(prefix=netaddr.IPNetwork('10.0.0.0/24'), status=PREFIX_STATUS_CONTAINER)
+        Prefix.objects.create(prefix=netaddr.IPNetwork('10.0.0.0/25'), vrf=vrf)
+        self.assertEqual(parent.get_available_prefixes(), netaddr.IPSet(['10.0.0.128/25']))
+        self.assertEqual(global_parent.get_available_prefixes(), netaddr.IPSet(['10.0.0.128/25']))
+        self.assertEqual(global_parent.get_utilization(), 0)
+
+    def test_iter_available_ips(self):
+        prefix = Prefix.objects.create(prefix=netaddr.IPNetwork('192.0.2.0/29'))
+        IPAddress.objects.create(address=netaddr.IPNetwork('192.0.2.2/29'))
+        IPAddress.objects.create(address=netaddr.IPNetwork('192.0.2.2/29'))
+        IPAddress.objects.create(address=netaddr.IPNetwork('192.0.2.5/29'))
+        self.assertEqual(list(prefix.get_available_ip_ranges()), [
+            (int(netaddr.IPAddress('192.0.2.1')), int(netaddr.IPAddress('192.0.2.1'))),
+            (int(netaddr.IPAddress('192.0.2.3')), int(netaddr.IPAddress('192.0.2.4'))),
+            (int(netaddr.IPAddress('192.0.2.6')), int(netaddr.IPAddress('192.0.2.6'))),
+        ])
+        self.assertEqual(
+            [str(ip) for ip in prefix.iter_available_ips(offset=1, limit=2)],
+            ['192.0.2.3', '192.0.2.4']
+        )
+        self.assertEqual(prefix.get_available_ips().size, 4)
+        self.assertEqual(prefix.get_first_available_ip(), '192.0.2.1/29')
+
+        prefix.is_pool = True
+        self.assertEqual(prefix.get_first_available_ip(), '192.0.2.0/29')
+        self.assertEqual(list(prefix.iter_available_ips(offset=6)), [])
+
+
+class TestUtilization(TestCase):
+
+    def test_annotate_prefix_utilization(self):
+        vrf = VRF.objects.create(name='Test', rd='1:1')
+        container = Prefix.objects.create(prefix=netaddr.IPNetwork('10.0.0.0/16'), status=PREFIX_STATUS_CONTAINER)
+        network = Prefix.objects.create(prefix=netaddr.IPNetwork('10.0.0.0/24'))
+        pool = Prefix.objects.create(prefix=netaddr.IPNetwork('10.0.1.0/30'), is_pool=True)
+        Prefix.objects.create(prefix=netaddr.IPNetwork('10.0.0.0/25'))
+        Prefix.objects.create(prefix=netaddr.IPNetwork('10.0.1.0/24'), vrf=vrf)
+        for address in ('10.0.0.1/24', '10.0.0.2/24', '10.0.0.2/24', '10.0.1.1/30'):
+            IPAddress.objects.create(address=netaddr.IPNetwork(address))
+
+        expected = {
+            container.pk: 0,  # 256 + 4 of 65536 addresses
+            network.pk: 0,  # 2 of 254 addresses
+            pool.pk: 25,  # 1 of 4 addresses
+        }
+        utilization = Prefix.objects.filter(pk__in=expected).annotate_utilization().values_list('pk', 'utilization')
+        self.assertEqual(dict(utilization), expected)
+        for prefix in Prefix.objects.filter(pk__in=expected):
+            self.assertEqual(prefix.get_utilization(), expected[prefix.pk])
+
+    def test_aggregate_utilization(self):
+        rir = RIR.objects.create(name='RIR 1', slug='rir-1')
+        aggregate = Aggregate.objects.create(prefix=netaddr.IPNetwork('10.0.0.0/22'), rir=rir)
+        vrf = VRF.objects.create(name='Test', rd='1:1')
+        Prefix.objects.create(prefix=netaddr.IPNetwork('10.0.0.0/23'))
+        Prefix.objects.create(prefix=netaddr.IPNetwork('10.0.1.0/24'), vrf=vrf)
+        Prefix.objects.create(prefix=netaddr.IPNetwork('10.0.2.0/24'), vrf=vrf)
+        self.assertEqual(aggregate.get_utilization(), 75)
+        self.assertEqual(Aggregate.objects.annotate_utilization().get(pk=aggregate.pk).utilization, 75)
+
+
+class TestPrefixHierarchy(TestCase):
+
+    def assertHierarchy(self, expected):
+        hierarchy = Prefix.objects.filter(pk__in=expected).values_list('pk', '_depth', '_children')
+        self.assertEqual({pk: (depth, children) for pk, depth, children in hierarchy}, expected)
+
+    def test_create_and_delete(self):
+        vrf = VRF.objects.create(name='Test', rd='1:1')
+        child = Prefix.objects.create(prefix=netaddr.IPNetwork('10.0.0.0/24'))
+        duplicate = Prefix.objects.create(prefix=netaddr.IPNetwork('10.0.0.0/24'))
+        grandchild = Prefix.objects.create(prefix=netaddr.IPNetwork('10.0.0.0/25'))
+        parent = Prefix.objects.create(prefix=netaddr.IPNetwork('10.0.0.0/16'))
+        other_vrf = Prefix.objects.create(prefix=netaddr.IPNetwork('10.0.0.0/26'), vrf=vrf)
+        self.assertHierarchy({
+            parent.pk: (0, 3),
+            child.pk: (1, 1),
+            duplicate.pk: (1, 1),
+            grandchild.pk: (2, 0),
+            other_vrf.pk: (0, 0),
+        })
+
+        child.delete()
+        duplicate.delete()
+        self.assertHierarchy({
+            parent.pk: (0, 1),
+            grandchild.pk: (1, 0),
+        })
+
+    def test_move(self):
+        vrf = VRF.objects.create(name='Test', rd='1:1')
+        parent = Prefix.objects.create(prefix=netaddr.IPNetwork('10.0.0.0/15'))
+        prefix = Prefix.objects.create(prefix=netaddr.IPNetwork('10.0.0.0/24'))
+        child = Prefix.objects.create(prefix=netaddr.IPNetwork('10.0.0.0/25'))
+        other = Prefix.objects.create(prefix=netaddr.IPNetwork('10.1.0.0/25'))
+
+        # Resize the prefix so that it no longer contains its former child, but does contain another prefix
+        prefix.prefix = netaddr.IPNetwork('10.1.0.0/24')
+        prefix.save()
+        self.assertHierarchy({
+            parent.pk: (0, 3),
+            prefix.pk: (1, 1),
+            child.pk: (1, 0),
+            other.pk: (2, 0),
+        })
+
+        # Move the prefix to a different VRF
+        prefix.vrf = vrf
+        prefix.save()
+        self.assertHierarchy({
+            parent.pk: (0, 2),
+            prefix.pk: (0, 0),
+            other.pk: (1, 0),
+        })
+
+        Prefix.objects.update(_depth=0, _children=0)
+        Prefix.objects.rebuild_hierarchy()
+        self.assertHierarchy({
+            parent.pk: (0, 2),
+            prefix.pk: (0, 0),
+            child.pk: (1, 0),
+            other.pk: (1, 0),
+        })
+
+    def test_annotate_depth(self):
+        parent = Prefix.objects.create(prefix=netaddr.IPNetwork('10.0.0.0/16'))
+        child = Prefix.objects.create(prefix=netaddr.IPNetwork('10.0.0.0/24'))
+        queryset = Prefix.objects.annotate_depth()
+        self.assertEqual(
+            [(p.pk, p.depth, p.has_children) for p in queryset],
+            [(parent.pk, 0, True), (child.pk, 1, False)]
+        )
+        self.assertEqual(list(Prefix.objects.annotate_depth(limit=0)), [parent])
+
+    def test_annotate_relative_depth(self):
+        vrf = VRF.objects.create(name='Test', rd='1:1')
+        Prefix.objects.create(prefix=netaddr.IPNetwork('10.0.0.0/8'))
+        child1 = Prefix.objects.create(prefix=netaddr.IPNetwork('10.0.0.0/24'))
+        Prefix.objects.create(prefix=netaddr.IPNetwork('10.0.0.0/25'))
+        child2 = Prefix.objects.create(prefix=netaddr.IPNetwork('10.0.1.0/24'), vrf=vrf)
+
+        # Depth is relative to the Prefixes in the QuerySet, rather than to all Prefixes in the same VRF
+        queryset = Prefix.objects.filter(prefix__net_contained_or_equal='10.0.0.0/16')
+        self.assertEqual(
+            [(p.pk, p.depth, p.has_children) for p in queryset.annotate_relative_depth(limit=0)],
+            [(child1.pk, 0, True), (child2.pk, 0, False)]
+        )
+
+    def test_deferred_hierarchy(self):
+        vrf = VRF.objects.create(name='Test', rd='1:1')
+        child = Prefix.objects.create(prefix=netaddr.IPNetwork('10.0.0.0/24'))
+        with defer_prefix_hierarchy():
+            parent = Prefix.objects.create(prefix=netaddr.IPNetwork('10.0.0.0/16'))
+            grandchild = Prefix.objects.create(prefix=netaddr.IPNetwork('10.0.0.0/25'))
+            other = Prefix.objects.create(prefix=netaddr.IPNetwork('10.1.0.0/24'))
+            other.vrf = vrf
+            other.save()
+            self.assertHierarchy({child.pk: (0, 0)})
+        self.assertHierarchy({
+            parent.pk: (0, 2),
+            child.pk: (1, 1),
+            grandchild.pk: (2, 0),
+            other.pk: (0, 0),
+        })
+
+
+class TestPrefixIntervals(TestCase):
+
+    def setUp(self):
+        self.index = PrefixIntervals([
+            (1, netaddr.IPNetwork('10.0.0.0/8')),
+            (2, netaddr.IPNetwork('10.1.0.0/16')),
+            (3, netaddr.IPNetwork('10.1.1.0/24')),
+            (4, netaddr.IPNetwork('10.1.0.0/16')),
+            (5, netaddr.IPNetwork('10.2.0.0/16')),
+            (6, netaddr.IPNetwork('2001:db8::/32')),
+        ])
+
+    def test_get_children(self):
+        self.assertEqual(self.index.get_children(netaddr.IPNetwork('10.0.0.0/8')), [2, 4, 3, 5])
+        self.assertEqual(self.index.get_children(netaddr.IPNetwork('10.1.0.0/16')), [3])
+        self.assertEqual(self.index.get_children(netaddr.IPNetwork('2001:db8::/16')), [6])
+
+    def test_get_top_level(self):
+        top_level = list(self.index.get_top_level(netaddr.IPNetwork('10.0.0.0/8')))
+        self.assertEqual([(pks, has_children) for _, _, pks, has_children in top_level], [
+            ([2, 4], True),
+            ([5], False),
+        ])
+
+    def test_add_remove(self):
+        self.index.remove(5)
+        self.index.add(3, netaddr.IPNetwork('10.3.0.0/16'))
+        self.assertEqual(self.index.get_children(netaddr.IPNetwork('10.0.0.0/8')), [2, 4, 3])
+        self.assertEqual(self.index.get_coverage(netaddr.IPNetwork('10.0.0.0/8')), 2 * 2 ** 16)
+
+
+class TestPrefixIndex(TestCase):
+
+    def test_incremental_update(self):
+        index = PrefixIndex()
+        Prefix.objects.create(prefix=netaddr.IPNetwork('10.0.0.0/8'))
+        intervals = index.get(None)
+
+        # Changes recorded locally should not require the index to be rebuilt
+        prefix = Prefix.objects.create(prefix=netaddr.IPNetwork('10.1.0.0/16'))
+        index.update(prefix.pk, prefix.vrf_id, prefix.prefix, prefix.last_updated)
+        self.assertIs(index.get(None), intervals)
+        self.assertEqual(len(intervals), 2)
+
+        # Changes made elsewhere should be detected
+        Prefix.objects.create(prefix=netaddr.IPNetwork('10.2.0.0/16'))
+        intervals = index.get(None)
+        self.assertEqual(len(intervals), 3)
+
+        # Deleting the most recently modified Prefix invalidates the index
+        last_updated = Prefix.objects.get(prefix='10.2.0.0/16').last_updated
+        pk = Prefix.objects.get(prefix='10.2.0.0/16').pk
+        Prefix.objects.filter(pk=pk).delete()
+        index.remove(pk, last_updated)
+        self.assertIsNot(index.get(None), intervals)
+        self.assertEqual(len(index.get(None)), 2)
+
 
 class TestIPAddress(TestCase):
 
@@ -1,12 +1,16 @@
 from netaddr import IPNetwork
 import urllib.parse
+from unittest.mock import patch
 
+from django.db import connection
 from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from dcim.models import Device, DeviceRole, DeviceType, Manufacturer, Site
 from ipam.constants import IP_PROTOCOL_TCP
 from ipam.models import Aggregate, IPAddress, Prefix, RIR, Role, Service, VLAN, VLANGroup, VRF
+from ipam.views import PrefixBulkDeleteView, PrefixBulkImportView
 from utilities.testing import create_test_user
 
 
@@ -89,9 +93,14 @@ class AggregateTestCase(TestCase):
 
     def test_aggregate(self):
 
+        # A top-level child prefix is listed even if it is contained by a larger prefix outside of the aggregate
+        Prefix.objects.create(prefix=IPNetwork('10.0.0.0/8'))
+        prefix = Prefix.objects.create(prefix=IPNetwork('10.1.0.0/24'))
+
         aggregate = Aggregate.objects.first()
         response = self.client.get(aggregate.get_absolute_url())
         self.assertEqual(response.status_code, 200)
+        self.assertIn(prefix, [row.record for row in response.context['prefix_table'].rows])
 
 
 class RoleTestCase(TestCase):
@@ -147,6 +156,70 @@ class PrefixTestCase(TestCase):
         response = self.client.get(prefix.get_absolute_url())
         self.assertEqual(response.status_code, 200)
 
+    def test_prefix_import_csv(self):
+
+        csv_data = '\n'.join([
+            'prefix,status',
+            '10.1.1.0/25,Active',
+            '10.1.1.0/24,Container',
+        ])
+        result = PrefixBulkImportView().import_csv(csv_data)
+        self.assertEqual(result['errors'], [])
+
+        # The stored hierarchy of both the imported prefixes and those surrounding them is updated
+        hierarchy = dict(Prefix.objects.filter(prefix__net_contained_or_equal='10.1.0.0/16').values_list(
+            'prefix', '_children'
+        ))
+        self.assertEqual(hierarchy, {
+            IPNetwork('10.1.0.0/16'): 2,
+            IPNetwork('10.1.1.0/24'): 1,
+            IPNetwork('10.1.1.0/25'): 0,
+        })
+
+    @patch('utilities.views.BULK_DELETE_CHUNK_SIZE', 2)
+    def test_prefix_delete_objects(self):
+
+        parent = Prefix.objects.create(prefix=IPNetwork('10.4.0.0/16'))
+        children = [
+            Prefix.objects.create(prefix=IPNetwork('10.4.{}.0/24'.format(i))) for i in range(4)
+        ]
+        Prefix.objects.create(prefix=IPNetwork('10.4.0.0/25'))
+
+        # The surrounding hierarchy is recalculated once per batch of deleted prefixes
+        with CaptureQueriesContext(connection) as queries:
+            result = PrefixBulkDeleteView().delete_objects([child.pk for child in children])
+        self.assertEqual(result, {'count': 4, 'errors': []})
+        updates = [query for query in queries if query['sql'].startswith('UPDATE "ipam_prefix"')]
+        self.assertEqual(len(updates), 2)
+        self.assertEqual(
+            [(p._depth, p._children) for p in Prefix.objects.filter(prefix__net_contained_or_equal='10.4.0.0/16')],
+            [(0, 1), (1, 0)]
+        )
+
+    def test_prefix_bulk_edit(self):
+
+        self.client.force_login(create_test_user(username='prefixadmin', permissions=['ipam.change_prefix']))
+        vrf = VRF.objects.create(name='VRF 1', rd='65000:1')
+        parent = Prefix.objects.create(prefix=IPNetwork('10.4.0.0/16'))
+        children = [
+            Prefix.objects.create(prefix=IPNetwork('10.4.0.0/24')),
+            Prefix.objects.create(prefix=IPNetwork('10.4.0.0/25')),
+        ]
+
+        # Moving prefixes to another VRF updates the hierarchy of the prefixes they leave behind
+        data = {
+            'pk': [child.pk for child in children],
+            'vrf': vrf.pk,
+            '_apply': True,
+        }
+        response = self.client.post(reverse('ipam:prefix_bulk_edit'), data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Prefix.objects.get(pk=parent.pk)._children, 0)
+        self.assertEqual(
+            [(p._depth, p._children) for p in Prefix.objects.filter(vrf=vrf)],
+            [(0, 1), (1, 0)]
+        )
+
 
 class IPAddressTestCase(TestCase):
 
@@ -240,6 +313,41 @@ class VLANTestCase(TestCase):
         response = self.client.get(vlan.get_absolute_url())
         self.assertEqual(response.status_code, 200)
 
+    def test_vlan_bulk_edit_duplicate(self):
+
+        self.client.force_login(create_test_user(username='vlanadmin', permissions=['ipam.change_vlan']))
+        vlangroup = VLANGroup.objects.create(name='VLAN Group 2', slug='vlan-group-2')
+        vlans = VLAN.objects.bulk_create([
+            VLAN(vid=101, name='VLAN201'),
+            VLAN(vid=201, name='VLAN202'),
+            VLAN(vid=201, name='VLAN203'),
+        ])
+
+        # Changing only the group must still enforce the (group, vid) constraint against existing VLANs
+        data = {
+            'pk': [vlans[0].pk],
+            'group': VLANGroup.objects.get(slug='vlan-group-1').pk,
+            '_apply': True,
+        }
+        response = self.client.post(reverse('ipam:vlan_bulk_edit'), data)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(VLAN.objects.get(pk=vlans[0].pk).group)
+
+        # ...and among the VLANs being edited
+        data = {
+            'pk': [vlans[1].pk, vlans[2].pk],
+            'group': vlangroup.pk,
+            '_apply': True,
+        }
+        response = self.client.post(reverse('ipam:vlan_bulk_edit'), data)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(VLAN.objects.filter(group=vlangroup).exists())
+
+        data['pk'] = [vlans[1].pk]
+        response = self.client.post(reverse('ipam:vlan_bulk_edit'), data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(VLAN.objects.get(pk=vlans[1].pk).group, vlangroup)
+
 
 class ServiceTestCase(TestCase):
 
@@ -0,0 +1,55 @@
+import threading
+from contextlib import contextmanager
+
+
+_deferred = threading.local()
+
+
+def get_available_ranges(first, last, ips):
+    """
+    Yield a (first, last) tuple of integers for each span of unallocated addresses between first and last (inclusive),
+    given an iterable of netaddr.IPAddress objects in ascending order. Duplicate addresses and addresses outside of the
+    range are tolerated. The iterable is consumed lazily, so only as many addresses are evaluated as are needed to
+    reach the last span requested by the caller.
+    """
+    cursor = first
+    for ip in ips:
+        value = int(ip)
+        if value > last:
+            break
+        if value > cursor:
+            yield cursor, value - 1
+        cursor = max(cursor, value + 1)
+    if cursor <= last:
+        yield cursor, last
+
+
+def get_deferred_prefix_positions():
+    """
+    Return the set of (VRF ID, prefix) positions affected by the Prefixes saved or deleted by the current thread, or None
+    if recalculation of the prefix hierarchy is not deferred.
+    """
+    return getattr(_deferred, 'positions', None)
+
+
+@contextmanager
+def defer_prefix_hierarchy():
+    """
+    Suppress the recalculation of the surrounding prefix hierarchy each time a Prefix is saved or deleted (e.g. while
+    Prefixes are imported or edited in bulk). On exit, the stored depth and child count of every Prefix surrounding an
+    affected position is recalculated using a single UPDATE. This should be used within a transaction.
+    """
+    if get_deferred_prefix_positions() is not None:
+        # Already deferred; the outermost block will perform the update
+        yield
+        return
+
+    _deferred.positions = set()
+    try:
+        yield
+        positions = _deferred.positions
+    finally:
+        del _deferred.positions
+    if positions:
+        from .models import Prefix
+        Prefix.objects.filter_surrounding(positions).rebuild_hierarchy()
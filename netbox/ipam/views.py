@@ -1,6 +1,9 @@
+from contextlib import contextmanager
+
 import netaddr
 from django.conf import settings
 from django.contrib.auth.mixins import PermissionRequiredMixin
+from django.db import transaction
 from django.db.models import Count, Q
 from django.shortcuts import get_object_or_404, redirect, render
 from django.views.generic import View
@@ -15,15 +18,18 @@ from virtualization.models import VirtualMachine
 from . import filters, forms, tables
 from .constants import IPADDRESS_ROLE_ANYCAST, PREFIX_STATUS_ACTIVE, PREFIX_STATUS_DEPRECATED, PREFIX_STATUS_RESERVED
 from .models import Aggregate, IPAddress, Prefix, RIR, Role, Service, VLAN, VLANGroup, VRF
+from .utils import defer_prefix_hierarchy, get_available_ranges
 
 
-def add_available_prefixes(parent, prefix_list):
+def add_available_prefixes(parent, prefix_list, available_prefixes=None):
     """
-    Create fake Prefix objects for all unallocated space within a prefix.
+    Create fake Prefix objects for all unallocated space within a prefix. If the unallocated space (an IPSet) has
+    already been determined, it may be passed as available_prefixes.
     """
 
     # Find all unallocated space
-    available_prefixes = netaddr.IPSet(parent) ^ netaddr.IPSet([p.prefix for p in prefix_list])
+    if available_prefixes is None:
+        available_prefixes = netaddr.IPSet(parent) ^ netaddr.IPSet([p.prefix for p in prefix_list])
     available_prefixes = [Prefix(prefix=p) for p in available_prefixes.iter_cidrs()]
 
     # Concatenate and sort complete list of children
@@ -39,44 +45,29 @@ def add_available_ipaddresses(prefix, ipaddress_list, is_pool=False):
     considered usable (regardless of mask length).
     """
 
-    output = []
-    prev_ip = None
-
     # Ignore the network and broadcast addresses for non-pool IPv4 prefixes larger than /31.
     if prefix.version == 4 and prefix.prefixlen < 31 and not is_pool:
-        first_ip_in_prefix = netaddr.IPAddress(prefix.first + 1)
-        last_ip_in_prefix = netaddr.IPAddress(prefix.last - 1)
+        first_ip_in_prefix, last_ip_in_prefix = prefix.first + 1, prefix.last - 1
     else:
-        first_ip_in_prefix = netaddr.IPAddress(prefix.first)
-        last_ip_in_prefix = netaddr.IPAddress(prefix.last)
-
-    if not ipaddress_list:
-        return [(
-            int(last_ip_in_prefix - first_ip_in_prefix + 1),
-            '{}/{}'.format(first_ip_in_prefix, prefix.prefixlen)
-        )]
-
-    # Account for any available IPs before the first real IP
-    if ipaddress_list[0].address.ip > first_ip_in_prefix:
-        skipped_count = int(ipaddress_list[0].address.ip - first_ip_in_prefix)
-        first_skipped = '{}/{}'.format(first_ip_in_prefix, prefix.prefixlen)
-        output.append((skipped_count, first_skipped))
-
-    # Iterate through existing IPs and annotate free ranges
-    for ip in ipaddress_list:
-        if prev_ip:
-            diff = int(ip.address.ip - prev_ip.address.ip)
-            if diff > 1:
-                first_skipped = '{}/{}'.format(prev_ip.address.ip + 1, prefix.prefixlen)
-                output.append((diff - 1, first_skipped))
-        output.append(ip)
-        prev_ip = ip
+        first_ip_in_prefix, last_ip_in_prefix = prefix.first, prefix.last
 
-    # Include any remaining available IPs
-    if prev_ip.address.ip < last_ip_in_prefix:
-        skipped_count = int(last_ip_in_prefix - prev_ip.address.ip)
-        first_skipped = '{}/{}'.format(prev_ip.address.ip + 1, prefix.prefixlen)
-        output.append((skipped_count, first_skipped))
+    ipaddress_list = list(ipaddress_list)
+    available_ranges = get_available_ranges(
+        first_ip_in_prefix, last_ip_in_prefix, (ip.address.ip for ip in ipaddress_list)
+    )
+
+    # Interleave the available ranges with the existing IPs (both are in ascending order)
+    output = []
+    ips = iter(ipaddress_list)
+    ip = next(ips, None)
+    for first, last in available_ranges:
+        while ip is not None and int(ip.address.ip) < first:
+            output.append(ip)
+            ip = next(ips, None)
+        output.append((last - first + 1, '{}/{}'.format(netaddr.IPAddress(first, prefix.version), prefix.prefixlen)))
+    while ip is not None:
+        output.append(ip)
+        ip = next(ips, None)
 
     return output
 
@@ -293,7 +284,7 @@ class AggregateListView(PermissionRequiredMixin, ObjectListView):
     permission_required = 'ipam.view_aggregate'
     queryset = Aggregate.objects.prefetch_related('rir').extra(select={
         'child_count': 'SELECT COUNT(*) FROM ipam_prefix WHERE ipam_prefix.prefix <<= ipam_aggregate.prefix',
-    })
+    }).annotate_utilization()
     filter = filters.AggregateFilter
     filter_form = forms.AggregateFilterForm
     table = tables.AggregateDetailTable
@@ -303,12 +294,12 @@ class AggregateListView(PermissionRequiredMixin, ObjectListView):
         ipv4_total = 0
         ipv6_total = 0
 
-        for aggregate in self.queryset:
-            if aggregate.prefix.version == 6:
+        for prefix in self.queryset.values_list('prefix', flat=True):
+            if prefix.version == 6:
                 # Report equivalent /64s for IPv6 to keep things sane
-                ipv6_total += int(aggregate.prefix.size / 2 ** 64)
+                ipv6_total += int(prefix.size / 2 ** 64)
             else:
-                ipv4_total += aggregate.prefix.size
+                ipv4_total += prefix.size
 
         return {
             'ipv4_total': ipv4_total,
@@ -328,7 +319,7 @@ class AggregateView(PermissionRequiredMixin, View):
             prefix__net_contained_or_equal=str(aggregate.prefix)
         ).prefetch_related(
             'site', 'role'
-        ).annotate_depth(
+        ).annotate_relative_depth(
             limit=0
         )
         child_prefixes = add_available_prefixes(aggregate.prefix, child_prefixes)
@@ -448,8 +439,9 @@ class PrefixListView(PermissionRequiredMixin, ObjectListView):
     template_name = 'ipam/prefix_list.html'
 
     def alter_queryset(self, request):
-        # Show only top-level prefixes by default (unless searching)
-        limit = None if request.GET.get('expand') or request.GET.get('q') else 0
+        # Show only top-level prefixes by default (unless searching or filtering)
+        filtered = any(request.GET.get(name) for name in self.filter.base_filters)
+        limit = None if request.GET.get('expand') or filtered else 0
         return self.queryset.annotate_depth(limit=limit)
 
 
@@ -474,7 +466,7 @@ class PrefixView(PermissionRequiredMixin, View):
             prefix__net_contains=str(prefix.prefix)
         ).prefetch_related(
             'site', 'role'
-        ).annotate_depth()
+        ).annotate_relative_depth()
         parent_prefix_table = tables.PrefixTable(list(parent_prefixes), orderable=False)
         parent_prefix_table.exclude = ('vrf',)
 
@@ -504,14 +496,24 @@ class PrefixPrefixesView(PermissionRequiredMixin, View):
 
         prefix = get_object_or_404(Prefix.objects.all(), pk=pk)
 
-        # Child prefixes table
-        child_prefixes = prefix.get_child_prefixes().prefetch_related(
+        # Child prefixes table. Only the top level of the hierarchy is displayed, so retrieve just those children
+        # from the prefix index rather than loading every descendant.
+        top_level = list(prefix.get_child_index().get_top_level(prefix.prefix))
+        parents = {pk for _, _, pks, has_children in top_level if has_children for pk in pks}
+        child_prefixes = list(Prefix.objects.filter(
+            pk__in=[pk for _, _, pks, _ in top_level for pk in pks]
+        ).prefetch_related(
             'site', 'vlan', 'role',
-        ).annotate_depth(limit=0)
+        ))
+        for child in child_prefixes:
+            child.depth = 0
+            child.has_children = child.pk in parents
 
         # Annotate available prefixes
         if child_prefixes:
-            child_prefixes = add_available_prefixes(prefix.prefix, child_prefixes)
+            child_prefixes = add_available_prefixes(
+                prefix.prefix, child_prefixes, available_prefixes=prefix.get_available_prefixes()
+            )
 
         prefix_table = tables.PrefixDetailTable(child_prefixes)
         if request.user.has_perm('ipam.change_prefix') or request.user.has_perm('ipam.delete_prefix'):
@@ -605,6 +607,11 @@ class PrefixBulkImportView(PermissionRequiredMixin, BulkImportView):
     table = tables.PrefixTable
     default_return_url = 'ipam:prefix_list'
 
+    def _import(self, form, progress=None):
+        # Recalculate the prefix hierarchy in a single pass once all prefixes have been imported
+        with transaction.atomic(), defer_prefix_hierarchy():
+            return super()._import(form, progress)
+
 
 class PrefixBulkEditView(PermissionRequiredMixin, BulkEditView):
     permission_required = 'ipam.change_prefix'
@@ -614,6 +621,11 @@ class PrefixBulkEditView(PermissionRequiredMixin, BulkEditView):
     form = forms.PrefixBulkEditForm
     default_return_url = 'ipam:prefix_list'
 
+    def _update_objects(self, *args, **kwargs):
+        # Recalculate the prefix hierarchy in a single pass once all prefixes have been updated
+        with defer_prefix_hierarchy():
+            return super()._update_objects(*args, **kwargs)
+
 
 class PrefixBulkDeleteView(PermissionRequiredMixin, BulkDeleteView):
     permission_required = 'ipam.delete_prefix'
@@ -622,6 +634,12 @@ class PrefixBulkDeleteView(PermissionRequiredMixin, BulkDeleteView):
     table = tables.PrefixTable
     default_return_url = 'ipam:prefix_list'
 
+    @contextmanager
+    def _delete_batch(self):
+        # Recalculate the prefix hierarchy in a single pass once each batch of prefixes has been deleted
+        with defer_prefix_hierarchy():
+            yield
+
 
 #
 # IP addresses
@@ -946,6 +964,10 @@ class VLANBulkImportView(PermissionRequiredMixin, BulkImportView):
     table = tables.VLANTable
     default_return_url = 'ipam:vlan_list'
 
+    def _can_bulk_create(self):
+        # VLAN.clean() validates only the VLAN's own group and site
+        return True
+
 
 class VLANBulkEditView(PermissionRequiredMixin, BulkEditView):
     permission_required = 'ipam.change_vlan'
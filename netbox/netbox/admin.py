@@ -20,7 +20,7 @@ admin_site.register(Group, GroupAdmin)
 admin_site.register(User, UserAdmin)
 
 # Modify the template to include an RQ link if django_rq is installed (see RQ_SHOW_ADMIN_LINK)
-if settings.WEBHOOKS_ENABLED:
+if settings.WEBHOOKS_ENABLED or settings.BACKGROUND_JOBS_ENABLED:
     try:
         import django_rq
         admin_site.index_template = 'django_rq/index.html'
@@ -1,12 +1,17 @@
+from collections import OrderedDict
+
 from django.conf import settings
 from django.db.models import QuerySet
 from rest_framework import authentication, exceptions
-from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
 from rest_framework.permissions import DjangoModelPermissions, SAFE_METHODS
 from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.response import Response
 from rest_framework.utils import formatting
+from rest_framework.utils.urls import replace_query_param
 
 from users.models import Token
+from utilities.paginator import get_count, get_count_mode
 
 
 #
@@ -93,20 +98,31 @@ class OptionalLimitOffsetPagination(LimitOffsetPagination):
     Override the stock paginator to allow setting limit=0 to disable pagination for a request. This returns all objects
     matching a query, but retains the same format as a paginated request. The limit can only be disabled if
     MAX_PAGE_SIZE has been set to 0 or None.
+
+    The count of objects may be approximate, or omitted entirely, depending on the `count` query parameter and
+    COUNT_ESTIMATE_THRESHOLD (see get_count()). If so, the response indicates that the count is approximate, and the
+    presence of a next page is determined by retrieving one object beyond the current page.
     """
 
     def paginate_queryset(self, queryset, request, view=None):
 
         if isinstance(queryset, QuerySet):
-            self.count = queryset.count()
+            self.count, self.count_approximate = get_count(queryset, get_count_mode(request))
         else:
             # We're dealing with an iterable, not a QuerySet
-            self.count = len(queryset)
+            self.count, self.count_approximate = len(queryset), False
 
         self.limit = self.get_limit(request)
         self.offset = self.get_offset(request)
         self.request = request
 
+        if self.count_approximate:
+            if not self.limit:
+                return list(queryset[self.offset:])
+            results = list(queryset[self.offset:self.offset + self.limit + 1])
+            self.has_next = len(results) > self.limit
+            return results[:self.limit]
+
         if self.limit and self.count > self.limit and self.template is not None:
             self.display_page_controls = True
 
@@ -118,6 +134,19 @@ class OptionalLimitOffsetPagination(LimitOffsetPagination):
         else:
             return list(queryset[self.offset:])
 
+    def get_paginated_response(self, data):
+
+        if not self.count_approximate:
+            return super().get_paginated_response(data)
+
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('count_approximate', True),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
     def get_limit(self, request):
 
         if self.limit_query_param:
@@ -143,6 +172,14 @@ class OptionalLimitOffsetPagination(LimitOffsetPagination):
         if not self.limit:
             return None
 
+        # The count may not be relied upon to determine whether there is a next page
+        if self.count_approximate:
+            if not self.has_next:
+                return None
+            url = self.request.build_absolute_uri()
+            url = replace_query_param(url, self.limit_query_param, self.limit)
+            return replace_query_param(url, self.offset_query_param, self.offset + self.limit)
+
         return super().get_next_link()
 
     def get_previous_link(self):
@@ -154,6 +191,33 @@ class OptionalLimitOffsetPagination(LimitOffsetPagination):
         return super().get_previous_link()
 
 
+class KeysetPagination(CursorPagination):
+    """
+    An alternative to OptionalLimitOffsetPagination, requested by passing the `cursor` query parameter (initially
+    empty). Objects are ordered by primary key, and each page is retrieved by filtering on the primary key of the last
+    object on the previous page rather than by offset, so every page is retrieved at the same (indexed) cost regardless
+    of its depth. The total count of objects is not computed. Each page links to the next and previous pages by an
+    opaque cursor.
+    """
+    ordering = 'pk'
+    page_size_query_param = 'limit'
+
+    def get_page_size(self, request):
+
+        # Interpret the limit as OptionalLimitOffsetPagination does
+        try:
+            limit = int(request.query_params[self.page_size_query_param])
+            if limit < 0:
+                raise ValueError()
+        except (KeyError, ValueError):
+            return self.page_size
+
+        # Enforce maximum page size, if defined
+        if settings.MAX_PAGE_SIZE:
+            return min(limit, settings.MAX_PAGE_SIZE) if limit else settings.MAX_PAGE_SIZE
+        return limit
+
+
 #
 # Miscellaneous
 #
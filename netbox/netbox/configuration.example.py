@@ -61,12 +61,25 @@ BANNER_LOGIN = ''
 # BASE_PATH = 'netbox/'
 BASE_PATH = ''
 
+# Process bulk imports and large bulk deletions as background jobs rather than within the request. Note that this
+# requires a Redis database be configured and accessible by NetBox, and at least one RQ worker be running (see
+# WEBHOOKS_ENABLED).
+BACKGROUND_JOBS_ENABLED = False
+
 # Cache timeout in seconds. Set to 0 to dissable caching. Defaults to 900 (15 minutes)
 CACHE_TIMEOUT = 900
 
+# Maximum number of changes to record within a request. Any further changes are handed off to a background job (requires
+# BACKGROUND_JOBS_ENABLED). Set to 0 to record all changes within the request. (Default: 0)
+CHANGELOG_INLINE_LIMIT = 0
+
 # Maximum number of days to retain logged changes. Set to 0 to retain changes indefinitely. (Default: 90)
 CHANGELOG_RETENTION = 90
 
+# Record a full snapshot of an object's data once every this many changes to it; the changes in between record only the
+# differences from that snapshot. Set to 0 to record every change in full. (Default: 0)
+CHANGELOG_SNAPSHOT_INTERVAL = 0
+
 # API Cross-Origin Resource Sharing (CORS) settings. If CORS_ORIGIN_ALLOW_ALL is set to True, all origins will be
 # allowed. Otherwise, define a list of allowed origins using either CORS_ORIGIN_WHITELIST or
 # CORS_ORIGIN_REGEX_WHITELIST. For more information, see https://github.com/ottoyiu/django-cors-headers
@@ -78,6 +91,10 @@ CORS_ORIGIN_REGEX_WHITELIST = [
     # r'^(https?://)?(\w+\.)?example\.com$',
 ]
 
+# Report the approximate rather than the exact count of objects in a list (in the web UI and the API) when the query
+# planner estimates that the list contains more than this number of objects. Set to 0 to always count objects exactly.
+COUNT_ESTIMATE_THRESHOLD = 0
+
 # Set to True to enable server debugging. WARNING: Debugging introduces a substantial performance penalty and may reveal
 # sensitive information about your installation. Only enable debugging while performing testing. Never enable debugging
 # on a production system.
@@ -60,11 +60,15 @@ BANNER_TOP = getattr(configuration, 'BANNER_TOP', '')
 BASE_PATH = getattr(configuration, 'BASE_PATH', '')
 if BASE_PATH:
     BASE_PATH = BASE_PATH.strip('/') + '/'  # Enforce trailing slash only
+BACKGROUND_JOBS_ENABLED = getattr(configuration, 'BACKGROUND_JOBS_ENABLED', False)
 CACHE_TIMEOUT = getattr(configuration, 'CACHE_TIMEOUT', 900)
+CHANGELOG_INLINE_LIMIT = getattr(configuration, 'CHANGELOG_INLINE_LIMIT', 0)
 CHANGELOG_RETENTION = getattr(configuration, 'CHANGELOG_RETENTION', 90)
+CHANGELOG_SNAPSHOT_INTERVAL = getattr(configuration, 'CHANGELOG_SNAPSHOT_INTERVAL', 0)
 CORS_ORIGIN_ALLOW_ALL = getattr(configuration, 'CORS_ORIGIN_ALLOW_ALL', False)
 CORS_ORIGIN_REGEX_WHITELIST = getattr(configuration, 'CORS_ORIGIN_REGEX_WHITELIST', [])
 CORS_ORIGIN_WHITELIST = getattr(configuration, 'CORS_ORIGIN_WHITELIST', [])
+COUNT_ESTIMATE_THRESHOLD = getattr(configuration, 'COUNT_ESTIMATE_THRESHOLD', 0)
 DATE_FORMAT = getattr(configuration, 'DATE_FORMAT', 'N j, Y')
 DATETIME_FORMAT = getattr(configuration, 'DATETIME_FORMAT', 'N j, Y g:i a')
 DEBUG = getattr(configuration, 'DEBUG', False)
@@ -186,8 +190,8 @@ INSTALLED_APPS = [
     'drf_yasg',
 ]
 
-# Only load django-rq if the webhook backend is enabled
-if WEBHOOKS_ENABLED:
+# Only load django-rq if the webhook backend or background jobs are enabled
+if WEBHOOKS_ENABLED or BACKGROUND_JOBS_ENABLED:
     INSTALLED_APPS.append('django_rq')
 
 # Middleware
@@ -462,7 +466,7 @@ SWAGGER_SETTINGS = {
 
 
 #
-# Django RQ (Webhooks backend)
+# Django RQ (Webhooks backend and import jobs)
 #
 
 RQ_QUEUES = {
@@ -62,7 +62,7 @@ _patterns = [
 
 ]
 
-if settings.WEBHOOKS_ENABLED:
+if settings.WEBHOOKS_ENABLED or settings.BACKGROUND_JOBS_ENABLED:
     _patterns += [
         path(r'admin/webhook-backend-status/', include('django_rq.urls')),
     ]
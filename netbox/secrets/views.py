@@ -204,6 +204,8 @@ class SecretBulkImportView(BulkImportView):
     template_name = 'secrets/secret_import.html'
     default_return_url = 'secrets:secret_list'
     widget_attrs = {'class': 'requires-session-key'}
+    # The master key is derived from the user's session key and must never leave the request
+    background_import = False
 
     master_key = None
 
@@ -2,20 +2,40 @@ from collections import OrderedDict
 
 import pytz
 from django.conf import settings
+from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
-from django.core.exceptions import FieldError, MultipleObjectsReturned, ObjectDoesNotExist
-from django.db.models import ManyToManyField, ProtectedError
+from django.core.exceptions import FieldDoesNotExist, FieldError, MultipleObjectsReturned, ObjectDoesNotExist
+from django.db import connection
+from django.db.models import ManyToManyField, Model, Prefetch, ProtectedError, QuerySet, prefetch_related_objects
+from django.db.models.constants import LOOKUP_SEP
 from django.http import Http404
 from rest_framework.exceptions import APIException
-from rest_framework.permissions import BasePermission
-from rest_framework.relations import PrimaryKeyRelatedField, RelatedField
+from rest_framework.permissions import SAFE_METHODS, BasePermission
+from rest_framework.relations import HyperlinkedIdentityField, ManyRelatedField, PrimaryKeyRelatedField, RelatedField
 from rest_framework.response import Response
-from rest_framework.serializers import Field, ModelSerializer, ValidationError
+from rest_framework.serializers import Field, ListSerializer, ModelSerializer, Serializer, ValidationError
 from rest_framework.viewsets import ModelViewSet as _ModelViewSet, ViewSet
 
+from netbox.api import KeysetPagination
 from .utils import dict_to_filter_params, dynamic_import
 
 
+# The maximum depth of nested serializers for which related objects are retrieved by get_optimized_queryset()
+OPTIMIZER_MAX_DEPTH = 3
+
+
+class QueryCounter:
+    """
+    A database execute wrapper which counts the number of queries executed.
+    """
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
 class ServiceUnavailable(APIException):
     status_code = 503
     default_detail = "Service temporarily unavailable, please try again later."
@@ -41,6 +61,276 @@ def get_serializer_for_model(model, prefix=''):
         )
 
 
+#
+# Sparse fieldsets
+#
+
+class SparseFieldset:
+    """
+    The set of fields requested by the client using the `fields` and/or `exclude` query parameters, each of which takes
+    a comma-separated list of field names. Unknown field names are ignored. Applies only to safe (read-only) requests.
+    """
+    def __init__(self, request):
+        self.fields = None
+        self.exclude = set()
+
+        if request is None or request.method not in SAFE_METHODS:
+            return
+
+        fields = self._parse(request, 'fields')
+        if fields:
+            self.fields = fields
+        self.exclude = self._parse(request, 'exclude')
+
+    @staticmethod
+    def _parse(request, param):
+        names = set()
+        for value in request.query_params.getlist(param):
+            names.update(name.strip() for name in value.split(',') if name.strip())
+        return names
+
+    def __bool__(self):
+        return self.fields is not None or bool(self.exclude)
+
+    def __contains__(self, name):
+        return (self.fields is None or name in self.fields) and name not in self.exclude
+
+
+def _get_field_sources(serializer):
+    """
+    Compile the `field_sources` declared by a serializer class and its parents. This maps the names of fields which are
+    not backed directly by a model field (e.g. properties or method fields) to the model fields on which they depend.
+    """
+    field_sources = {}
+    for cls in reversed(type(serializer).__mro__):
+        field_sources.update(getattr(cls, 'field_sources', {}))
+    return field_sources
+
+
+def _get_field_roots(name, field, field_sources):
+    """
+    Return the names of the model attributes on which a serializer field depends, or None if they can't be determined.
+    """
+    if name in field_sources:
+        return field_sources[name]
+    if isinstance(field, HyperlinkedIdentityField):
+        return []
+    if field.source == '*':
+        return None
+    return [field.source_attrs[0]]
+
+
+def _flatten_select_related(select_related, prefix=''):
+    paths = []
+    for name, children in select_related.items():
+        path = prefix + name
+        paths.append(path)
+        paths.extend(_flatten_select_related(children, path + LOOKUP_SEP))
+    return paths
+
+
+def get_sparse_queryset(queryset, serializer):
+    """
+    Prune the queryset to suit the given (sparse) serializer: drop any select_related() and prefetch_related() lookups
+    which are not needed to render its fields, and defer the loading of all other model fields. If the model fields on
+    which a serializer field depends cannot be determined, the queryset is returned unaltered.
+    """
+    model = queryset.model
+
+    # Determine the root of the source of each serializer field
+    field_sources = _get_field_sources(serializer)
+    roots = {model._meta.pk.name}
+    for name, field in serializer.fields.items():
+        field_roots = _get_field_roots(name, field, field_sources)
+        if field_roots is None:
+            return queryset
+        roots.update(field_roots)
+
+    # Map each root to a concrete model field (if it is not an annotation or a relation)
+    columns = set()
+    for root in list(roots):
+        if root in queryset.query.annotations:
+            continue
+        try:
+            field = model._meta.get_field(root)
+        except FieldDoesNotExist:
+            return queryset
+        if isinstance(field, GenericForeignKey):
+            roots.update((field.ct_field, field.fk_field))
+            columns.update((field.ct_field, field.fk_field))
+        elif field.concrete and not field.many_to_many:
+            columns.add(root)
+
+    # Drop unneeded prefetch_related() lookups
+    prefetch_lookups = []
+    for lookup in queryset._prefetch_related_lookups:
+        path = lookup.prefetch_through if isinstance(lookup, Prefetch) else lookup
+        if path.split(LOOKUP_SEP)[0] in roots:
+            prefetch_lookups.append(lookup)
+    queryset = queryset.prefetch_related(None).prefetch_related(*prefetch_lookups)
+
+    # Drop unneeded select_related() lookups. (select_related() with no arguments follows all non-null relations, which
+    # can't be reconciled with deferred fields.)
+    select_related = queryset.query.select_related
+    if select_related is True:
+        return queryset
+    if select_related:
+        paths = [
+            path for path in _flatten_select_related(select_related) if path.split(LOOKUP_SEP)[0] in roots
+        ]
+        queryset = queryset.select_related(None).select_related(*paths)
+
+    # Defer all unneeded model fields. Models which access their fields upon initialization are excluded, since doing so
+    # would require an additional query per object.
+    if model.__init__ is Model.__init__:
+        queryset = queryset.only(*columns)
+
+    return queryset
+
+
+def _get_nested_serializer(field):
+    """
+    Return the serializer (if any) used to represent the related object(s) of a serializer field.
+    """
+    if isinstance(field, ListSerializer):
+        field = field.child
+    elif isinstance(field, ManyRelatedField) and isinstance(field.child_relation, SerializedPKRelatedField):
+        field = field.child_relation.serializer()
+    return field if isinstance(field, Serializer) else None
+
+
+def _get_default_nested_serializer(model):
+    try:
+        return get_serializer_for_model(model, prefix='Nested')()
+    except SerializerNotFound:
+        return None
+
+
+def _get_related_lookups(model, serializer, prefix='', depth=0):
+    """
+    Return the lists of select_related() and prefetch_related() lookups needed to render the fields of a serializer.
+    """
+    select_related = []
+    prefetch_lookups = []
+    field_sources = _get_field_sources(serializer)
+
+    for name, field in serializer.fields.items():
+        nested_serializer = _get_nested_serializer(field)
+
+        for root in _get_field_roots(name, field, field_sources) or []:
+            try:
+                model_field = model._meta.get_field(root)
+            except FieldDoesNotExist:
+                continue
+            path = prefix + root
+
+            # Generic foreign keys are prefetched along with their content types. (The relations of the objects to
+            # which they point are prefetched separately by prefetch_generic_related_objects().)
+            if isinstance(model_field, GenericForeignKey):
+                select_related.append(prefix + model_field.ct_field)
+                prefetch_lookups.append(path)
+                continue
+
+            if not model_field.is_relation:
+                continue
+
+            # Properties and method fields which depend on a related object are assumed to render its nested
+            # representation
+            related_serializer = nested_serializer
+            if related_serializer is None and name in field_sources:
+                related_serializer = _get_default_nested_serializer(model_field.related_model)
+
+            # Many-valued relations are prefetched, using a queryset optimized for the nested serializer (if any)
+            if model_field.many_to_many or model_field.one_to_many:
+                if related_serializer is not None and depth < OPTIMIZER_MAX_DEPTH:
+                    related_queryset = _optimize_queryset(
+                        model_field.related_model._default_manager.all(), related_serializer, depth + 1
+                    )
+                    prefetch_lookups.append(Prefetch(path, queryset=related_queryset))
+                else:
+                    prefetch_lookups.append(path)
+
+            # Single-valued relations are joined if the related object is needed (rather than only its primary key)
+            elif related_serializer is not None or name in field_sources or (
+                isinstance(field, RelatedField) and not field.use_pk_only_optimization()
+            ):
+                select_related.append(path)
+                if related_serializer is not None and depth < OPTIMIZER_MAX_DEPTH:
+                    nested_select_related, nested_prefetch_lookups = _get_related_lookups(
+                        model_field.related_model, related_serializer, path + LOOKUP_SEP, depth + 1
+                    )
+                    select_related.extend(nested_select_related)
+                    prefetch_lookups.extend(nested_prefetch_lookups)
+
+    return select_related, prefetch_lookups
+
+
+def _optimize_queryset(queryset, serializer, depth=0):
+    select_related, prefetch_lookups = _get_related_lookups(queryset.model, serializer, depth=depth)
+
+    # Add select_related() lookups, unless the queryset already follows all relations
+    if select_related and queryset.query.select_related is not True:
+        queryset = queryset.select_related(*select_related)
+
+    # Add prefetch_related() lookups which don't overlap with any already present on the queryset
+    existing_paths = [
+        lookup.prefetch_to if isinstance(lookup, Prefetch) else lookup
+        for lookup in queryset._prefetch_related_lookups
+    ]
+    new_lookups = []
+    for lookup in prefetch_lookups:
+        path = lookup.prefetch_to if isinstance(lookup, Prefetch) else lookup
+        if not any(p == path or p.startswith(path + LOOKUP_SEP) for p in existing_paths):
+            new_lookups.append(lookup)
+            existing_paths.append(path)
+    if new_lookups:
+        queryset = queryset.prefetch_related(*new_lookups)
+
+    return queryset
+
+
+def prefetch_generic_related_objects(instances, serializer):
+    """
+    Prefetch the related objects needed to render the objects to which any generic foreign keys on the given instances
+    point. These can't be prefetched by the queryset itself, since the lookups required vary by content type.
+    """
+    model = serializer.Meta.model
+    field_sources = _get_field_sources(serializer)
+
+    for name, field in serializer.fields.items():
+        for root in _get_field_roots(name, field, field_sources) or []:
+            try:
+                model_field = model._meta.get_field(root)
+            except FieldDoesNotExist:
+                continue
+            if not isinstance(model_field, GenericForeignKey):
+                continue
+
+            # Group the related objects by model
+            related_objects = OrderedDict()
+            for instance in instances:
+                obj = getattr(instance, root)
+                if obj is not None:
+                    related_objects.setdefault(type(obj), []).append(obj)
+
+            for related_model, objects in related_objects.items():
+                related_serializer = _get_nested_serializer(field) or _get_default_nested_serializer(related_model)
+                if related_serializer is None:
+                    continue
+                select_related, prefetch_lookups = _get_related_lookups(related_model, related_serializer, depth=1)
+                prefetch_related_objects(objects, *select_related, *prefetch_lookups)
+
+
+def get_optimized_queryset(queryset, serializer):
+    """
+    Add the select_related() and prefetch_related() lookups needed to render the fields of the given serializer
+    (including those of its nested serializers) to the queryset. Single-valued relations are joined using
+    select_related(), while many-valued relations are prefetched using a Prefetch whose queryset is in turn optimized
+    for the nested serializer. Lookups already present on the queryset are preserved.
+    """
+    return _optimize_queryset(queryset, serializer)
+
+
 #
 # Authentication
 #
@@ -253,15 +543,56 @@ class WritableNestedSerializer(ModelSerializer):
 
 class ModelViewSet(_ModelViewSet):
     """
-    Accept either a single object or a list of objects to create.
+    Accept either a single object or a list of objects to create. Read-only requests may limit the fields returned using
+    the `fields` and/or `exclude` query parameters.
     """
+    @property
+    def fieldset(self):
+        if not hasattr(self, '_fieldset'):
+            self._fieldset = SparseFieldset(self.request)
+        return self._fieldset
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+
+        if isinstance(queryset, QuerySet):
+            serializer = self.get_serializer()
+
+            # Retrieve all related objects needed to render the serializer
+            queryset = get_optimized_queryset(queryset, serializer)
+
+            # Avoid retrieving anything not needed to render the requested fields
+            if self.fieldset:
+                queryset = get_sparse_queryset(queryset, serializer)
+
+        return queryset
+
     def get_serializer(self, *args, **kwargs):
 
         # If a list of objects has been provided, initialize the serializer with many=True
         if isinstance(kwargs.get('data', {}), list):
             kwargs['many'] = True
 
-        return super().get_serializer(*args, **kwargs)
+        serializer = super().get_serializer(*args, **kwargs)
+
+        # Remove any fields which have not been requested
+        if self.fieldset:
+            fields = serializer.child.fields if isinstance(serializer, ListSerializer) else serializer.fields
+            for name in list(fields):
+                if name not in self.fieldset:
+                    del fields[name]
+
+        # Prefetch the related objects of any generic foreign keys
+        if isinstance(serializer, ListSerializer) and serializer.instance is not None:
+            if isinstance(serializer.child, ModelSerializer):
+                prefetch_generic_related_objects(list(serializer.instance), serializer.child)
+
+        return serializer
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fieldset'] = self.fieldset
+        return context
 
     def get_serializer_class(self):
 
@@ -277,7 +608,27 @@ class ModelViewSet(_ModelViewSet):
         # Fall back to the hard-coded serializer class
         return self.serializer_class
 
+    def paginate_queryset(self, queryset):
+
+        # If 'cursor' has been passed as a query param, paginate the queryset by primary key rather than by offset
+        if isinstance(queryset, QuerySet) and KeysetPagination.cursor_query_param in self.request.query_params:
+            self._paginator = KeysetPagination()
+
+        return super().paginate_queryset(queryset)
+
     def dispatch(self, request, *args, **kwargs):
+
+        # In debug mode, report the number of database queries executed for the request
+        if settings.DEBUG:
+            query_counter = QueryCounter()
+            with connection.execute_wrapper(query_counter):
+                response = self._dispatch(request, *args, **kwargs)
+            response['X-Query-Count'] = query_counter.count
+            return response
+
+        return self._dispatch(request, *args, **kwargs)
+
+    def _dispatch(self, request, *args, **kwargs):
         try:
             return super().dispatch(request, *args, **kwargs)
         except ProtectedError as e:
@@ -6,7 +6,7 @@ from io import StringIO
 from django import forms
 from django.conf import settings
 from django.contrib.postgres.forms.jsonb import JSONField as _JSONField, InvalidJSONInput
-from django.db.models import Count
+from django.db.models import CharField, Count
 from django.urls import reverse_lazy
 from mptt.forms import TreeNodeMultipleChoiceField
 
@@ -518,6 +518,42 @@ class FlexibleModelChoiceField(forms.ModelChoiceField):
         return value
 
 
+class PreloadedModelChoiceField(forms.Field):
+    """
+    Stands in for a ModelChoiceField when validating data in bulk (e.g. a CSV import), resolving each value from a
+    dictionary of objects retrieved in advance (see preload_model_choices()) rather than querying the database.
+    """
+    def __init__(self, field, objects):
+        super().__init__(required=field.required, label=field.label, error_messages=field.error_messages)
+        self.objects = objects
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            return self.objects[value]
+        except (KeyError, TypeError):
+            raise forms.ValidationError(self.error_messages['invalid_choice'], code='invalid_choice')
+
+
+def preload_model_choices(form, records):
+    """
+    Retrieve all objects referenced by each ModelChoiceField of the given form within a list of records (e.g. parsed CSV
+    data), using a single query per field. Only fields which reference objects by a unique text field (such as name or
+    slug) are considered. Returns a dictionary mapping field names to dictionaries of {value: object}.
+    """
+    lookups = {}
+    for name, field in form.fields.items():
+        if type(field) is not forms.ModelChoiceField or not field.to_field_name:
+            continue
+        model_field = field.queryset.model._meta.get_field(field.to_field_name)
+        if not isinstance(model_field, CharField) or not model_field.unique:
+            continue
+        values = {record[name] for record in records if record.get(name) not in field.empty_values}
+        lookups[name] = field.queryset.in_bulk(values, field_name=field.to_field_name) if values else {}
+    return lookups
+
+
 class ChainedModelChoiceField(forms.ModelChoiceField):
     """
     A ModelChoiceField which is initialized based on the values of other fields within a form. `chains` is a dictionary
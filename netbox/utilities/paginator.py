@@ -1,10 +1,101 @@
+import hashlib
+import json
+
+from cacheops import CacheMiss, cache
 from django.conf import settings
-from django.core.paginator import Paginator, Page
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator, Page
+from django.db import connections
 
+# Values of the `count` query parameter, which determines how the total count of objects in a list is computed
+COUNT_EXACT = 'true'
+COUNT_ESTIMATE = 'estimate'
+COUNT_NONE = 'false'
 
-class EnhancedPaginator(Paginator):
 
-    def __init__(self, object_list, per_page, **kwargs):
+def get_count_mode(request):
+    """
+    Return the counting mode requested by the client (if any).
+    """
+    mode = request.GET.get('count')
+    if mode in (COUNT_EXACT, COUNT_ESTIMATE, COUNT_NONE):
+        return mode
+    return None
+
+
+def estimate_count(queryset):
+    """
+    Return the PostgreSQL query planner's estimate of the number of objects in the queryset. The estimate is derived from
+    table statistics rather than by scanning the table, so it is cheap to obtain but may be inaccurate (particularly for
+    heavily filtered querysets).
+    """
+    try:
+        sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    except EmptyResultSet:
+        return 0
+
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) {}'.format(sql), params)
+        plan = cursor.fetchone()[0]
+
+    # psycopg2 decodes JSON values automatically, but other drivers may not
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    return plan[0]['Plan']['Plan Rows']
+
+
+def _get_count_cache_key(queryset):
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        return None
+    digest = hashlib.md5('{}{}'.format(sql, params).encode('utf-8')).hexdigest()
+    return 'count:{}:{}'.format(queryset.model._meta.label_lower, digest)
+
+
+def get_count(queryset, mode=None):
+    """
+    Return the number of objects in the queryset, and a boolean indicating whether that number is approximate.
+
+    An exact count is returned unless its estimate exceeds COUNT_ESTIMATE_THRESHOLD (if set), in which case the most
+    recent exact count of the same query (cached for CACHE_TIMEOUT seconds) or else the planner's estimate is returned
+    instead. The client may instead request an exact count (COUNT_EXACT), an approximate count regardless of the
+    threshold (COUNT_ESTIMATE), or no count at all (COUNT_NONE), in which case the count returned is None.
+    """
+    if mode == COUNT_NONE:
+        return None, True
+
+    if mode == COUNT_EXACT:
+        count = queryset.count()
+        cache_key = _get_count_cache_key(queryset)
+        if settings.CACHEOPS_ENABLED and cache_key:
+            cache.set(cache_key, count, settings.CACHE_TIMEOUT)
+        return count, False
+
+    if mode is None and not settings.COUNT_ESTIMATE_THRESHOLD:
+        return queryset.count(), False
+
+    count = estimate_count(queryset)
+    if mode is None and count <= settings.COUNT_ESTIMATE_THRESHOLD:
+        return queryset.count(), False
+
+    cache_key = _get_count_cache_key(queryset)
+    if settings.CACHEOPS_ENABLED and cache_key:
+        try:
+            count = cache.get(cache_key)
+        except CacheMiss:
+            pass
+
+    return count, True
+
+
+class EnhancedPaginator(Paginator):
+    """
+    A Paginator which accepts a precomputed (and possibly approximate) count of objects. If no count is given, the
+    objects are counted as usual.
+    """
+    def __init__(self, object_list, per_page, count=None, count_approximate=False, **kwargs):
         try:
             per_page = int(per_page)
             if per_page < 1:
@@ -14,11 +105,69 @@ class EnhancedPaginator(Paginator):
 
         super().__init__(object_list, per_page, **kwargs)
 
+        if count is not None:
+            self.count = count
+        self.count_approximate = count_approximate
+
+    def validate_number(self, number):
+
+        # If the count is approximate, don't rely on it to determine the number of pages
+        if not self.count_approximate:
+            return super().validate_number(number)
+
+        try:
+            if isinstance(number, float) and not number.is_integer():
+                raise ValueError
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        return number
+
+    def page(self, number):
+
+        # If the count is approximate, don't rely on it to determine the number of objects on the last page (or whether
+        # there is a next page). Instead, retrieve one object beyond the current page.
+        if not self.count_approximate:
+            return super().page(number)
+
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        object_list = list(self.object_list[bottom:bottom + self.per_page + 1])
+        has_next = len(object_list) > self.per_page
+        if not object_list and number > 1:
+            raise EmptyPage('That page contains no results')
+
+        # The count is at least the number of objects up to and including the current page (and the next, if any)
+        if self.count is None or self.count < bottom + len(object_list):
+            self.count = bottom + len(object_list)
+            self.__dict__.pop('num_pages', None)
+
+        page = self._get_page(object_list[:self.per_page], number, self)
+        page.has_next_page = has_next
+        return page
+
     def _get_page(self, *args, **kwargs):
         return EnhancedPage(*args, **kwargs)
 
 
 class EnhancedPage(Page):
+    has_next_page = None
+
+    def has_next(self):
+
+        if self.has_next_page is not None:
+            return self.has_next_page
+
+        return super().has_next()
+
+    def end_index(self):
+
+        if self.paginator.count_approximate:
+            return self.start_index() + len(self) - 1
+
+        return super().end_index()
 
     def smart_pages(self):
 
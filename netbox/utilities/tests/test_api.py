@@ -1,8 +1,15 @@
+from unittest.mock import patch
+
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 
-from dcim.models import Region, Site
+from dcim.api.serializers import CableSerializer
+from dcim.models import Cable, Device, DeviceRole, DeviceType, Interface, Manufacturer, Region, Site
 from ipam.models import VLAN
+from utilities.api import get_optimized_queryset
 from utilities.testing import APITestCase
 
 
@@ -117,3 +124,267 @@ class WritableNestedSerializerTest(APITestCase):
 
         self.assertHttpStatus(response, status.HTTP_400_BAD_REQUEST)
         self.assertEqual(VLAN.objects.count(), 0)
+
+
+class KeysetPaginationTest(APITestCase):
+    """
+    Test the operation of KeysetPagination using the Site list endpoint.
+    """
+
+    def setUp(self):
+
+        super().setUp()
+
+        # Create Sites in reverse order of name, so that primary key order differs from the default ordering
+        for i in range(5, 0, -1):
+            Site.objects.create(name='Site {}'.format(i), slug='site-{}'.format(i))
+
+    def test_keyset_pagination(self):
+
+        url = '{}?cursor=&limit=2'.format(reverse('dcim-api:site-list'))
+        pks = []
+        while url:
+            response = self.client.get(url, **self.header)
+            self.assertHttpStatus(response, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            self.assertLessEqual(len(response.data['results']), 2)
+            pks += [site['id'] for site in response.data['results']]
+            url = response.data['next']
+
+        # Every object is returned exactly once, ordered by primary key
+        self.assertEqual(pks, sorted(Site.objects.values_list('pk', flat=True)))
+
+    def test_keyset_pagination_filtered(self):
+
+        url = '{}?cursor=&limit=2&name=Site 1&name=Site 2&name=Site 3'.format(reverse('dcim-api:site-list'))
+        response = self.client.get(url, **self.header)
+        self.assertHttpStatus(response, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 2)
+
+        # The next page continues after the last object on this page, retaining any filters
+        response = self.client.get(response.data['next'], **self.header)
+        self.assertHttpStatus(response, status.HTTP_200_OK)
+        self.assertEqual([site['name'] for site in response.data['results']], ['Site 1'])
+        self.assertIsNone(response.data['next'])
+        self.assertIsNotNone(response.data['previous'])
+
+    def test_invalid_cursor(self):
+
+        url = '{}?cursor=foo'.format(reverse('dcim-api:site-list'))
+        response = self.client.get(url, **self.header)
+        self.assertHttpStatus(response, status.HTTP_404_NOT_FOUND)
+
+
+class ApproximateCountTest(APITestCase):
+    """
+    Test the reporting of approximate counts using the Site list endpoint.
+    """
+
+    def setUp(self):
+
+        super().setUp()
+
+        for i in range(1, 6):
+            Site.objects.create(name='Site {}'.format(i), slug='site-{}'.format(i))
+
+    def test_exact_count(self):
+
+        url = '{}?limit=2'.format(reverse('dcim-api:site-list'))
+        response = self.client.get(url, **self.header)
+
+        self.assertHttpStatus(response, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 5)
+        self.assertNotIn('count_approximate', response.data)
+
+    def test_estimated_count(self):
+
+        url = '{}?limit=2&count=estimate'.format(reverse('dcim-api:site-list'))
+        response = self.client.get(url, **self.header)
+
+        self.assertHttpStatus(response, status.HTTP_200_OK)
+        self.assertIsInstance(response.data['count'], int)
+        self.assertTrue(response.data['count_approximate'])
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNotNone(response.data['next'])
+
+    def test_no_count(self):
+
+        url = '{}?limit=2&offset=4&count=false'.format(reverse('dcim-api:site-list'))
+        response = self.client.get(url, **self.header)
+
+        # The absence of a next page is determined without counting objects
+        self.assertHttpStatus(response, status.HTTP_200_OK)
+        self.assertIsNone(response.data['count'])
+        self.assertTrue(response.data['count_approximate'])
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertIsNone(response.data['next'])
+        self.assertIsNotNone(response.data['previous'])
+
+    def test_count_estimate_threshold(self):
+
+        url = '{}?limit=2'.format(reverse('dcim-api:site-list'))
+
+        with self.settings(COUNT_ESTIMATE_THRESHOLD=1000000):
+            response = self.client.get(url, **self.header)
+            self.assertEqual(response.data['count'], 5)
+            self.assertNotIn('count_approximate', response.data)
+
+        # Counts are approximate if the estimated count exceeds the threshold. (The planner's estimate depends on the
+        # table statistics, so it is fixed here.)
+        with self.settings(COUNT_ESTIMATE_THRESHOLD=1), patch('utilities.paginator.estimate_count', return_value=10):
+            response = self.client.get(url, **self.header)
+            self.assertTrue(response.data['count_approximate'])
+
+            # An exact count may be requested regardless of the threshold
+            response = self.client.get('{}&count=true'.format(url), **self.header)
+            self.assertEqual(response.data['count'], 5)
+            self.assertNotIn('count_approximate', response.data)
+
+
+class SparseFieldsetTest(APITestCase):
+    """
+    Test the selection of fields using the Device endpoints.
+    """
+
+    def setUp(self):
+
+        super().setUp()
+
+        site = Site.objects.create(name='Site 1', slug='site-1')
+        manufacturer = Manufacturer.objects.create(name='Manufacturer 1', slug='manufacturer-1')
+        device_type = DeviceType.objects.create(manufacturer=manufacturer, model='Device Type 1', slug='device-type-1')
+        device_role = DeviceRole.objects.create(name='Device Role 1', slug='device-role-1')
+        for i in range(1, 4):
+            Device.objects.create(
+                name='Device {}'.format(i), device_type=device_type, device_role=device_role, site=site
+            )
+
+    def test_fields(self):
+
+        url = '{}?fields=id,name,primary_ip,foo'.format(reverse('dcim-api:device-list'))
+        response = self.client.get(url, **self.header)
+
+        self.assertHttpStatus(response, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 3)
+        for device in response.data['results']:
+            self.assertEqual(set(device), {'id', 'name', 'primary_ip'})
+
+    def test_exclude(self):
+
+        url = '{}?exclude=config_context,custom_fields&exclude=site'.format(reverse('dcim-api:device-list'))
+        response = self.client.get(url, **self.header)
+
+        self.assertHttpStatus(response, status.HTTP_200_OK)
+        device = response.data['results'][0]
+        self.assertIn('name', device)
+        self.assertIn('device_type', device)
+        self.assertNotIn('config_context', device)
+        self.assertNotIn('custom_fields', device)
+        self.assertNotIn('site', device)
+
+    def test_fields_detail(self):
+
+        device = Device.objects.first()
+        url = '{}?fields=name,site'.format(reverse('dcim-api:device-detail', kwargs={'pk': device.pk}))
+        response = self.client.get(url, **self.header)
+
+        self.assertHttpStatus(response, status.HTTP_200_OK)
+        self.assertEqual(response.data['name'], device.name)
+        self.assertEqual(response.data['site']['name'], 'Site 1')
+        self.assertNotIn('config_context', response.data)
+
+    def test_fields_reduce_queries(self):
+
+        url = reverse('dcim-api:device-list')
+        with CaptureQueriesContext(connection) as full:
+            self.client.get(url, **self.header)
+        with CaptureQueriesContext(connection) as sparse:
+            response = self.client.get('{}?fields=id,name'.format(url), **self.header)
+
+        # Related objects, custom fields, and config contexts are not retrieved
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertLess(len(sparse), len(full))
+        self.assertFalse(any('dcim_site' in query['sql'] for query in sparse.captured_queries))
+        self.assertFalse(any('extras_configcontext' in query['sql'] for query in sparse.captured_queries))
+
+        # Unneeded columns are deferred
+        device_query = [query['sql'] for query in sparse.captured_queries if 'FROM "dcim_device"' in query['sql']][-1]
+        self.assertNotIn('"dcim_device"."serial"', device_query)
+
+    def test_fields_ignored_on_write(self):
+
+        device = Device.objects.first()
+        url = '{}?fields=id'.format(reverse('dcim-api:device-detail', kwargs={'pk': device.pk}))
+        response = self.client.patch(url, {'serial': 'ABC123'}, format='json', **self.header)
+
+        self.assertHttpStatus(response, status.HTTP_200_OK)
+        self.assertEqual(response.data['serial'], 'ABC123')
+
+
+class QuerysetOptimizerTest(APITestCase):
+    """
+    Test the automatic optimization of API querysets using the Cable and Interface endpoints.
+    """
+
+    def setUp(self):
+
+        super().setUp()
+
+        self.site = Site.objects.create(name='Site 1', slug='site-1')
+        manufacturer = Manufacturer.objects.create(name='Manufacturer 1', slug='manufacturer-1')
+        self.device_type = DeviceType.objects.create(
+            manufacturer=manufacturer, model='Device Type 1', slug='device-type-1'
+        )
+        self.device_role = DeviceRole.objects.create(name='Device Role 1', slug='device-role-1')
+        self.create_cables(1)
+
+    def create_cables(self, count):
+        for i in range(count):
+            device = Device.objects.create(
+                name='Device {}'.format(Device.objects.count() + 1), device_type=self.device_type,
+                device_role=self.device_role, site=self.site
+            )
+            interface_a = Interface.objects.create(device=device, name='eth0')
+            interface_b = Interface.objects.create(device=device, name='eth1')
+            Cable(termination_a=interface_a, termination_b=interface_b).save()
+
+    def get_query_count(self, url):
+        response = self.client.get(url, **self.header)
+        self.assertHttpStatus(response, status.HTTP_200_OK)
+        return int(response['X-Query-Count'])
+
+    def test_optimized_queryset(self):
+
+        serializer = CableSerializer(context={'request': None})
+        queryset = get_optimized_queryset(Cable.objects.all(), serializer)
+
+        self.assertIn('termination_a_type', queryset.query.select_related)
+        self.assertIn('termination_b_type', queryset.query.select_related)
+        self.assertIn('termination_a', queryset._prefetch_related_lookups)
+        self.assertIn('termination_b', queryset._prefetch_related_lookups)
+
+    @override_settings(DEBUG=True)
+    def test_cable_list_query_count(self):
+
+        url = reverse('dcim-api:cable-list')
+        query_count = self.get_query_count(url)
+
+        # Retrieving more cables (and their terminations' devices) does not require additional queries
+        self.create_cables(3)
+        self.assertEqual(self.get_query_count(url), query_count)
+
+    @override_settings(DEBUG=True)
+    def test_interface_list_query_count(self):
+
+        url = reverse('dcim-api:interface-list')
+        query_count = self.get_query_count(url)
+
+        self.create_cables(3)
+        self.assertEqual(self.get_query_count(url), query_count)
+
+    def test_query_count_header_debug_only(self):
+
+        response = self.client.get(reverse('dcim-api:cable-list'), **self.header)
+
+        self.assertHttpStatus(response, status.HTTP_200_OK)
+        self.assertFalse(response.has_header('X-Query-Count'))
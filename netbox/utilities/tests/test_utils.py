@@ -1,6 +1,18 @@
+import datetime
+import json
+from decimal import Decimal
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.serializers import serialize
 from django.test import TestCase
 
-from utilities.utils import deepmerge, dict_to_filter_params
+from dcim.models import Device, DeviceRole, DeviceType, FrontPort, Interface, Manufacturer, RearPort, Site
+from extras.constants import CF_TYPE_DATE, CF_TYPE_SELECT, CF_TYPE_TEXT
+from extras.models import ConfigContext, CustomField, CustomFieldChoice, CustomFieldValue, cache_custom_fields
+from ipam.models import IPAddress, VLAN
+from utilities.utils import (
+    apply_dict_delta, deepmerge, dict_delta, dict_to_filter_params, get_cascade_paths, serialize_object, stream_csv,
+)
 
 
 class DictToFilterParamsTest(TestCase):
@@ -122,3 +134,170 @@ class DeepMergeTest(TestCase):
             deepmerge(dict1, dict2),
             merged
         )
+
+
+class DictDeltaTest(TestCase):
+    """
+    Validate the behavior of the dict_delta() and apply_dict_delta() utilities.
+    """
+    def test_dict_delta(self):
+
+        original = {
+            'name': 'Device 1',
+            'serial': 'ABC123',
+            'status': 1,
+            'tenant': None,
+            'custom_fields': {
+                'code': 'XYZ',
+                'cost': '100',
+            },
+            'tags': ['Foo', 'Bar'],
+        }
+        new = {
+            'name': 'Device 2',
+            'status': True,
+            'tenant': None,
+            'custom_fields': {
+                'code': 'XYZ',
+                'owner': 'Ops',
+            },
+            'tags': ['Foo'],
+        }
+
+        delta = dict_delta(original, new)
+
+        self.assertEqual(sorted(delta['set']), sorted([
+            [['name'], 'Device 2'],
+            [['status'], True],
+            [['custom_fields', 'owner'], 'Ops'],
+            [['tags'], ['Foo']],
+        ]))
+        self.assertEqual(sorted(delta['unset']), [['custom_fields', 'cost'], ['serial']])
+        self.assertEqual(apply_dict_delta(original, delta), new)
+
+        # The original dictionary is left unmodified
+        self.assertEqual(original['custom_fields'], {'code': 'XYZ', 'cost': '100'})
+
+    def test_dict_delta_unchanged(self):
+
+        data = {'name': 'Device 1', 'custom_fields': {'code': 'XYZ'}}
+
+        self.assertEqual(dict_delta(data, data), {'set': [], 'unset': []})
+
+
+class SerializeObjectTest(TestCase):
+    """
+    Validate that serialize_object() represents objects as Django's JSON serializer does.
+    """
+    def setUp(self):
+
+        self.site = Site.objects.create(
+            name='Site 1', slug='site-1', asn=65001, latitude=Decimal('12.345678'), time_zone='Europe/Paris'
+        )
+        self.site.tags.add('Foo', 'Bar')
+
+        content_type = ContentType.objects.get_for_model(Site)
+        text_field = CustomField.objects.create(type=CF_TYPE_TEXT, name='code')
+        date_field = CustomField.objects.create(type=CF_TYPE_DATE, name='opened')
+        select_field = CustomField.objects.create(type=CF_TYPE_SELECT, name='tier')
+        for field in (text_field, date_field, select_field):
+            field.obj_type.set([content_type])
+        choice = CustomFieldChoice.objects.create(field=select_field, value='Gold')
+        CustomFieldValue.objects.create(field=text_field, obj=self.site, value='XYZ')
+        CustomFieldValue.objects.create(field=date_field, obj=self.site, value=datetime.date(2019, 1, 1))
+        CustomFieldValue.objects.create(field=select_field, obj=self.site, value=choice)
+
+    def assertSerializedAsDjango(self, obj):
+        data = serialize_object(obj)
+        expected = json.loads(serialize('json', [obj]))[0]['fields']
+        for key in ('custom_fields', 'tags'):
+            if key in data:
+                expected[key] = data[key]
+        self.assertEqual(data, expected)
+
+    def test_serialize_object(self):
+
+        self.assertSerializedAsDjango(self.site)
+
+        data = serialize_object(self.site, extra={'foo': 'bar'})
+        self.assertEqual(data['latitude'], '12.345678')
+        self.assertEqual(data['custom_fields'], {'code': 'XYZ', 'opened': '2019-01-01', 'tier': 'Gold'})
+        self.assertEqual(sorted(data['tags']), ['Bar', 'Foo'])
+        self.assertEqual(data['foo'], 'bar')
+
+    def test_serialize_object_many_to_many(self):
+
+        manufacturer = Manufacturer.objects.create(name='Manufacturer 1', slug='manufacturer-1')
+        device = Device.objects.create(
+            device_type=DeviceType.objects.create(manufacturer=manufacturer, model='Device Type 1', slug='device-type-1'),
+            device_role=DeviceRole.objects.create(name='Device Role 1', slug='device-role-1'),
+            site=self.site,
+            name='Device 1',
+            local_context_data={'foo': {'bar': [1, 2]}}
+        )
+        interface = Interface.objects.create(device=device, name='eth0', mac_address='00:11:22:33:44:55')
+        interface.tagged_vlans.set([VLAN.objects.create(vid=100, name='VLAN 100')])
+        config_context = ConfigContext.objects.create(name='Config Context 1', data={'ntp': ['10.0.0.1']})
+        config_context.sites.set([self.site])
+
+        for obj in (device, interface, config_context):
+            self.assertSerializedAsDjango(obj)
+
+        # Prefetched many-to-many relations are used
+        interface = Interface.objects.prefetch_related('tagged_vlans', 'tags').get(pk=interface.pk)
+        with self.assertNumQueries(0):
+            serialize_object(interface)
+
+    def test_serialize_object_queries(self):
+
+        site = Site.objects.prefetch_related('tags', 'custom_field_values').get(pk=self.site.pk)
+
+        # Once cached, the custom field definitions (and choices) are not retrieved again
+        with cache_custom_fields():
+            serialize_object(site)
+            with self.assertNumQueries(0):
+                serialize_object(site)
+
+
+class StreamCSVTest(TestCase):
+    """
+    Validate the output of stream_csv().
+    """
+    def test_stream_csv(self):
+
+        rows = [
+            ['name', 'date', 'enabled', 'comments'],
+            ['Foo', datetime.date(2019, 1, 1), True, 'First, second'],
+            ['Bar', None, False, 'Line 1\nLine 2'],
+        ]
+
+        chunks = list(stream_csv(rows, chunk_size=2))
+
+        self.assertEqual(len(chunks), 2)
+        self.assertEqual(
+            ''.join(chunks),
+            'name,date,enabled,comments\n'
+            'Foo,2019-01-01,True,"First, second"\n'
+            'Bar,,,"Line 1\nLine 2"\n'
+        )
+
+
+class GetCascadePathsTest(TestCase):
+    """
+    Validate the output of get_cascade_paths().
+    """
+    def test_get_cascade_paths(self):
+
+        paths = get_cascade_paths(Device)
+
+        self.assertIn((Interface, 'device'), paths)
+        self.assertIn((IPAddress, 'interface__device'), paths)
+        self.assertIn((FrontPort, 'rear_port__device'), paths)
+
+        # Dependent objects are listed before the objects on which they depend
+        self.assertLess(paths.index((IPAddress, 'interface__device')), paths.index((Interface, 'device')))
+        self.assertLess(paths.index((FrontPort, 'rear_port__device')), paths.index((RearPort, 'device')))
+
+        # Self-referential relations (e.g. LAG interfaces) are not followed
+        self.assertNotIn(Device, [model for model, _ in paths])
+        self.assertFalse([lookup for _, lookup in paths if lookup.startswith('lag__')])
@@ -1,43 +1,172 @@
 from collections import OrderedDict
+from functools import lru_cache
 
+import copy
+import csv
 import datetime
+import decimal
 import json
 
-from django.core.serializers import serialize
-from django.db.models import Count, OuterRef, Subquery
+from django.core.exceptions import FieldDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import CASCADE, PROTECT, Count, Field, OuterRef, ProtectedError, Subquery
+from django.utils.encoding import is_protected_type
 
 from dcim.constants import LENGTH_UNIT_CENTIMETER, LENGTH_UNIT_FOOT, LENGTH_UNIT_INCH, LENGTH_UNIT_METER
 
 
+def csv_format_value(value):
+    """
+    Return the string representation of a value for CSV output.
+    """
+    # Represent None or False with empty string
+    if value is None or value is False:
+        return ''
+
+    # Convert dates to ISO format
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+
+    if not isinstance(value, str):
+        return '{}'.format(value)
+
+    return value
+
+
 def csv_format(data):
     """
     Encapsulate any data which contains a comma within double quotes.
     """
     csv = []
     for value in data:
-
-        # Represent None or False with empty string
-        if value is None or value is False:
-            csv.append('')
-            continue
-
-        # Convert dates to ISO format
-        if isinstance(value, (datetime.date, datetime.datetime)):
-            value = value.isoformat()
-
-        # Force conversion to string first so we can check for any commas
-        if not isinstance(value, str):
-            value = '{}'.format(value)
+        value = csv_format_value(value)
 
         # Double-quote the value if it contains a comma
         if ',' in value or '\n' in value:
             csv.append('"{}"'.format(value))
         else:
-            csv.append('{}'.format(value))
+            csv.append(value)
 
     return ','.join(csv)
 
 
+class _CSVBuffer:
+    """
+    A file-like object which returns (rather than stores) whatever is written to it, allowing the output of csv.writer
+    to be consumed one row at a time.
+    """
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows, chunk_size=1000):
+    """
+    Render an iterable of rows (each a list of values) as CSV, yielding the output in chunks of rows.
+    """
+    writer = csv.writer(_CSVBuffer(), lineterminator='\n')
+    chunk = []
+    for row in rows:
+        chunk.append(writer.writerow([csv_format_value(value) for value in row]))
+        if len(chunk) >= chunk_size:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+def get_related_lookup(model, path):
+    """
+    Return the longest leading part of the given lookup path (e.g. 'rack__group__name') which follows only single-valued
+    relations (foreign keys and one-to-one relations) from the given model, for use with select_related(). Returns None
+    if the path does not begin with such a relation.
+    """
+    lookup = []
+    for name in path.split('__'):
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            break
+        # Ignore GenericForeignKeys, which cannot be followed by select_related()
+        if not field.is_relation or not (field.one_to_one or (field.many_to_one and field.concrete)):
+            break
+        lookup.append(name)
+        model = field.related_model
+    return '__'.join(lookup) or None
+
+
+def get_csv_lookups(model, headers):
+    """
+    Return the select_related() lookups for the relations from which the given CSV columns are exported, as inferred
+    from the model's field definitions. A header may name a relation (e.g. 'tenant'), a field of a related object (e.g.
+    'rack_group' or 'vlan_vid'), or a relation of a related object (e.g. 'manufacturer' for a Device's DeviceType).
+    """
+    relations = [
+        field for field in model._meta.concrete_fields if field.is_relation and field.related_model is not None
+    ]
+    lookups = set()
+    for header in headers:
+        lookup = get_related_lookup(model, header)
+        if lookup is None:
+            # <relation>_<field>
+            parts = header.split('_')
+            for i in range(1, len(parts)):
+                lookup = get_related_lookup(model, '{}__{}'.format('_'.join(parts[:i]), '_'.join(parts[i:])))
+                if lookup is not None:
+                    break
+        if lookup is None:
+            # A relation of a related object
+            for field in relations:
+                related_lookup = get_related_lookup(field.related_model, header)
+                if related_lookup is not None:
+                    lookups.add('{}__{}'.format(field.name, related_lookup))
+            continue
+        lookups.add(lookup)
+    return lookups
+
+
+def get_cascade_paths(model, _ancestors=()):
+    """
+    Return a list of (model, lookup) tuples for every model whose objects are deleted along with objects of the given
+    model by way of CASCADE relations, where the lookup relates the dependent objects back to the given model (e.g.
+    (FrontPort, 'rear_port__device') for Device). Dependents are listed before the objects on which they depend, so that
+    deleting objects in the order given never cascades to more than one level of dependents at a time.
+    """
+    _ancestors = _ancestors + (model,)
+    paths = []
+    for relation in model._meta.related_objects:
+        if relation.on_delete is not CASCADE or relation.many_to_many:
+            continue
+        # Self-referential (and circular) relations are left for Django to collect when their parent is deleted
+        if relation.related_model in _ancestors:
+            continue
+        field_name = relation.field.name
+        for related_model, lookup in get_cascade_paths(relation.related_model, _ancestors):
+            paths.append((related_model, '{}__{}'.format(lookup, field_name)))
+        paths.append((relation.related_model, field_name))
+    return paths
+
+
+def check_protected_objects(model, pk_list, cascade_paths):
+    """
+    Raise ProtectedError (as Django's deletion collector would) if any objects prevent the deletion of the given objects,
+    or of any of the dependent objects described by cascade_paths (see get_cascade_paths()), by way of PROTECT relations.
+    """
+    for deleted_model, lookup in [(model, 'pk')] + list(cascade_paths):
+        for relation in deleted_model._meta.related_objects:
+            if relation.on_delete is not PROTECT:
+                continue
+            filter_name = '{}__{}__in'.format(relation.field.name, lookup)
+            protected_objects = list(relation.related_model._base_manager.filter(**{filter_name: pk_list}))
+            if protected_objects:
+                raise ProtectedError(
+                    "Cannot delete some instances of model '{}' because they are referenced through a protected "
+                    "foreign key: '{}.{}'".format(
+                        deleted_model.__name__, relation.related_model.__name__, relation.field.name
+                    ),
+                    protected_objects
+                )
+
+
 def foreground_color(bg_color):
     """
     Return the ideal foreground color (black or white) for a given background color in hexadecimal RGB format.
@@ -89,23 +218,109 @@ def get_subquery(model, field):
     return subquery
 
 
-def serialize_object(obj, extra=None):
+# Types whose values are represented in JSON as-is
+JSON_NATIVE_TYPES = (str, int, float, bool, type(None))
+
+# Types which DjangoJSONEncoder represents as strings
+JSON_STRING_TYPES = (datetime.datetime, datetime.date, datetime.time, decimal.Decimal)
+
+json_encoder = DjangoJSONEncoder()
+
+
+class ObjectSerializer:
     """
-    Return a generic JSON representation of an object using Django's built-in serializer. (This is used for things like
-    change logging, not the REST API.) Optionally include a dictionary to supplement the object data.
+    Produces the same representation of an object as Django's built-in JSON serializer (plus any custom fields and
+    tags), but reads each field's value directly rather than encoding the object as JSON and decoding it again. The
+    fields to be serialized are determined once per model; see get_object_serializer().
     """
-    json_str = serialize('json', [obj])
-    data = json.loads(json_str)[0]['fields']
+    def __init__(self, model):
+        opts = model._meta.concrete_model._meta
+
+        # Record the attribute from which each field's value can be read directly, if the field does not customize
+        # how its value is retrieved, and whether a string value can be used as-is
+        self.fields = []
+        for field in opts.local_fields:
+            if not field.serialize:
+                continue
+            attname = field.attname if type(field).value_from_object is Field.value_from_object else None
+            str_as_is = type(field).value_to_string is Field.value_to_string
+            self.fields.append((field, attname, str_as_is))
+
+        # Many-to-many relations with a custom intermediate model are omitted, as by Django's serializer
+        self.m2m_fields = [
+            field for field in opts.local_many_to_many
+            if field.serialize and field.remote_field.through._meta.auto_created
+        ]
+
+        self.custom_fields = hasattr(model, 'get_custom_fields')
+        self.tags = hasattr(model, 'tags')
+
+    @staticmethod
+    def _serialize_value(field, obj, value):
+        if not is_protected_type(value):
+            value = field.value_to_string(obj)
+        if type(value) in JSON_NATIVE_TYPES:
+            return value
+        if isinstance(value, JSON_STRING_TYPES):
+            return json_encoder.default(value)
+        return json.loads(json.dumps(value, cls=DjangoJSONEncoder))
+
+    def serialize(self, obj):
+        data = {}
+
+        for field, attname, str_as_is in self.fields:
+            if attname is not None:
+                value = getattr(obj, attname)
+                value_type = type(value)
+                if value_type in JSON_NATIVE_TYPES and (str_as_is or value_type is not str):
+                    data[field.name] = value
+                    continue
+            else:
+                value = field.value_from_object(obj)
+            data[field.name] = self._serialize_value(field, obj, value)
+
+        prefetched = getattr(obj, '_prefetched_objects_cache', {})
+        for field in self.m2m_fields:
+            if field.name in prefetched:
+                related_objects = prefetched[field.name]
+            else:
+                related_objects = getattr(obj, field.name).only('pk')
+            pk_field = field.remote_field.model._meta.pk
+            data[field.name] = [
+                self._serialize_value(pk_field, related, related.pk) for related in related_objects
+            ]
+
+        # Include any custom fields
+        if self.custom_fields:
+            data['custom_fields'] = {
+                field.name: str(value) for field, value in obj.get_custom_fields().items()
+            }
 
-    # Include any custom fields
-    if hasattr(obj, 'get_custom_fields'):
-        data['custom_fields'] = {
-            field.name: str(value) for field, value in obj.get_custom_fields().items()
-        }
+        # Include any tags (using those prefetched, if any), sorted so that their order is consistent
+        if self.tags:
+            if 'tags' in prefetched:
+                data['tags'] = sorted(tag.name for tag in prefetched['tags'])
+            else:
+                data['tags'] = sorted(obj.tags.values_list('name', flat=True))
 
-    # Include any tags
-    if hasattr(obj, 'tags'):
-        data['tags'] = [tag.name for tag in obj.tags.all()]
+        return data
+
+
+@lru_cache(maxsize=None)
+def get_object_serializer(model):
+    """
+    Return the ObjectSerializer for the given model, creating it upon first use.
+    """
+    return ObjectSerializer(model)
+
+
+def serialize_object(obj, extra=None):
+    """
+    Return a generic JSON-compatible representation of an object, equivalent to that produced by Django's built-in JSON
+    serializer. (This is used for things like change logging, not the REST API.) Any custom fields and tags are
+    included. Optionally include a dictionary to supplement the object data.
+    """
+    data = get_object_serializer(type(obj)).serialize(obj)
 
     # Append any extra data
     if extra is not None:
@@ -159,6 +374,52 @@ def deepmerge(original, new):
     return merged
 
 
+def dict_delta(original, new):
+    """
+    Return a delta which transforms the original dictionary into the new one (see apply_dict_delta()). Nested
+    dictionaries are compared key by key; all other values are compared as a whole. Each changed value is listed under
+    `set`, and each removed key under `unset`, by its path of keys. For example:
+
+        {
+            "set": [[["name"], "Foo"], [["custom_fields", "code"], "XYZ"]],
+            "unset": [["serial"]]
+        }
+    """
+    delta = {'set': [], 'unset': []}
+
+    def _compare(original, new, path):
+        for key, val in new.items():
+            if key in original and isinstance(original[key], dict) and isinstance(val, dict):
+                _compare(original[key], val, path + [key])
+            elif key not in original or type(original[key]) is not type(val) or original[key] != val:
+                delta['set'].append([path + [key], val])
+        for key in original:
+            if key not in new:
+                delta['unset'].append(path + [key])
+
+    _compare(original, new, [])
+
+    return delta
+
+
+def apply_dict_delta(original, delta):
+    """
+    Apply a delta returned by dict_delta() to the original dictionary and return the result as a new dict.
+    """
+    data = copy.deepcopy(original)
+    for path, val in delta['set']:
+        target = data
+        for key in path[:-1]:
+            target = target.setdefault(key, {})
+        target[path[-1]] = val
+    for path in delta['unset']:
+        target = data
+        for key in path[:-1]:
+            target = target.get(key, {})
+        target.pop(path[-1], None)
+    return data
+
+
 def to_meters(length, unit):
     """
     Convert the given length to meters.
@@ -1,4 +1,5 @@
 import sys
+from contextlib import contextmanager
 from copy import deepcopy
 
 from django.conf import settings
@@ -6,14 +7,16 @@ from django.contrib import messages
 from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ValidationError
 from django.db import transaction, IntegrityError
-from django.db.models import Count, ProtectedError
+from django.db.models import Count, Model, Prefetch, ProtectedError
+from django.db.models.signals import post_save
 from django.db.models.query import QuerySet
-from django.forms import CharField, Form, ModelMultipleChoiceField, MultipleHiddenInput, Textarea
-from django.http import HttpResponse, HttpResponseServerError
+from django.forms import CharField, Form, ModelChoiceField, ModelMultipleChoiceField, MultipleHiddenInput, Textarea
+from django.http import HttpResponse, HttpResponseServerError, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.template import loader
 from django.template.exceptions import TemplateDoesNotExist
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.html import escape
 from django.utils.http import is_safe_url
 from django.utils.safestring import mark_safe
@@ -22,13 +25,25 @@ from django.views.defaults import ERROR_500_TEMPLATE_NAME
 from django.views.generic import View
 from django_tables2 import RequestConfig
 
+from extras.jobs import enqueue_delete, enqueue_import
 from extras.models import CustomField, CustomFieldValue, ExportTemplate
 from extras.querysets import CustomFieldQueryset
-from utilities.forms import BootstrapMixin, CSVDataField
-from utilities.utils import csv_format
+from extras.signals import flush_changelog, purge_changelog
+from utilities.forms import BootstrapMixin, CSVDataField, PreloadedModelChoiceField, preload_model_choices
+from utilities.utils import check_protected_objects, get_cascade_paths, get_csv_lookups, get_related_lookup, stream_csv
 from .error_handlers import handle_protectederror
 from .forms import ConfirmationForm
-from .paginator import EnhancedPaginator
+from .paginator import COUNT_ESTIMATE, COUNT_NONE, EnhancedPaginator, get_count, get_count_mode
+
+
+# The number of objects retrieved per database round trip (and CSV rows rendered per chunk) when exporting
+CSV_EXPORT_CHUNK_SIZE = 1000
+
+# The number of objects inserted per query when importing objects in bulk
+BULK_IMPORT_CHUNK_SIZE = 500
+
+# The maximum number of objects (of any one type) deleted per transaction when deleting objects in bulk
+BULK_DELETE_CHUNK_SIZE = 500
 
 
 class GetReturnURLMixin(object):
@@ -73,22 +88,46 @@ class ObjectListView(View):
     table = None
     template_name = None
 
-    def queryset_to_csv(self):
+    def get_export_lookups(self, queryset):
         """
-        Export the queryset of objects as comma-separated value (CSV), using the model's to_csv() method.
+        Return the select_related() lookups for the related objects which may be accessed when exporting the objects in
+        the queryset: every foreign key and one-to-one relation of the model, along with the single-valued relations
+        followed by the queryset's prefetch_related() lookups, by the columns of the table, and by the model's CSV
+        headers.
         """
-        csv_data = []
-
-        # Start with the column headers
-        headers = ','.join(self.queryset.model.csv_headers)
-        csv_data.append(headers)
+        model = queryset.model
+        paths = [field.name for field in model._meta.get_fields() if field.is_relation]
+        paths += [getattr(lookup, 'prefetch_through', lookup) for lookup in queryset._prefetch_related_lookups]
+        if self.table is not None:
+            paths += [
+                str(column.accessor or name).replace('.', '__') for name, column in self.table.base_columns.items()
+            ]
+
+        lookups = {get_related_lookup(model, path) for path in paths}
+        lookups.update(get_csv_lookups(model, getattr(model, 'csv_headers', [])))
+        lookups.discard(None)
+        return lookups
+
+    def iterate_queryset(self, queryset, func):
+        """
+        Yield func(obj) for each object in the queryset. Objects are retrieved in chunks using a server-side cursor so
+        that large querysets need not be held in memory. Because prefetch_related() is not applied when iterating in
+        this manner, related objects are retrieved using select_related() instead (see get_export_lookups()).
+        """
+        lookups = self.get_export_lookups(queryset)
+        if lookups:
+            queryset = queryset.select_related(*lookups)
 
-        # Iterate through the queryset appending each object
-        for obj in self.queryset:
-            data = csv_format(obj.to_csv())
-            csv_data.append(data)
+        for obj in queryset.iterator(chunk_size=CSV_EXPORT_CHUNK_SIZE):
+            yield func(obj)
 
-        return csv_data
+    def queryset_to_csv(self):
+        """
+        Export the queryset of objects as comma-separated value (CSV), using the model's to_csv() method. Returns an
+        iterable of rows (each a list of values), beginning with the column headers.
+        """
+        yield self.queryset.model.csv_headers
+        yield from self.iterate_queryset(self.queryset, lambda obj: obj.to_csv())
 
     def get(self, request):
 
@@ -108,7 +147,7 @@ class ObjectListView(View):
         # Check for export template rendering
         if request.GET.get('export'):
             et = get_object_or_404(ExportTemplate, content_type=content_type, name=request.GET.get('export'))
-            queryset = CustomFieldQueryset(self.queryset, custom_fields) if custom_fields else self.queryset
+            queryset = CustomFieldQueryset(self.queryset, custom_fields)
             try:
                 return et.render_to_response(queryset)
             except Exception as e:
@@ -121,9 +160,8 @@ class ObjectListView(View):
 
         # Fall back to built-in CSV formatting if export requested but no template specified
         elif 'export' in request.GET and hasattr(model, 'to_csv'):
-            data = self.queryset_to_csv()
-            response = HttpResponse(
-                '\n'.join(data),
+            response = StreamingHttpResponse(
+                stream_csv(self.queryset_to_csv(), chunk_size=CSV_EXPORT_CHUNK_SIZE),
                 content_type='text/csv'
             )
             filename = 'netbox_{}.csv'.format(self.queryset.model._meta.verbose_name_plural)
@@ -148,10 +186,20 @@ class ObjectListView(View):
         else:
             tags = None
 
+        # Count the objects, approximately if there are many of them. (A count is always needed to paginate the table.)
+        count, count_approximate = None, False
+        if isinstance(self.queryset, QuerySet):
+            count_mode = get_count_mode(request)
+            if count_mode == COUNT_NONE:
+                count_mode = COUNT_ESTIMATE
+            count, count_approximate = get_count(self.queryset, count_mode)
+
         # Apply the request context
         paginate = {
             'paginator_class': EnhancedPaginator,
-            'per_page': request.GET.get('per_page', settings.PAGINATE_COUNT)
+            'per_page': request.GET.get('per_page', settings.PAGINATE_COUNT),
+            'count': count,
+            'count_approximate': count_approximate,
         }
         RequestConfig(request, paginate).configure(table)
 
@@ -402,11 +450,13 @@ class BulkImportView(GetReturnURLMixin, View):
     table: The django-tables2 Table used to render the list of imported objects
     template_name: The name of the template
     widget_attrs: A dict of attributes to apply to the import widget (e.g. to require a session key)
+    background_import: Whether the import may be processed as a background job (see BACKGROUND_JOBS_ENABLED)
     """
     model_form = None
     table = None
     template_name = 'utilities/obj_import.html'
     widget_attrs = {}
+    background_import = True
 
     def _import_form(self, *args, **kwargs):
 
@@ -424,6 +474,161 @@ class BulkImportView(GetReturnURLMixin, View):
         """
         return obj_form.save()
 
+    def _can_bulk_create(self):
+        """
+        Return True if imported objects may be inserted using bulk_create(), which bypasses both the model's save()
+        method and _save_obj(). By default this is the case only if neither has been customized, and the model does not
+        customize clean(): since all records are validated before any is saved, a clean() method which checks for
+        conflicts with other objects would not see those of earlier records. A view may override this if it replicates
+        any such customization in _post_bulk_create() and _clean_batch_obj().
+        """
+        model = self.model_form._meta.model
+        return (
+            type(self)._save_obj is BulkImportView._save_obj and model.save is Model.save and model.clean is Model.clean
+        )
+
+    def _clean_batch_obj(self, obj, batch_state):
+        """
+        Provide a hook to validate a new (unsaved) object against those of earlier records being created using
+        bulk_create(), raising ValidationError if they conflict. batch_state is a dict which persists for the duration
+        of the import, in which the objects validated so far may be recorded.
+        """
+        pass
+
+    def _post_bulk_create(self, objs):
+        """
+        Provide a hook to act upon a batch of objects immediately after they have been created using bulk_create().
+        """
+        pass
+
+    def _bind_form(self, data, lookups):
+        """
+        Bind a record to a new model form instance, substituting any fields whose objects have been preloaded.
+        """
+        obj_form = self.model_form(data)
+        for name, objects in lookups.items():
+            obj_form.fields[name] = PreloadedModelChoiceField(obj_form.fields[name], objects)
+        return obj_form
+
+    def _import_objects(self, form, records, lookups, progress=None):
+        """
+        Validate and save each record in turn, stopping at the first invalid record.
+        """
+        new_objs = []
+        for row, data in enumerate(records, start=1):
+            obj_form = self._bind_form(data, lookups)
+            if obj_form.is_valid():
+                obj = self._save_obj(obj_form)
+                new_objs.append(obj)
+            else:
+                for field, err in obj_form.errors.items():
+                    form.add_error('csv', "Row {} {}: {}".format(row, field, err[0]))
+                raise ValidationError("")
+            if progress is not None:
+                progress(row, len(records))
+        return new_objs
+
+    def _bulk_import_objects(self, form, records, lookups, progress=None):
+        """
+        Validate all records, then insert the resulting objects using bulk_create() in chunks. Errors are reported for
+        every invalid record. A post_save signal is sent for each new object so that changes are logged as usual.
+        """
+        model = self.model_form._meta.model
+
+        obj_forms = []
+        batch_state = {}
+        for row, data in enumerate(records, start=1):
+            obj_form = self._bind_form(data, lookups)
+            if obj_form.is_valid():
+                try:
+                    self._clean_batch_obj(obj_form.instance, batch_state)
+                except ValidationError as e:
+                    obj_form.add_error(None, e)
+            if obj_form.errors:
+                for field, err in obj_form.errors.items():
+                    form.add_error('csv', "Row {} {}: {}".format(row, field, err[0]))
+            obj_forms.append(obj_form)
+            if progress is not None:
+                progress(row, len(records))
+        if not form.is_valid():
+            raise ValidationError("")
+
+        new_objs = []
+        for offset in range(0, len(obj_forms), BULK_IMPORT_CHUNK_SIZE):
+            chunk = obj_forms[offset:offset + BULK_IMPORT_CHUNK_SIZE]
+            objs = [obj_form.save(commit=False) for obj_form in chunk]
+            try:
+                with transaction.atomic():
+                    model.objects.bulk_create(objs)
+            except IntegrityError:
+                # Identify the offending record(s), e.g. duplicates of one another
+                for row, obj in enumerate(objs, start=offset + 1):
+                    try:
+                        with transaction.atomic():
+                            model.objects.bulk_create([obj])
+                    except IntegrityError as e:
+                        form.add_error('csv', "Row {}: {}".format(row, str(e).strip()))
+                raise ValidationError("")
+
+            self._post_bulk_create(objs)
+            for obj_form, obj in zip(chunk, objs):
+                obj_form.save_m2m()
+                post_save.send(sender=model, instance=obj, created=True, update_fields=None, raw=False, using=obj._state.db)
+            new_objs.extend(objs)
+
+        return new_objs
+
+    def _import(self, form, progress=None):
+        """
+        Create objects from the records of a valid import form within a single transaction and return them. If any record
+        is invalid, its errors are added to the form, all changes are reverted, and ValidationError is raised.
+
+        progress: An optional callable to which the number of records processed (and the total) is reported
+        """
+        records = form.cleaned_data['csv']
+        model = self.model_form._meta.model
+
+        # Retrieve all objects referenced by name in advance. Objects of the type being imported may be referenced by
+        # earlier records (e.g. a parent Region), in which case each record must be saved before the next is validated.
+        model_form = self.model_form()
+        lookups = preload_model_choices(model_form, records)
+        self_referencing = any(
+            isinstance(field, ModelChoiceField) and field.queryset.model is model
+            for field in model_form.fields.values()
+        )
+
+        try:
+            with transaction.atomic():
+                if self._can_bulk_create() and not self_referencing:
+                    return self._bulk_import_objects(form, records, lookups, progress)
+                return self._import_objects(form, records, lookups, progress)
+        except ValidationError:
+            # Discard the pending changelog entries of any objects which have been rolled back
+            purge_changelog.send(model)
+            raise
+
+    def import_csv(self, csv_data, progress=None):
+        """
+        Import objects from CSV data outside of a request (i.e. as a background job). Returns a dictionary containing
+        the PKs of the new objects and a list of any errors. If any errors are reported, no objects have been created.
+        """
+        form = self._import_form({'csv': csv_data})
+
+        try:
+            if form.is_valid():
+                new_objs = self._import(form, progress)
+                return {
+                    'object_ids': [obj.pk for obj in new_objs],
+                    'errors': [],
+                }
+        except ValidationError:
+            pass
+
+        return {
+            'object_ids': [],
+            'errors': list(form.errors.get('csv', [])),
+        }
+
     def get(self, request):
 
         return render(request, self.template_name, {
@@ -435,6 +640,12 @@ class BulkImportView(GetReturnURLMixin, View):
 
     def post(self, request):
 
+        # Hand off the import to a background job, which will parse and validate the CSV data
+        if settings.BACKGROUND_JOBS_ENABLED and self.background_import:
+            job_id = enqueue_import(self, request.POST.get('csv', ''), request)
+            messages.info(request, "Import job queued")
+            return redirect('extras:job', job_id=job_id)
+
         new_objs = []
         form = self._import_form(request.POST)
 
@@ -442,17 +653,7 @@ class BulkImportView(GetReturnURLMixin, View):
 
             try:
 
-                # Iterate through CSV data and bind each row to a new model form instance.
-                with transaction.atomic():
-                    for row, data in enumerate(form.cleaned_data['csv'], start=1):
-                        obj_form = self.model_form(data)
-                        if obj_form.is_valid():
-                            obj = self._save_obj(obj_form)
-                            new_objs.append(obj)
-                        else:
-                            for field, err in obj_form.errors.items():
-                                form.add_error('csv', "Row {} {}: {}".format(row, field, err[0]))
-                            raise ValidationError("")
+                new_objs = self._import(form)
 
                 # Compile a table containing the imported objects
                 obj_table = self.table(new_objs)
@@ -495,6 +696,207 @@ class BulkEditView(GetReturnURLMixin, View):
     form = None
     template_name = 'utilities/obj_bulk_edit.html'
 
+    def _can_bulk_update(self):
+        """
+        Return True if objects may be updated in bulk, bypassing the model's save() method. By default this is the case
+        only if save() has not been customized. A view may override this if it replicates any such customization in
+        _post_bulk_update().
+        """
+        return self.queryset.model.save is Model.save
+
+    def _post_bulk_update(self, queryset):
+        """
+        Provide a hook to act upon the objects in a queryset immediately after they have been updated in bulk.
+        """
+        pass
+
+    def _check_duplicates(self, objs, unique_sets):
+        """
+        Check that no two of the given (modified) objects share the same values for any of the given sets of unique
+        fields. (Each object's validate_unique() compares it only against the objects as they are in the database.)
+        """
+        model = self.queryset.model
+        for fields in unique_sets:
+            attnames = [model._meta.get_field(name).attname for name in fields]
+            seen = {}
+            for obj in objs:
+                values = tuple(getattr(obj, attname) for attname in attnames)
+                if None in values:
+                    continue
+                if values in seen:
+                    raise ValidationError("{} would duplicate {} ({})".format(
+                        obj, seen[values], ', '.join(model._meta.get_field(name).verbose_name for name in fields)
+                    ))
+                seen[values] = obj
+
+    def _update_objects(self, form, pk_list, standard_fields, custom_fields, nullified_fields):
+        """
+        Validate and save each object in turn. Returns the number of objects updated.
+        """
+        model = self.queryset.model
+
+        updated_count = 0
+        for obj in model.objects.filter(pk__in=pk_list):
+
+            # Update standard fields. If a field is listed in _nullify, delete its value.
+            for name in standard_fields:
+                if name in form.nullable_fields and name in nullified_fields and isinstance(form.cleaned_data[name], QuerySet):
+                    getattr(obj, name).set([])
+                elif name in form.nullable_fields and name in nullified_fields:
+                    setattr(obj, name, '' if isinstance(form.fields[name], CharField) else None)
+                elif isinstance(form.cleaned_data[name], QuerySet) and form.cleaned_data[name]:
+                    getattr(obj, name).set(form.cleaned_data[name])
+                elif form.cleaned_data[name] not in (None, '') and not isinstance(form.cleaned_data[name], QuerySet):
+                    setattr(obj, name, form.cleaned_data[name])
+            try:
+                obj.full_clean()
+            except ValidationError as e:
+                messages.error(self.request, "{} failed validation: {}".format(obj, e))
+                raise
+            obj.save()
+
+            # Update custom fields
+            obj_type = ContentType.objects.get_for_model(model)
+            for name in custom_fields:
+                field = form.fields[name].model
+                if name in form.nullable_fields and name in nullified_fields:
+                    CustomFieldValue.objects.filter(
+                        field=field, obj_type=obj_type, obj_id=obj.pk
+                    ).delete()
+                elif form.cleaned_data[name] not in [None, '']:
+                    try:
+                        cfv = CustomFieldValue.objects.get(
+                            field=field, obj_type=obj_type, obj_id=obj.pk
+                        )
+                    except CustomFieldValue.DoesNotExist:
+                        cfv = CustomFieldValue(
+                            field=field, obj_type=obj_type, obj_id=obj.pk
+                        )
+                    cfv.value = form.cleaned_data[name]
+                    cfv.save()
+
+            # Add/remove tags
+            if form.cleaned_data.get('add_tags', None):
+                obj.tags.add(*form.cleaned_data['add_tags'])
+            if form.cleaned_data.get('remove_tags', None):
+                obj.tags.remove(*form.cleaned_data['remove_tags'])
+
+            updated_count += 1
+
+        return updated_count
+
+    def _bulk_update_objects(self, form, pk_list, standard_fields, custom_fields, nullified_fields):
+        """
+        Apply the same changes to all objects using a single UPDATE query. The new field values are validated only once,
+        although the model's clean() method (and any uniqueness checks) are still applied to each object. Custom field
+        values and tags are written using bulk queries. Finally, a post_save signal is sent for each object so that
+        changes are logged as usual. Returns the number of objects updated.
+        """
+        model = self.queryset.model
+        queryset = model.objects.filter(pk__in=pk_list)
+        obj_type = ContentType.objects.get_for_model(model)
+
+        # Determine the changes to standard fields. If a field is listed in _nullify, delete its value.
+        model_fields = [field.name for field in model._meta.concrete_fields]
+        changes = {}
+        for name in standard_fields:
+            if name not in model_fields:
+                continue
+            if name in form.nullable_fields and name in nullified_fields:
+                changes[name] = '' if isinstance(form.fields[name], CharField) else None
+            elif form.cleaned_data[name] not in (None, ''):
+                changes[name] = form.cleaned_data[name]
+
+        if changes:
+            objs = list(queryset)
+            unchanged_fields = [name for name in model_fields if name not in changes]
+
+            # Identify the unique constraints which include a changed field. Django skips any uniqueness check which
+            # includes an excluded field, so only those fields which appear in none of these constraints are excluded.
+            unique_sets = [(field.name,) for field in model._meta.concrete_fields if field.unique]
+            unique_sets += [tuple(unique_together) for unique_together in model._meta.unique_together]
+            unique_sets = [fields for fields in unique_sets if not set(fields).isdisjoint(changes)]
+            unique_fields = {name for fields in unique_sets for name in fields}
+            unique_exclude = [name for name in model_fields if name not in unique_fields]
+
+            for obj in objs:
+                for name, value in changes.items():
+                    setattr(obj, name, value)
+            try:
+                # The new values are identical for every object, so they need be validated only once
+                if objs:
+                    obj = objs[0]
+                    obj.clean_fields(exclude=unchanged_fields)
+                for obj in objs:
+                    obj.clean()
+                    if unique_sets:
+                        obj.validate_unique(exclude=unique_exclude)
+                self._check_duplicates(objs, unique_sets)
+            except ValidationError as e:
+                messages.error(self.request, "{} failed validation: {}".format(obj, e))
+                raise
+
+            # Update the modification time of each object, as save() would
+            for field in model._meta.concrete_fields:
+                if getattr(field, 'auto_now', False):
+                    changes[field.name] = timezone.now()
+            queryset.update(**changes)
+            pks = [obj.pk for obj in objs]
+        else:
+            pks = list(queryset.values_list('pk', flat=True))
+
+        # Update custom fields
+        for name in custom_fields:
+            field = form.fields[name].model
+            values = CustomFieldValue.objects.filter(field=field, obj_type=obj_type, obj_id__in=pks)
+            if name in form.nullable_fields and name in nullified_fields:
+                values.delete()
+            elif form.cleaned_data[name] not in [None, '']:
+                cfv = CustomFieldValue(field=field)
+                cfv.value = form.cleaned_data[name]
+                existing = set(values.values_list('obj_id', flat=True))
+                values.update(serialized_value=cfv.serialized_value)
+                CustomFieldValue.objects.bulk_create([
+                    CustomFieldValue(field=field, obj_type=obj_type, obj_id=pk, serialized_value=cfv.serialized_value)
+                    for pk in pks if pk not in existing
+                ])
+
+        # Add/remove tags
+        if form.cleaned_data.get('add_tags', None) or form.cleaned_data.get('remove_tags', None):
+            tagged_items = model.tags.through.objects.filter(content_type=obj_type, object_id__in=pks)
+            if form.cleaned_data.get('add_tags', None):
+                tag_model = model.tags.through.tag_model()
+                tags = list(tag_model.objects.filter(name__in=form.cleaned_data['add_tags']))
+                tags += [
+                    tag_model.objects.create(name=name)
+                    for name in set(form.cleaned_data['add_tags']) - {tag.name for tag in tags}
+                ]
+                existing = set(tagged_items.filter(tag__in=tags).values_list('object_id', 'tag_id'))
+                model.tags.through.objects.bulk_create([
+                    model.tags.through(tag=tag, content_type=obj_type, object_id=pk)
+                    for pk in pks for tag in tags if (pk, tag.pk) not in existing
+                ])
+            if form.cleaned_data.get('remove_tags', None):
+                tagged_items.filter(tag__name__in=form.cleaned_data['remove_tags']).delete()
+
+        self._post_bulk_update(queryset)
+
+        # Retrieve the updated objects (along with any tags and custom field values needed to serialize them) and send
+        # a post_save signal for each
+        prefetch = []
+        if hasattr(model, 'tags'):
+            prefetch.append('tags')
+        if hasattr(model, 'custom_field_values'):
+            prefetch.append(
+                Prefetch('custom_field_values', queryset=CustomFieldValue.objects.select_related('field'))
+            )
+        updated_count = 0
+        for obj in self.queryset.filter(pk__in=pks).prefetch_related(*prefetch):
+            post_save.send(sender=model, instance=obj, created=False, update_fields=None, raw=False, using=obj._state.db)
+            updated_count += 1
+
+        return updated_count
+
     def get(self, request):
         return redirect(self.get_return_url(request))
 
@@ -522,53 +924,24 @@ class BulkEditView(GetReturnURLMixin, View):
                 standard_fields = [field for field in form.fields if field not in custom_fields and field != 'pk']
                 nullified_fields = request.POST.getlist('_nullify')
 
+                # Apply the changes in bulk unless the model's save() method must be called, or a many-to-many
+                # relationship is being modified
+                bulk_update = self._can_bulk_update() and not any(
+                    isinstance(form.cleaned_data[name], QuerySet) and (form.cleaned_data[name] or name in nullified_fields)
+                    for name in standard_fields
+                )
+
                 try:
 
                     with transaction.atomic():
-
-                        updated_count = 0
-                        for obj in model.objects.filter(pk__in=pk_list):
-
-                            # Update standard fields. If a field is listed in _nullify, delete its value.
-                            for name in standard_fields:
-                                if name in form.nullable_fields and name in nullified_fields and isinstance(form.cleaned_data[name], QuerySet):
-                                    getattr(obj, name).set([])
-                                elif name in form.nullable_fields and name in nullified_fields:
-                                    setattr(obj, name, '' if isinstance(form.fields[name], CharField) else None)
-                                elif isinstance(form.cleaned_data[name], QuerySet) and form.cleaned_data[name]:
-                                    getattr(obj, name).set(form.cleaned_data[name])
-                                elif form.cleaned_data[name] not in (None, '') and not isinstance(form.cleaned_data[name], QuerySet):
-                                    setattr(obj, name, form.cleaned_data[name])
-                            obj.full_clean()
-                            obj.save()
-
-                            # Update custom fields
-                            obj_type = ContentType.objects.get_for_model(model)
-                            for name in custom_fields:
-                                field = form.fields[name].model
-                                if name in form.nullable_fields and name in nullified_fields:
-                                    CustomFieldValue.objects.filter(
-                                        field=field, obj_type=obj_type, obj_id=obj.pk
-                                    ).delete()
-                                elif form.cleaned_data[name] not in [None, '']:
-                                    try:
-                                        cfv = CustomFieldValue.objects.get(
-                                            field=field, obj_type=obj_type, obj_id=obj.pk
-                                        )
-                                    except CustomFieldValue.DoesNotExist:
-                                        cfv = CustomFieldValue(
-                                            field=field, obj_type=obj_type, obj_id=obj.pk
-                                        )
-                                    cfv.value = form.cleaned_data[name]
-                                    cfv.save()
-
-                            # Add/remove tags
-                            if form.cleaned_data.get('add_tags', None):
-                                obj.tags.add(*form.cleaned_data['add_tags'])
-                            if form.cleaned_data.get('remove_tags', None):
-                                obj.tags.remove(*form.cleaned_data['remove_tags'])
-
-                            updated_count += 1
+                        if bulk_update:
+                            updated_count = self._bulk_update_objects(
+                                form, pk_list, standard_fields, custom_fields, nullified_fields
+                            )
+                        else:
+                            updated_count = self._update_objects(
+                                form, pk_list, standard_fields, custom_fields, nullified_fields
+                            )
 
                     if updated_count:
                         msg = 'Updated {} {}'.format(updated_count, model._meta.verbose_name_plural)
@@ -576,8 +949,13 @@ class BulkEditView(GetReturnURLMixin, View):
 
                     return redirect(self.get_return_url(request))
 
-                except ValidationError as e:
-                    messages.error(self.request, "{} failed validation: {}".format(obj, e))
+                except ValidationError:
+                    pass
+
+                except IntegrityError as e:
+                    form.add_error(None, "Unable to update {}: {}".format(
+                        model._meta.verbose_name_plural, str(e).strip()
+                    ))
 
         else:
             initial_data = request.POST.copy()
@@ -619,6 +997,83 @@ class BulkDeleteView(GetReturnURLMixin, View):
     def get(self, request):
         return redirect(self.get_return_url(request))
 
+    @contextmanager
+    def _delete_batch(self):
+        """
+        Provide a hook to wrap the deletion of each batch of objects (including any dependent objects), within the
+        batch's transaction. For example, a view may defer work triggered by each deletion until the batch is complete.
+        """
+        yield
+
+    def _delete_objects(self, pk_list, progress=None):
+        """
+        Delete the objects with the given PKs in batches of BULK_DELETE_CHUNK_SIZE. The objects which depend on each
+        batch (by way of CASCADE relations) are deleted first, in dependency order and likewise in bounded batches, so
+        that no single transaction deletes (or locks) more than one batch of objects. Returns the number of objects
+        deleted.
+
+        ProtectedError is raised before any objects are deleted if a protected relation would prevent the deletion.
+        Otherwise, each batch is committed (and its changes logged) as soon as it has been deleted: should the deletion
+        be interrupted, it may be resumed simply by deleting the same objects again.
+
+        :param progress: An optional callable, passed the number of objects processed and the total after each batch
+        """
+        model = self.queryset.model
+        pk_list = list(pk_list)
+        cascade_paths = get_cascade_paths(model)
+        check_protected_objects(model, pk_list, cascade_paths)
+
+        deleted_count = 0
+        for i in range(0, len(pk_list), BULK_DELETE_CHUNK_SIZE):
+            chunk = pk_list[i:i + BULK_DELETE_CHUNK_SIZE]
+
+            # Delete dependent objects, starting with those furthest removed from the objects being deleted
+            for related_model, lookup in cascade_paths:
+                dependents = related_model._base_manager.filter(
+                    **{'{}__in'.format(lookup): chunk}
+                ).order_by('pk').values_list('pk', flat=True)
+                while True:
+                    with transaction.atomic(), self._delete_batch():
+                        batch = list(dependents[:BULK_DELETE_CHUNK_SIZE])
+                        if batch:
+                            related_model._base_manager.filter(pk__in=batch).delete()
+                    if not batch:
+                        break
+                    flush_changelog.send(model)
+
+            with transaction.atomic(), self._delete_batch():
+                deleted_count += model.objects.filter(pk__in=chunk).delete()[1].get(model._meta.label, 0)
+            flush_changelog.send(model)
+
+            if progress is not None:
+                progress(i + len(chunk), len(pk_list))
+
+        return deleted_count
+
+    def delete_objects(self, pk_list, progress=None):
+        """
+        Delete the objects with the given PKs outside of a request (i.e. as a background job). Returns a dictionary
+        containing the number of objects deleted and a list of any errors.
+        """
+        model = self.queryset.model
+
+        try:
+            return {
+                'count': self._delete_objects(pk_list, progress),
+                'errors': [],
+            }
+        except ProtectedError as e:
+            return {
+                'count': 0,
+                'errors': [
+                    "Unable to delete the requested {}. The following dependent {} were found: {}".format(
+                        model._meta.verbose_name_plural,
+                        e.protected_objects[0]._meta.verbose_name_plural,
+                        ', '.join(str(obj) for obj in e.protected_objects)
+                    )
+                ],
+            }
+
     def post(self, request, **kwargs):
 
         model = self.queryset.model
@@ -644,12 +1099,18 @@ class BulkDeleteView(GetReturnURLMixin, View):
             form = form_cls(request.POST)
             if form.is_valid():
 
+                # Hand off the deletion of more than one batch of objects to a background job
+                pk_list = list(pk_list)
+                if settings.BACKGROUND_JOBS_ENABLED and len(pk_list) > BULK_DELETE_CHUNK_SIZE:
+                    job_id = enqueue_delete(self, pk_list, request)
+                    messages.info(request, "Delete job queued")
+                    return redirect('extras:job', job_id=job_id)
+
                 # Delete objects
-                queryset = model.objects.filter(pk__in=pk_list)
                 try:
-                    deleted_count = queryset.delete()[1][model._meta.label]
+                    deleted_count = self._delete_objects(pk_list)
                 except ProtectedError as e:
-                    handle_protectederror(list(queryset), request, e)
+                    handle_protectederror(list(model.objects.filter(pk__in=pk_list)), request, e)
                     return redirect(self.get_return_url(request))
 
                 msg = 'Deleted {} {}'.format(deleted_count, model._meta.verbose_name_plural)
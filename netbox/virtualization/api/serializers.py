@@ -66,6 +66,9 @@ class VirtualMachineSerializer(TaggitSerializer, CustomFieldModelSerializer):
     primary_ip4 = NestedIPAddressSerializer(required=False, allow_null=True)
     primary_ip6 = NestedIPAddressSerializer(required=False, allow_null=True)
     tags = TagListSerializerField(required=False)
+    field_sources = {
+        'primary_ip': ['primary_ip4', 'primary_ip6'],
+    }
 
     class Meta:
         model = VirtualMachine
@@ -306,6 +306,10 @@ class VirtualMachineBulkImportView(PermissionRequiredMixin, BulkImportView):
     table = tables.VirtualMachineTable
     default_return_url = 'virtualization:virtualmachine_list'
 
+    def _can_bulk_create(self):
+        # VirtualMachine.clean() validates only the primary IPs assigned to the VM's own interfaces
+        return True
+
 
 class VirtualMachineBulkEditView(PermissionRequiredMixin, BulkEditView):
     permission_required = 'virtualization.change_virtualmachine'
@@ -352,11 +356,18 @@ class InterfaceDeleteView(PermissionRequiredMixin, ObjectDeleteView):
 
 class InterfaceBulkEditView(PermissionRequiredMixin, BulkEditView):
     permission_required = 'dcim.change_interface'
-    queryset = Interface.objects.all()
+    queryset = Interface.objects.select_related('virtual_machine')
     parent_model = VirtualMachine
     table = tables.InterfaceTable
     form = forms.InterfaceBulkEditForm
 
+    def _can_bulk_update(self):
+        # Interface.save() enforces VLAN assignment rules, which are applied in _post_bulk_update()
+        return True
+
+    def _post_bulk_update(self, queryset):
+        Interface.update_vlan_assignments(queryset)
+
 
 class InterfaceBulkDeleteView(PermissionRequiredMixin, BulkDeleteView):
     permission_required = 'dcim.delete_interface'